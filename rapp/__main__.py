@@ -1,6 +1,7 @@
 from rapp.pipeline import Pipeline, train_models, evaluate_fairness
 from rapp.pipeline import evaluate_performance, calculate_statistics
 from rapp.parser import RappConfigParser
+from rapp import data
 
 from rapp.report import save_report
 
@@ -11,6 +12,11 @@ if __name__ == "__main__":
     parser = RappConfigParser()
     cf = parser.parse_args(sys.argv[1:])
 
+    telemetry = None
+    if cf.telemetry == 'True':
+        telemetry = data.enable_telemetry(
+            slow_threshold=cf.slow_query_threshold, log_path=cf.query_log)
+
     pl = Pipeline(cf)
 
     train_models(pl, cross_validation=True)
@@ -19,3 +25,6 @@ if __name__ == "__main__":
     calculate_statistics(pl)
 
     save_report(pl, cf.report_path)
+
+    if telemetry is not None:
+        print(telemetry.summary().to_string())
@@ -2,31 +2,1456 @@
 Unified API for accessing the database and loading SQL queries.
 """
 
-import pandas as pd
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import queue
+import re
 import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger('rapp.data')
 
 db_conn = None
 
 
-def connect(db_path):
-    "Connect to the specified database. Returns the connection."
+def connect(db_path, **kwargs):
+    """
+    Connect to the specified database. Returns the connection.
+    Keyword arguments are passed on to `sqlite3.connect`.
+    """
     global db_conn
-    db_conn = sqlite3.connect(db_path)
+    db_conn = sqlite3.connect(db_path, **kwargs)
     return db_conn
 
 
-def query_sql(sql_query, connection=None):
+class ConnectionPool:
+    """
+    Bounded pool of read-only SQLite connections, keyed by database path.
+
+    Connections are opened via a `file:...?mode=ro` URI, so pooled
+    connections can never alter the database.
+    Within one thread, nested requests for the same database reuse the
+    connection the thread already holds, while different threads are
+    handed different connections.
+    At most `max_connections` connections are opened per database;
+    further requests block until a connection is released.
+
+    Attributes
+    ----------
+    max_connections : int
+        Maximum number of connections per database file.
+
+    timeout : float or None
+        Seconds to wait for a free connection before raising `queue.Empty`.
+        Waits indefinitely if None.
+
+    immutable : bool
+        Open the database with the `immutable` flag, which skips all file
+        locking. Only safe if the file is not modified while in use.
+    """
+
+    def __init__(self, max_connections=4, timeout=None, immutable=False):
+        if max_connections < 1:
+            raise ValueError("A connection pool needs at least one connection")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.immutable = immutable
+
+        self._lock = threading.Lock()
+        self._idle = {}  # path -> queue.LifoQueue of idle connections
+        self._opened = {}  # path -> number of opened connections
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self, db_path):
+        """
+        Context manager handing out a read-only connection to `db_path`.
+
+        Parameters
+        ----------
+        db_path : str, pathlike
+            Path to an existing SQLite database file.
+
+        Yields
+        ------
+        sqlite3.Connection
+        """
+        key = _pool_key(db_path)
+        held = self._held()
+        if key in held:
+            # Re-entrant use within the same thread.
+            conn, depth = held[key]
+            held[key] = (conn, depth + 1)
+            try:
+                yield conn
+            finally:
+                conn, depth = held[key]
+                held[key] = (conn, depth - 1)
+            return
+
+        conn = self._acquire(key)
+        held[key] = (conn, 1)
+        try:
+            yield conn
+        finally:
+            del held[key]
+            self._idle[key].put(conn)
+
+    def close(self):
+        """
+        Close all idle connections of the pool.
+        Connections that are currently in use stay open.
+        """
+        with self._lock:
+            for key, idle in self._idle.items():
+                while True:
+                    try:
+                        conn = idle.get_nowait()
+                    except queue.Empty:
+                        break
+                    conn.close()
+                    self._opened[key] -= 1
+
+    def _held(self):
+        if not hasattr(self._local, 'held'):
+            self._local.held = {}
+        return self._local.held
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._opened.get(key, 0) < self.max_connections:
+                self._opened[key] = self._opened.get(key, 0) + 1
+                open_new = True
+            else:
+                open_new = False
+
+        if open_new:
+            log.debug('Opening read-only connection to %s', key)
+            try:
+                return _open_readonly(key, self.immutable)
+            except Exception:
+                with self._lock:
+                    self._opened[key] -= 1
+                raise
+
+        return idle.get(timeout=self.timeout)
+
+
+def _pool_key(db_path):
+    db_path = os.fspath(db_path)
+    if db_path == ':memory:' or db_path == '':
+        raise ValueError("In-memory databases cannot be shared via a pool")
+    return os.path.abspath(db_path)
+
+
+def _readonly_uri(db_path, immutable=False):
+    # File URIs need an absolute path.
+    uri = pathlib.Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+
+def _open_readonly(db_path, immutable=False):
+    uri = _readonly_uri(db_path, immutable)
+    # Connections may be handed between threads by the pool,
+    # but are never used by two threads at the same time.
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+_default_pool = ConnectionPool()
+
+
+def pooled_connection(db_path):
+    """
+    Context manager yielding a read-only connection to `db_path`
+    from the process-wide connection pool.
+
+    Example
+    -------
+    ```
+    with pooled_connection('data/rapp.db') as conn:
+        df = query_sql('SELECT * FROM Student', conn)
+    ```
+    """
+    return _default_pool.connection(db_path)
+
+
+class QueryCache:
+    """
+    Persistent on-disk cache for the results of SQL queries.
+
+    Results are keyed on the database file (path, size, and modification
+    time) and the normalised SQL text, so any change to the database
+    invalidates the cached results.
+    The results are stored as Feather files, a columnar binary format.
+    When the total size of the cache exceeds `max_bytes`, the least recently
+    used results are evicted.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory in which the cached results are stored.
+
+    max_bytes : int
+        Upper bound on the total size of all cached results.
+
+    hits : int
+        Number of lookups answered from the cache.
+
+    misses : int
+        Number of lookups not found in the cache.
+    """
+
+    suffix = '.feather'
+
+    def __init__(self, cache_dir, max_bytes=2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, db_path, sql_query, params=None):
+        """
+        Return the cache key for the query over the given database.
+        """
+        db_path = os.path.abspath(db_path)
+        fingerprint = f"{db_path}\n{file_fingerprint(db_path)}\n"
+        sql = normalise_sql(sql_query)
+        if params:
+            sql += "\n" + json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256((fingerprint + sql).encode()).hexdigest()
+
+    def get(self, db_path, sql_query, params=None):
+        """
+        Return the cached result as pandas.DataFrame
+        or None if the query is not cached.
+        """
+        path = self._path(self.key(db_path, sql_query, params))
+        with self._lock:
+            try:
+                df = pd.read_feather(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            # Mark as recently used for the LRU eviction.
+            os.utime(path)
+            self.hits += 1
+        log.debug('Query cache hit for %s', path)
+        return df
+
+    def put(self, db_path, sql_query, df, params=None):
+        """
+        Store the query result `df` in the cache.
+        Results which cannot be stored in a columnar format are skipped.
+        """
+        path = self._path(self.key(db_path, sql_query, params))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            df.reset_index(drop=True).to_feather(tmp_path)
+        except (ValueError, TypeError, ImportError) as e:
+            log.warning('Unable to cache query result: %s', e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def query(self, sql_query, db_path, connection=None, params=None):
+        """
+        Return the result of the query over the database at `db_path`,
+        either from the cache or by executing the query over `connection`.
+        If no connection is given, a pooled connection is used.
+        """
+        df = self.get(db_path, sql_query, params)
+        if df is None:
+            if connection is None:
+                with pooled_connection(db_path) as connection:
+                    df = query_sql(sql_query, connection, params)
+            else:
+                df = query_sql(sql_query, connection, params)
+            self.put(db_path, sql_query, df, params)
+        return df
+
+    def clear(self):
+        """
+        Remove all cached results.
+        """
+        with self._lock:
+            for entry, _ in self._entries():
+                os.remove(entry.path)
+
+    def size(self):
+        """
+        Total size of all cached results in bytes.
+        """
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _entries(self):
+        with os.scandir(self.cache_dir) as it:
+            return [(e, e.stat()) for e in it
+                    if e.is_file() and e.name.endswith(self.suffix)]
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime_ns)
+        total = sum(stat.st_size for _, stat in entries)
+        for entry, stat in entries:
+            if total <= self.max_bytes:
+                break
+            log.debug('Evicting cached query result %s', entry.name)
+            os.remove(entry.path)
+            total -= stat.st_size
+
+
+QueryTiming = namedtuple('QueryTiming', ['df', 'seconds'])
+
+
+def execute_queries(db_path, queries, max_workers=4, immutable=False,
+                    templates=None):
+    """
+    Run independent queries concurrently, each over its own read-only
+    connection. SQLite releases the GIL while executing a statement, so
+    the queries of e.g. a template sweep run in parallel.
+
+    Parameters
+    ----------
+    db_path : str, pathlike
+        Path to an existing SQLite database file.
+
+    queries : list[str or (str, dict)]
+        SQL queries, optionally paired with values for their placeholders.
+
+    max_workers : int, default = 4
+        Maximum number of queries running at the same time.
+
+    immutable : bool, default = False
+        Open the database as immutable (no locking),
+        see `ConnectionPool`.
+
+    templates : list[str], default = None
+        Template id of each query, recorded by the telemetry.
+        Default: the template of the calling context.
+
+    Returns
+    -------
+    list[QueryTiming]
+        Result and execution time in seconds of each query,
+        in the order of `queries`.
+    """
+    pool = ConnectionPool(max_connections=max_workers, immutable=immutable)
+    template = _query_template.get()
+    if templates is None:
+        templates = [template] * len(queries)
+
+    def run(query, template):
+        sql_query, params = (query, None) if isinstance(query, str) else query
+        with pool.connection(db_path) as conn, query_template(template):
+            start = time.perf_counter()
+            df = query_sql(sql_query, conn, params)
+            seconds = time.perf_counter() - start
+        log.debug('Query finished after %.3f s', seconds)
+        return QueryTiming(df, seconds)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, queries, templates))
+    finally:
+        pool.close()
+
+
+def query_databases(db_paths, sql_query, params=None,
+                    source_column='Datenbank', attach=False, max_workers=4):
+    """
+    Run the same query against several databases with the same schema,
+    e.g. one export per year, and concatenate the results.
+
+    Every row is tagged with the name of its database file (without
+    suffix) in the first column `source_column`, a categorical column.
+
+    Parameters
+    ----------
+    db_paths : list[str or pathlike]
+        Paths to existing SQLite database files.
+
+    sql_query : str
+
+    params : dict, default = None
+        Values for the placeholders in the query.
+
+    source_column : str, default = 'Datenbank'
+        Name of the column identifying the database of a row.
+
+    attach : bool, default = False
+        If True, the databases are attached to a single connection and
+        queried one after another. Requires that all databases have the
+        same tables and columns. Otherwise each database is queried over
+        its own pooled connection, up to `max_workers` in parallel.
+
+    max_workers : int, default = 4
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    db_paths = list(db_paths)
+    sources = [pathlib.Path(p).stem for p in db_paths]
+    if len(set(sources)) < len(sources):
+        sources = [str(p) for p in db_paths]
+
+    if attach:
+        results = _query_attached(db_paths, sql_query, params)
+    else:
+        template = _query_template.get()
+
+        def run(db_path):
+            with pooled_connection(db_path) as conn, query_template(template):
+                return query_sql(sql_query, conn, params)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run, db_paths))
+
+    def tagged():
+        for code, df in enumerate(results):
+            results[code] = None
+            df.insert(0, source_column, pd.Categorical.from_codes(
+                np.full(len(df), code, dtype=np.int16), categories=sources))
+            yield df
+
+    return concat_chunks(tagged())
+
+
+def _query_attached(db_paths, sql_query, params):
+    conn = _open_readonly(db_paths[0])
+    try:
+        # Only the tables used by the query have to match.
+        used = [tbl for tbl in _table_columns(conn, 'main')
+                if re.search(rf'\b{re.escape(tbl)}\b', sql_query, re.I)]
+        if EXAM_AGGREGATE_TABLE in sql_query:
+            used += _EXAM_AGGREGATE_SOURCES
+        tables = {tbl: columns for tbl, columns
+                  in _table_columns(conn, 'main').items() if tbl in used}
+        results = [query_sql(sql_query, conn, params)]
+        for db_path in db_paths[1:]:
+            conn.execute("ATTACH DATABASE ? AS rapp_source",
+                         (_readonly_uri(db_path),))
+            try:
+                attached = _table_columns(conn, 'rapp_source')
+                if any(attached.get(t) != c for t, c in tables.items()):
+                    raise ValueError(f"Schema of {db_path} differs from "
+                                     f"{db_paths[0]}, it cannot be attached")
+                # Temporary views shadow the tables of the main database.
+                for tbl in tables:
+                    conn.execute(f'CREATE TEMP VIEW "{tbl}" AS '
+                                 f'SELECT * FROM rapp_source."{tbl}"')
+                if EXAM_AGGREGATE_TABLE in sql_query:
+                    # Aggregate the attached tables instead of the main ones.
+                    drop_exam_aggregates(conn)
+                    conn.execute(f"CREATE TEMP VIEW {EXAM_AGGREGATE_TABLE} AS"
+                                 + _EXAM_AGGREGATE_SELECT.format(students=""))
+                results.append(query_sql(sql_query, conn, params))
+            finally:
+                for tbl in tables:
+                    conn.execute(f'DROP VIEW IF EXISTS temp."{tbl}"')
+                conn.execute(f"DROP VIEW IF EXISTS temp.{EXAM_AGGREGATE_TABLE}")
+                conn.execute("DETACH DATABASE rapp_source")
+    finally:
+        conn.close()
+    return results
+
+
+def _table_columns(connection, schema):
+    rows = connection.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall()
+    return {tbl: connection.execute(
+                f'PRAGMA {schema}.table_info("{tbl}")').fetchall()
+            for tbl, in rows}
+
+
+class DeltaCache:
+    """
+    Cache of per-student query results which is refreshed incrementally.
+
+    Along with each result the watermarks (row count and largest rowid,
+    see `table_watermarks`) of all tables of the database and the
+    `file_fingerprint` of the database are stored.
+    If rows were only appended to tables listed in `keys` since then,
+    the query is re-run only for the affected students, e.g. those with
+    new exam records, and the new rows are merged into the cached result.
+    Any other change leads to a full rebuild, including changes in place
+    like an UPDATE, which leave the watermarks as they were but not the
+    fingerprint. An UPDATE made together with appends, however, is only
+    picked up for the students with appended rows.
+
+    The query has to return the key column (by default `Pseudonym`)
+    and may only use named placeholders.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory containing the cached results.
+
+    keys : dict[str -> str]
+        Maps the tables whose new rows can be handled incrementally
+        to their column identifying the student.
+    """
+
+    suffix = '.delta.feather'
+
+    def __init__(self, cache_dir, keys=None):
+        self.cache_dir = cache_dir
+        self.keys = keys if keys is not None else {
+            'Student': 'Pseudonym',
+            'Einschreibung': 'Pseudonym',
+            'Student_schreibt_Pruefung': 'Pseudonym',
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def query(self, sql_query, db_path, key='Pseudonym', params=None):
+        """
+        Return the result of the query over the database at `db_path`,
+        recomputing only the rows of students affected by new data.
+        """
+        path = self._path(db_path, sql_query, key, params)
+        fingerprint = file_fingerprint(db_path)
+        df, old_fingerprint, old = self._load(path)
+        if df is not None and fingerprint == old_fingerprint:
+            return df
+        with pooled_connection(db_path) as conn:
+            watermarks = self.watermarks(conn)
+            keys = None
+            if df is not None:
+                keys = appended_keys(conn, old, watermarks, self.keys)
+                # Without appended rows, the database changed in place.
+                keys = keys or None
+
+            if keys is None:
+                log.debug('Computing %s from scratch', path)
+                df = query_sql(sql_query, conn, params)
+                if key not in df.columns:
+                    raise ValueError(f"Query result has no column '{key}'")
+            elif keys:
+                log.debug('Recomputing %s students for %s', len(keys), path)
+                df = self._merge(df, self._query_keys(
+                    sql_query, conn, key, keys, params), key, keys)
+        self._store(path, df, fingerprint, watermarks)
+        return df
+
+    def watermarks(self, connection):
+        """
+        Watermarks of all source tables of the database.
+        """
+        # Derived tables maintained by rapp follow from their sources.
+        rows = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'rapp_%' "
+            "AND name != ? ORDER BY name", (EXAM_AGGREGATE_TABLE,))
+        return table_watermarks(connection, [name for name, in rows])
+
+    def _query_keys(self, sql_query, connection, key, keys, params):
+        inner = sql_query.strip().rstrip(';')
+        sql = (f'SELECT * FROM (\n{inner}\n) WHERE "{key}" IN '
+               '(SELECT value FROM json_each(:rapp_delta_keys))')
+        params = dict(params or {})
+        params['rapp_delta_keys'] = json.dumps(sorted(keys))
+        return query_sql(sql, connection, params)
+
+    @staticmethod
+    def _merge(df, delta, key, keys):
+        # Keep the row order of the full query if it is ordered by student.
+        is_sorted = df[key].is_monotonic_increasing
+        df = pd.concat([df[~df[key].isin(keys)], delta], ignore_index=True)
+        if is_sorted:
+            df = df.sort_values(key, kind='stable', ignore_index=True)
+        return df
+
+    def _path(self, db_path, sql_query, key, params):
+        ident = "\n".join([os.path.abspath(db_path), key,
+                           normalise_sql(sql_query),
+                           json.dumps(params, sort_keys=True, default=str)])
+        name = hashlib.sha256(ident.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + self.suffix)
+
+    @staticmethod
+    def _load(path):
+        try:
+            df = pd.read_feather(path)
+            with open(path + '.json') as f:
+                state = json.load(f)
+            watermarks = {t: tuple(w)
+                          for t, w in state['watermarks'].items()}
+        except (FileNotFoundError, KeyError):
+            return None, None, None
+        return df, state['fingerprint'], watermarks
+
+    @staticmethod
+    def _store(path, df, fingerprint, watermarks):
+        df.reset_index(drop=True).to_feather(path + '.tmp')
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump({'fingerprint': fingerprint,
+                       'watermarks': watermarks}, f)
+        os.replace(path + '.tmp', path)
+        os.replace(path + '.json.tmp', path + '.json')
+
+
+_query_caches = {}
+
+
+def get_query_cache(cache_dir):
+    """
+    Return the process-wide QueryCache for the given directory,
+    so that hit and miss counters are shared between pipelines.
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    if cache_dir not in _query_caches:
+        _query_caches[cache_dir] = QueryCache(cache_dir)
+    return _query_caches[cache_dir]
+
+
+def normalise_sql(sql_query):
+    """
+    Normalise the layout of an SQL query by stripping surrounding whitespace
+    from each line and removing empty lines.
+    """
+    lines = (line.strip() for line in sql_query.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+EXAM_AGGREGATE_TABLE = 'Student_Modul_Aggregat'
+_EXAM_AGGREGATE_SOURCES = ['Student_schreibt_Pruefung', 'Pruefung']
+
+_EXAM_AGGREGATE_SELECT = """
+SELECT
+  Pseudonym, Modul, Studienfach, Abschluss, Fachsemester,
+  count(*) as Pruefungen,
+  max(Versuch) as Versuche,
+  max(Bestanden) as Bestanden,
+  sum(CASE WHEN Rang = 1 THEN Note END) as LetzteNote,
+  max(SemesterCode) as LetzterSemesterCode
+FROM
+  (SELECT
+    SSP.Pseudonym, P.Modul, SSP.Studienfach, SSP.Abschluss, SSP.Fachsemester,
+    SSP.Versuch, SSP.Note,
+    CASE WHEN SSP.Status = 'bestanden' THEN 1 ELSE 0 END as Bestanden,
+    SSP.Semesterjahr*10 + (2-SSP.Sommersemester) as SemesterCode,
+    row_number() OVER (
+      PARTITION BY SSP.Pseudonym, P.Modul, SSP.Studienfach, SSP.Abschluss,
+                   SSP.Fachsemester
+      ORDER BY SSP.Versuch DESC) as Rang
+  FROM
+    Student_schreibt_Pruefung as SSP,
+    Pruefung as P
+  WHERE SSP.Nummer = P.Nummer
+    AND SSP.Version = P.Version
+    {students})
+GROUP BY Pseudonym, Modul, Studienfach, Abschluss, Fachsemester
+"""
+
+_EXAM_AGGREGATE_SQL = (f"CREATE TEMP TABLE {EXAM_AGGREGATE_TABLE} AS" +
+                       _EXAM_AGGREGATE_SELECT.format(students=""))
+
+# Recomputes the aggregates of the students in the JSON array `:students`.
+_EXAM_AGGREGATE_DELTA_SQL = (
+    f"INSERT INTO {EXAM_AGGREGATE_TABLE}" +
+    _EXAM_AGGREGATE_SELECT.format(
+        students="AND SSP.Pseudonym IN "
+                 "(SELECT value FROM json_each(:students))"))
+
+_EXAM_AGGREGATE_INDEXES = [
+    f"CREATE INDEX temp.idx_aggregat_modul ON {EXAM_AGGREGATE_TABLE} "
+    "(Modul, Fachsemester, Pseudonym)",
+    f"CREATE INDEX temp.idx_aggregat_student ON {EXAM_AGGREGATE_TABLE} "
+    "(Pseudonym, Studienfach, Abschluss)",
+]
+
+_MATERIALISATION_TABLE = 'rapp_materialisation'
+
+
+def file_fingerprint(db_path):
+    """
+    Size and modification time of the database file and its write-ahead
+    log. Unlike the `table_watermarks`, they change with every committed
+    write, including UPDATEs in place.
+
+    Returns
+    -------
+    list[int]
+    """
+    fingerprint = []
+    for path in (os.fspath(db_path), f"{os.fspath(db_path)}-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        fingerprint += [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def table_watermarks(connection, tables):
+    """
+    Row count and largest rowid of each of the given tables.
+
+    Returns
+    -------
+    dict[str -> (int, int or None)]
+    """
+    watermarks = {}
+    for tbl in tables:
+        count, max_rowid = connection.execute(
+            f'SELECT count(*), max(rowid) FROM "{tbl}"').fetchone()
+        watermarks[tbl] = (count, max_rowid)
+    return watermarks
+
+
+def appended_keys(connection, old, new, keys):
+    """
+    Determine the keys of the rows appended since the watermarks `old`
+    were taken, e.g. the students with new exam records.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+
+    old, new : dict
+        Watermarks as returned by `table_watermarks`.
+
+    keys : dict[str -> str]
+        Maps tables to the key column whose values are collected.
+
+    Returns
+    -------
+    set or None
+        The keys of all appended rows, or None if the changes are not
+        purely appends, i.e. a table without key column changed, or rows
+        were deleted or replaced. The result then needs a full rebuild.
+    """
+    if set(old) != set(new):
+        return None
+    appended = set()
+    for tbl, (count, max_rowid) in new.items():
+        old_count, old_max_rowid = old[tbl]
+        if (count, max_rowid) == (old_count, old_max_rowid):
+            continue
+        if tbl not in keys or old_max_rowid is None:
+            return None
+        rows = connection.execute(
+            f'SELECT "{keys[tbl]}" FROM "{tbl}" WHERE rowid > ?',
+            (old_max_rowid,)).fetchall()
+        if count - old_count != len(rows):
+            return None
+        appended.update(key for key, in rows)
+    return appended
+
+
+def materialise_exam_aggregates(connection, force=False):
+    """
+    Build the table `Student_Modul_Aggregat` for queries on `connection`.
+
+    The table holds per student, module, subject, degree, and term
+    the number of exams (`Pruefungen`), the highest attempt (`Versuche`),
+    whether the module was passed (`Bestanden`), the grade of the last
+    attempt (`LetzteNote`), and the latest semester code
+    (`LetzterSemesterCode`, `Semesterjahr*10 + (2-Sommersemester)`).
+    Templates may refer to it instead of aggregating
+    `Student_schreibt_Pruefung` themselves; `query_sql` builds it
+    automatically for queries which do.
+
+    The table is a temporary table of the connection, so the database
+    itself is never written and read-only connections work as well.
+    It lives as long as the connection, e.g. in the connection pool, and
+    is only updated if the database file changed since (see
+    `file_fingerprint`) or if `force` is set. If exam records were only
+    appended, just the students with new records are recomputed. In-memory
+    databases have no fingerprint, so the table is rebuilt for each query.
+
+    Returns
+    -------
+    bool
+        Whether the table was (re)built.
+    """
+    kind = connection.execute(
+        "SELECT type FROM temp.sqlite_master WHERE name = ?",
+        (EXAM_AGGREGATE_TABLE,)).fetchone()
+    if kind == ('view',):
+        return False  # Computed for each query, see `query_databases`.
+
+    db_path, = connection.execute(
+        "SELECT file FROM pragma_database_list WHERE name = 'main'").fetchone()
+    sources = _EXAM_AGGREGATE_SOURCES
+    state = {'file': file_fingerprint(db_path) if db_path else None,
+             'watermarks': table_watermarks(connection, sources)}
+    connection.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {_MATERIALISATION_TABLE} "
+        "(name TEXT PRIMARY KEY, state TEXT)")
+    row = connection.execute(
+        f"SELECT state FROM temp.{_MATERIALISATION_TABLE} WHERE name = ?",
+        (EXAM_AGGREGATE_TABLE,)).fetchone()
+    old = json.loads(row[0]) if row is not None and db_path else None
+    if not force and old is not None and old['file'] == state['file']:
+        log.debug('%s is up to date', EXAM_AGGREGATE_TABLE)
+        return False
+
+    students = None
+    if not force and old is not None:
+        # Without appended rows, the database changed in place.
+        students = appended_keys(
+            connection, old['watermarks'], state['watermarks'],
+            {'Student_schreibt_Pruefung': 'Pseudonym'}) or None
+
+    with connection:
+        if students is None:
+            log.info('Materialising %s for %s',
+                     EXAM_AGGREGATE_TABLE, db_path or 'in-memory database')
+            connection.execute(
+                f"DROP TABLE IF EXISTS temp.{EXAM_AGGREGATE_TABLE}")
+            connection.execute(_EXAM_AGGREGATE_SQL)
+            for stmt in _EXAM_AGGREGATE_INDEXES:
+                connection.execute(stmt)
+        else:
+            log.info('Updating %s for %s students',
+                     EXAM_AGGREGATE_TABLE, len(students))
+            students = json.dumps(sorted(students))
+            connection.execute(
+                f"DELETE FROM temp.{EXAM_AGGREGATE_TABLE} WHERE Pseudonym IN "
+                "(SELECT value FROM json_each(?))", (students,))
+            connection.execute(_EXAM_AGGREGATE_DELTA_SQL,
+                               {'students': students})
+        connection.execute(
+            f"INSERT OR REPLACE INTO temp.{_MATERIALISATION_TABLE} "
+            "VALUES (?, ?)", (EXAM_AGGREGATE_TABLE, json.dumps(state)))
+    return True
+
+
+def drop_exam_aggregates(connection):
+    """
+    Drop the table built by `materialise_exam_aggregates` on `connection`,
+    e.g. after the tables it is built from were replaced.
+    """
+    with connection:
+        connection.execute(f"DROP TABLE IF EXISTS temp.{EXAM_AGGREGATE_TABLE}")
+        connection.execute(
+            f"DROP TABLE IF EXISTS temp.{_MATERIALISATION_TABLE}")
+
+
+def _prepare_query(sql_query, connection):
+    if EXAM_AGGREGATE_TABLE in sql_query:
+        materialise_exam_aggregates(connection)
+
+
+class IngestCancelled(Exception):
+    """
+    Raised when a bulk import is cancelled before it finished.
+    """
+
+
+def load_csv(csv_path, connection, table_name, delimiter=',',
+             chunksize=50000, progress=None, cancelled=None):
+    """
+    Bulk load a delimiter separated file into a new database table.
+
+    The file is streamed in chunks; the column types of the table are
+    derived from the first chunk and all rows are inserted via
+    `executemany` inside a single transaction with journaling and
+    synchronous writes disabled.
+
+    Parameters
+    ----------
+    csv_path : str
+    connection : sqlite3.Connection
+        Writable connection, e.g. to an in-memory database.
+    table_name : str
+        Name of the table to create.
+    delimiter : str, default = ','
+    chunksize : int, default = 50000
+        Number of rows read and inserted at once.
+    progress : callable, default = None
+        Called with the fraction of the file processed so far (0 to 1).
+    cancelled : callable, default = None
+        Polled between chunks; if it returns True the partially loaded
+        table is dropped and `IngestCancelled` is raised.
+
+    Returns
+    -------
+    int
+        Number of inserted rows.
+    """
+    total_bytes = max(os.path.getsize(csv_path), 1)
+    journal_mode, = connection.execute("PRAGMA journal_mode").fetchone()
+    synchronous, = connection.execute("PRAGMA synchronous").fetchone()
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+
+    n_rows = 0
+    insert = None
+    try:
+        with open(csv_path, 'rb') as f:
+            reader = pd.read_csv(f, delimiter=delimiter, chunksize=chunksize)
+            connection.execute("BEGIN")
+            for chunk in reader:
+                if cancelled is not None and cancelled():
+                    raise IngestCancelled(f"Import of {csv_path} cancelled")
+                if insert is None:
+                    insert = _create_table_for(connection, table_name, chunk)
+                rows = chunk.astype(object).where(chunk.notna(), None)
+                connection.executemany(insert, rows.itertuples(index=False))
+                n_rows += len(chunk)
+                if progress is not None:
+                    progress(min(f.tell() / total_bytes, 1.0))
+            connection.execute("COMMIT")
+    except BaseException:
+        # Without a journal, ROLLBACK is undefined behaviour in SQLite.
+        # Thus, we drop the partially loaded table instead.
+        if connection.in_transaction:
+            connection.execute("COMMIT")
+        if insert is not None:
+            connection.execute(f'DROP TABLE "{table_name}"')
+        raise
+    finally:
+        connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        connection.execute(f"PRAGMA synchronous = {synchronous}")
+
+    log.info('Loaded %s rows from %s into %s', n_rows, csv_path, table_name)
+    return n_rows
+
+
+def _create_table_for(connection, table_name, df):
+    """
+    Create a table matching the columns of `df`.
+    Returns the parametrised INSERT statement for the table.
+    """
+    def sql_type(dtype):
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'INTEGER'
+        if pd.api.types.is_integer_dtype(dtype):
+            return 'INTEGER'
+        if pd.api.types.is_float_dtype(dtype):
+            return 'REAL'
+        return 'TEXT'
+
+    columns = ', '.join(f'"{col}" {sql_type(dtype)}'
+                        for col, dtype in df.dtypes.items())
+    connection.execute(f'CREATE TABLE "{table_name}" ({columns})')
+    placeholders = ', '.join('?' * len(df.columns))
+    return f'INSERT INTO "{table_name}" VALUES ({placeholders})'
+
+
+COLUMNAR_FORMATS = ('.parquet', '.feather', '.arrow', '.npy')
+
+
+def columnar_columns(path):
+    """
+    Return the column names stored in a columnar data file
+    without reading any data.
+    """
+    suffix = _columnar_suffix(path)
+    if suffix == '.parquet':
+        import pyarrow.parquet
+        return list(pyarrow.parquet.read_schema(path).names)
+    elif suffix == '.npy':
+        return list(np.load(path, mmap_mode='r').dtype.names)
+    else:
+        import pyarrow.ipc
+        with pyarrow.memory_map(os.fspath(path)) as source:
+            return list(pyarrow.ipc.open_file(source).schema.names)
+
+
+def read_columnar(path, columns=None):
+    """
+    Read a columnar data file into a pandas.DataFrame.
+    Files are memory-mapped and only the requested columns are read.
+
+    Parameters
+    ----------
+    path : str
+        Path to a Parquet (.parquet), Feather (.feather, .arrow),
+        or NumPy structured array (.npy) file.
+
+    columns : list[str], default = None
+        Columns to read. All columns are read if None.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    suffix = _columnar_suffix(path)
+    if suffix == '.parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path, columns=columns,
+                                           memory_map=True)
+        return table.to_pandas()
+    elif suffix == '.npy':
+        records = np.load(path, mmap_mode='r')
+        if columns is None:
+            columns = list(records.dtype.names)
+        return pd.DataFrame({col: np.asarray(records[col]) for col in columns})
+    else:
+        import pyarrow.feather
+        table = pyarrow.feather.read_table(path, columns=columns,
+                                           memory_map=True)
+        return table.to_pandas()
+
+
+def write_columnar(df, path):
+    """
+    Store a pandas.DataFrame as columnar data file, e.g. to share a
+    precomputed feature table. The format is chosen by the file extension,
+    see `read_columnar`.
+    """
+    suffix = _columnar_suffix(path)
+    df = df.reset_index(drop=True)
+    if suffix == '.parquet':
+        df.to_parquet(path)
+    elif suffix == '.npy':
+        np.save(path, df.to_records(index=False), allow_pickle=False)
+    else:
+        df.to_feather(path)
+
+
+def _columnar_suffix(path):
+    suffix = pathlib.Path(path).suffix.lower()
+    if suffix not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format '{suffix}'; "
+                         f"expected one of {', '.join(COLUMNAR_FORMATS)}")
+    return suffix
+
+
+QueryRecord = namedtuple('QueryRecord', ['timestamp', 'template', 'seconds',
+                                         'rows', 'bytes', 'sql'])
+
+
+class QueryTelemetry:
+    """
+    Records wall time, number of rows, size in bytes and template id of
+    the executed queries in a ring buffer of the latest `capacity` queries.
+
+    Queries taking at least `slow_threshold` seconds are logged as
+    warnings and, if `log_path` is given, written to the table
+    `rapp_query_log` of the SQLite database at `log_path`.
+
+    Attributes
+    ----------
+    records : collections.deque[QueryRecord]
+        The latest executed queries, oldest first.
+
+    slow_threshold : float or None
+        Minimum duration in seconds of slow queries,
+        None if no query counts as slow.
+
+    log_path : str or None
+        SQLite database for the log of slow queries.
+    """
+
+    def __init__(self, capacity=1000, slow_threshold=None, log_path=None):
+        self.records = deque(maxlen=capacity)
+        self.slow_threshold = slow_threshold
+        self.log_path = log_path
+        self._lock = threading.Lock()
+
+    def record(self, sql_query, seconds, rows, nbytes):
+        """
+        Record a query executed within the current `query_template`.
+        """
+        record = QueryRecord(time.time(), _query_template.get(), seconds,
+                             rows, nbytes, normalise_sql(sql_query))
+        with self._lock:
+            self.records.append(record)
+        if self.is_slow(record):
+            log.warning('Slow query of template %s: %.3f s, %s rows',
+                        record.template, seconds, rows)
+            if self.log_path is not None:
+                self._log(record)
+        return record
+
+    def is_slow(self, record):
+        return (self.slow_threshold is not None
+                and record.seconds >= self.slow_threshold)
+
+    def slow_queries(self):
+        """
+        Return the recorded queries which are slow.
+        """
+        with self._lock:
+            return [r for r in self.records if self.is_slow(r)]
+
+    def summary(self):
+        """
+        Return number, duration, rows and bytes of the recorded queries
+        per template, starting with the template taking longest in total.
+        """
+        with self._lock:
+            df = pd.DataFrame(list(self.records), columns=QueryRecord._fields)
+        df['slow'] = (self.slow_threshold is not None
+                      and df['seconds'] >= self.slow_threshold)
+        return _summarise_queries(df)
+
+    def _log(self, record):
+        with sqlite3.connect(self.log_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rapp_query_log "
+                "(timestamp REAL, template TEXT, seconds REAL, "
+                "rows INTEGER, bytes INTEGER, sql TEXT)")
+            conn.execute("INSERT INTO rapp_query_log VALUES (?, ?, ?, ?, ?, ?)",
+                         record)
+        conn.close()
+
+
+def query_log_summary(log_path):
+    """
+    Summary like `QueryTelemetry.summary` of the slow queries
+    logged to the SQLite database at `log_path`.
+    """
+    with sqlite3.connect(log_path) as conn:
+        df = pd.read_sql_query("SELECT * FROM rapp_query_log", conn)
+    conn.close()
+    df['slow'] = True
+    return _summarise_queries(df)
+
+
+def _summarise_queries(df):
+    df['template'] = df['template'].fillna('-')
+    summary = df.groupby('template').agg(
+        queries=('seconds', 'size'),
+        seconds=('seconds', 'sum'),
+        mean_seconds=('seconds', 'mean'),
+        max_seconds=('seconds', 'max'),
+        rows=('rows', 'sum'),
+        bytes=('bytes', 'sum'),
+        slow=('slow', 'sum'))
+    return summary.sort_values('seconds', ascending=False)
+
+
+_telemetry = None
+_query_template = contextvars.ContextVar('rapp_query_template', default=None)
+
+
+def enable_telemetry(capacity=1000, slow_threshold=None, log_path=None):
+    """
+    Start recording all queries run via `query_sql` and
+    `query_sql_chunks`, see `QueryTelemetry`. Returns the telemetry.
+    """
+    global _telemetry
+    _telemetry = QueryTelemetry(capacity, slow_threshold, log_path)
+    return _telemetry
+
+
+def disable_telemetry():
+    """
+    Stop recording queries.
+    """
+    global _telemetry
+    _telemetry = None
+
+
+def get_telemetry():
+    """
+    Return the active QueryTelemetry or None if it is disabled.
+    """
+    return _telemetry
+
+
+@contextmanager
+def query_template(template_id):
+    """
+    Attribute the queries run within the context to the given template,
+    e.g. `'cs_first_term_grades/3_dropout'`, in the telemetry.
+    """
+    token = _query_template.set(template_id)
+    try:
+        yield
+    finally:
+        _query_template.reset(token)
+
+
+def _record_query(sql_query, seconds, rows, nbytes):
+    telemetry = _telemetry
+    if telemetry is not None:
+        telemetry.record(sql_query, seconds, rows, nbytes)
+
+
+def query_sql(sql_query, connection=None, params=None):
     """
     Execute an SQL query over the given database connection.
+    Values for placeholders like `:name` in the query are bound from the
+    dictionary `params`, so the prepared statement can be reused.
     Return the results as pandas.DataFrame.
     """
     if connection is None:
         global db_conn
         connection = db_conn
-    df = pd.read_sql_query(sql_query, connection)
+    _prepare_query(sql_query, connection)
+    start = time.perf_counter()
+    df = pd.read_sql_query(sql_query, connection, params=params)
+    if _telemetry is not None:
+        _record_query(sql_query, time.perf_counter() - start, len(df),
+                      int(df.memory_usage(deep=True).sum()))
+    return df
+
+
+def query_columns(sql_query, connection=None, params=None):
+    """
+    Return the names of the columns `sql_query` produces
+    without fetching any rows.
+    """
+    if connection is None:
+        connection = db_conn
+    _prepare_query(sql_query, connection)
+    inner = sql_query.strip().rstrip(';')
+    cur = connection.execute(f"SELECT * FROM (\n{inner}\n) LIMIT 0",
+                             params or {})
+    return [d[0] for d in cur.description]
+
+
+def query_column_types(sql_query, connection=None, params=None):
+    """
+    Resolve the declared types of the columns `sql_query` produces
+    without fetching any rows.
+
+    SQLite derives the column types of `CREATE TABLE ... AS SELECT` from
+    the table columns the results originate from, so equally named columns
+    of different tables are told apart. Computed columns have no type.
+
+    Returns
+    -------
+    dict[column name -> type]
+        One of `TEXT`, `INT`, `REAL`, `NUM` or an empty string.
+    """
+    if connection is None:
+        connection = db_conn
+    _prepare_query(sql_query, connection)
+    inner = sql_query.strip().rstrip(';')
+    connection.execute("DROP TABLE IF EXISTS temp.rapp_column_types")
+    connection.execute("CREATE TEMP TABLE rapp_column_types AS "
+                       f"SELECT * FROM (\n{inner}\n) LIMIT 0", params or {})
+    try:
+        rows = connection.execute(
+            "PRAGMA temp.table_info(rapp_column_types)").fetchall()
+    finally:
+        connection.execute("DROP TABLE temp.rapp_column_types")
+    return {name: (decl_type or '').upper() for _, name, decl_type, *_ in rows}
+
+
+def query_sql_chunks(sql_query, connection=None, chunksize=10000, dtype=None,
+                     params=None):
+    """
+    Execute an SQL query over the given database connection and stream
+    the results in chunks instead of materialising them at once.
+
+    Parameters
+    ----------
+    sql_query : str
+
+    connection : sqlite3.Connection, default = None
+        Falls back to the connection opened last via `connect`.
+
+    chunksize : int, default = 10000
+        Maximum number of rows per chunk.
+
+    dtype : type or dict[column -> type], default = None
+        Data types applied to the columns of each chunk.
+
+    params : dict, default = None
+        Values for the placeholders in the query.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Consecutive chunks of the query result.
+    """
+    if connection is None:
+        connection = db_conn
+    _prepare_query(sql_query, connection)
+    chunks = pd.read_sql_query(sql_query, connection, params=params,
+                               chunksize=chunksize, dtype=dtype)
+    if _telemetry is None:
+        yield from chunks
+        return
+
+    # Only the time spent fetching counts, not the time of the consumer.
+    seconds, rows, nbytes = 0.0, 0, 0
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            seconds += time.perf_counter() - start
+            if chunk is None:
+                break
+            rows += len(chunk)
+            nbytes += int(chunk.memory_usage(deep=True).sum())
+            yield chunk
+    finally:
+        _record_query(sql_query, seconds, rows, nbytes)
+
+
+def concat_chunks(chunks):
+    """
+    Assemble DataFrame chunks into a single DataFrame.
+
+    Columns are assembled one after another and the chunk data of a column
+    is released as soon as the column is built, so the peak memory stays
+    close to the size of the final result instead of twice its size.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas.DataFrame
+        Chunks sharing the same columns, e.g. from `query_sql_chunks`.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    columns = None
+    pieces = {}
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+            pieces = {col: [] for col in columns}
+        for col in columns:
+            pieces[col].append(chunk[col])
+        del chunk
+
+    if columns is None:
+        return pd.DataFrame()
+
+    df = pd.DataFrame()
+    for col in columns:
+        df[col] = pd.concat(pieces.pop(col), ignore_index=True)
     return df
 
 
+def declared_column_types(connection=None):
+    """
+    Collect the declared column types of all tables in the database
+    via `PRAGMA table_info`.
+
+    Returns
+    -------
+    dict[column name -> declared type]
+        Declared types in upper case.
+        Column names occurring in several tables keep the first declaration.
+    """
+    if connection is None:
+        connection = db_conn
+    cur = connection.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [tbl for (tbl,) in cur.fetchall()]
+
+    types = {}
+    for tbl in tables:
+        cur.execute(f'PRAGMA table_info("{tbl}")')
+        for _, name, decl_type, *_ in cur.fetchall():
+            types.setdefault(name, (decl_type or '').upper())
+    return types
+
+
+def compact_dtypes(df, declared_types=None, exclude=(),
+                   max_category_ratio=0.5, downcast_floats=False):
+    """
+    Convert the columns of a query result into compact data types.
+
+    - Integer columns are downcast to the smallest fitting integer type,
+      e.g. `int8` for flags and attempt counters.
+    - Float columns are only stored as `float32` if `downcast_floats` is set.
+    - Text columns become `category` if they repeat their values often
+      enough. Columns which only hold text because of mixed values of a
+      numeric column are kept.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    declared_types : dict[column name -> declared type], default = None
+        Declared SQL types of the result columns as returned by
+        `query_column_types`.
+
+    exclude : iterable of str
+        Columns which are kept as they are, e.g. the prediction label.
+
+    max_category_ratio : float, default = 0.5
+        Text columns are only converted if the ratio of unique values to
+        rows is at most this value, so identifiers are kept as they are.
+
+    downcast_floats : bool, default = False
+        Whether float columns are stored with single precision.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Frame with compacted columns. Memory savings are logged.
+    """
+    if declared_types is None:
+        declared_types = {}
+    before = df.memory_usage(deep=True).sum()
+
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in exclude:
+            pass
+        elif pd.api.types.is_bool_dtype(series):
+            pass
+        elif pd.api.types.is_integer_dtype(series):
+            series = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            if downcast_floats:
+                series = series.astype('float32')
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            pass
+        elif (pd.api.types.is_object_dtype(series)
+              or pd.api.types.is_string_dtype(series)):
+            declared = declared_types.get(col, '')
+            # SQLite's affinity rules: anything but text or blob is numeric.
+            is_numeric = declared != '' and not any(
+                t in declared for t in ('CHAR', 'TEXT', 'CLOB', 'BLOB'))
+            n_unique = series.nunique(dropna=True)
+            if not is_numeric and n_unique <= max_category_ratio * len(series):
+                series = series.astype('category')
+        columns[col] = series
+    compact = pd.DataFrame(columns, index=df.index)
+
+    after = compact.memory_usage(deep=True).sum()
+    log.info('Compacting dtypes reduced memory from %.2f MB to %.2f MB',
+             before / 2**20, after / 2**20)
+    return compact
+
+
+@contextmanager
+def cancellable(connection, cancelled, n_instructions=1000):
+    """
+    Context manager aborting queries over `connection` as soon as
+    `cancelled()` returns True.
+    The check is done every `n_instructions` SQLite virtual machine
+    instructions; aborted queries raise an `sqlite3.OperationalError`.
+    """
+    connection.set_progress_handler(lambda: 1 if cancelled() else 0,
+                                    n_instructions)
+    try:
+        yield connection
+    finally:
+        connection.set_progress_handler(None, n_instructions)
+
+
 def query_sql_file(sql_file, connection=None):
     """
     `sql_file`: Path to an sql file.
@@ -0,0 +1,161 @@
+"""
+Persistent feature sets of the feature templates, stored per student.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+import pandas as pd
+
+from rapp import data as db
+from rapp import sqlbuilder
+
+log = logging.getLogger('rapp.featurestore')
+
+
+class FeatureStore:
+    """
+    Stores the result of each feature template per student, so that
+    pipelines join the stored features to their labels instead of
+    deriving them again for every label and run.
+
+    A feature set is computed with `sqlbuilder.load_feature_sql` and
+    identified by a version hash of this query and the values of its
+    parameters (by default those of the template), so that changing a
+    template results in a new version. Stored sets are refreshed
+    incrementally by a `DeltaCache` when students or exam records are
+    added to the database.
+
+    Along with the features, the store keeps a fingerprint of the rows
+    each student is aggregated over. Students whose rows are changed by
+    the conditions of a label cannot be joined to the stored features,
+    see `sqlbuilder.load_label_sql`.
+
+    Attributes
+    ----------
+    store_dir : str
+        Directory containing the stored feature sets.
+
+    template_dir : str
+        Directory of the SQL templates. Default: the directory of
+        `sqlbuilder`.
+    """
+
+    def __init__(self, store_dir, template_dir=None):
+        self.store_dir = store_dir
+        self.template_dir = template_dir
+        self._caches = {}  # features id -> DeltaCache
+        # (db, features id, version) -> (fingerprint, df, rows)
+        self._loaded = {}
+
+    def version(self, features_id, params=None):
+        """
+        Version hash of the feature set of `features_id`.
+        """
+        sql, params = self._feature_query(features_id, params)
+        return _version(sql, params)
+
+    def features(self, db_path, features_id, params=None):
+        """
+        Return the features of all students of the database at `db_path`,
+        computing or refreshing the stored feature set if necessary.
+
+        Returns
+        -------
+        features : DataFrame
+            Feature set indexed by the `Pseudonym` of the students.
+        """
+        return self._load(db_path, features_id, params)[0]
+
+    def join_labels(self, db_path, features_id, labels_id, params=None,
+                    key=False):
+        """
+        Return the stored features of `features_id` joined to the label
+        `labels_id`, with the columns and rows of `sqlbuilder.load_sql`
+        for the given `key`.
+
+        Raises
+        ------
+        ValueError
+            If the label changes the rows the features of some students
+            are computed over.
+        """
+        features, rows = self._load(db_path, features_id, params)
+        sql = sqlbuilder.load_label_sql(features_id, labels_id,
+                                        self.template_dir, rows=True)
+        params = self._parameters(features_id, [labels_id], params)
+        with db.pooled_connection(db_path) as conn:
+            labels = db.query_sql(sql, conn, _referenced(sql, params))
+        pseudonyms = labels.pop('Pseudonym')
+        changed = (rows.reindex(pseudonyms).to_numpy() !=
+                   labels.pop('rapp_rows').to_numpy())
+        if changed.any():
+            raise ValueError(f"Label '{labels_id}' changes the rows the "
+                             f"features of {changed.sum()} students are "
+                             "computed over, they cannot be taken from "
+                             "the store")
+        df = features.reindex(pseudonyms)
+        df = df.reset_index(drop=not key)
+        return pd.concat([df, labels], axis=1)
+
+    def _load(self, db_path, features_id, params):
+        sql, params = self._feature_query(features_id, params)
+        key = (os.path.abspath(db_path), features_id, _version(sql, params))
+        fingerprint = db.file_fingerprint(db_path)
+        loaded = self._loaded.get(key)
+        if loaded is not None and loaded[0] == fingerprint:
+            return loaded[1:]
+
+        log.debug('Loading feature set %s version %s', features_id, key[2])
+        df = self._cache(features_id).query(sql, db_path, params=params)
+        df = df.set_index('Pseudonym')
+        rows = df.pop('rapp_rows')
+        self._loaded[key] = (fingerprint, df, rows)
+        return df, rows
+
+    def _feature_query(self, features_id, params):
+        sql = sqlbuilder.load_feature_sql(features_id, self.template_dir,
+                                          rows=True)
+        params = self._parameters(features_id, [], params)
+        return sql, _referenced(sql, params)
+
+    def _parameters(self, features_id, labels_ids, params):
+        # Parameters which are not given keep the defaults of the templates.
+        defaults = sqlbuilder.load_parameters(features_id, labels_ids,
+                                              self.template_dir)
+        return {**defaults, **(params or {})}
+
+    def _cache(self, features_id):
+        if features_id not in self._caches:
+            self._caches[features_id] = db.DeltaCache(
+                os.path.join(self.store_dir, features_id))
+        return self._caches[features_id]
+
+
+_feature_stores = {}
+
+
+def get_feature_store(store_dir, template_dir=None):
+    """
+    Return the process-wide FeatureStore for the given directory,
+    so that loaded feature sets are shared between pipelines.
+    """
+    key = (os.path.abspath(store_dir), template_dir)
+    if key not in _feature_stores:
+        _feature_stores[key] = FeatureStore(store_dir, template_dir)
+    return _feature_stores[key]
+
+
+def _version(sql_query, params):
+    ident = "\n".join([db.normalise_sql(sql_query),
+                       json.dumps(params, sort_keys=True, default=str)])
+    return hashlib.sha256(ident.encode()).hexdigest()[:16]
+
+
+def _referenced(sql_query, params):
+    # Only the parameters used by a query belong to its version.
+    params = {name: value for name, value in (params or {}).items()
+              if re.search(rf':{re.escape(name)}\b', sql_query)}
+    return params or None
@@ -1,8 +1,11 @@
 # table
+import bisect
 import pathlib
+import sqlite3
+import threading
+import time
 
 import pandas as pd
-from pandas.io.sql import DatabaseError
 import logging
 
 from rapp.gui.helper import CsvDialog
@@ -29,16 +32,39 @@ class PandasModel(QtCore.QAbstractTableModel):
         QtCore.QAbstractTableModel.__init__(self, parent=parent)
         self.df = df
 
+    @property
+    def df(self):
+        """
+        The displayed DataFrame.
+        Streamed chunks are only concatenated when the whole frame is
+        accessed, not on every appended chunk.
+        """
+        if self._df is None:
+            self._df = pd.concat(self._chunks, ignore_index=True)
+            self._chunks, self._offsets = [self._df], [0]
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self._chunks = [df]
+        # Row number of the first row of each chunk.
+        self._offsets = [0]
+        self._rows = len(df.index)
+
     def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
         if role != QtCore.Qt.DisplayRole:
             return QtCore.QVariant()
 
         if orientation == QtCore.Qt.Horizontal:
             try:
-                return self.df.columns.tolist()[section]
+                return self._chunks[0].columns.tolist()[section]
             except (IndexError,):
                 return QtCore.QVariant()
         elif orientation == QtCore.Qt.Vertical:
+            if len(self._chunks) > 1:
+                # Appended chunks are concatenated ignoring their index.
+                return section if section < self._rows else QtCore.QVariant()
             try:
                 # return self.df.index.tolist()
                 return self.df.index.tolist()[section]
@@ -52,7 +78,9 @@ class PandasModel(QtCore.QAbstractTableModel):
         if not index.isValid():
             return QtCore.QVariant()
 
-        return QtCore.QVariant(str(self.df.iloc[index.row(), index.column()]))
+        row = index.row()
+        i = bisect.bisect_right(self._offsets, row) - 1
+        return QtCore.QVariant(str(self._chunks[i].iloc[row - self._offsets[i], index.column()]))
 
     def setData(self, index, value, role):
         row = self.df.index[index.row()]
@@ -68,11 +96,23 @@ class PandasModel(QtCore.QAbstractTableModel):
         self.df.set_value(row, col, value)
         return True
 
+    def append(self, df):
+        """
+        Append the rows of `df` to the displayed DataFrame.
+        """
+        first = self._rows
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(df.index) - 1)
+        self._chunks.append(df)
+        self._offsets.append(first)
+        self._rows += len(df.index)
+        self._df = None
+        self.endInsertRows()
+
     def rowCount(self, parent=QtCore.QModelIndex()):
-        return len(self.df.index)
+        return self._rows
 
     def columnCount(self, parent=QtCore.QModelIndex()):
-        return len(self.df.columns)
+        return len(self._chunks[0].columns)
 
     def sort(self, column, order):
         colname = self.df.columns.tolist()[column]
@@ -84,6 +124,8 @@ class PandasModel(QtCore.QAbstractTableModel):
 
 
 class DataView(QtWidgets.QWidget):
+    # Emitted with the result of every query, see `run_query`.
+    queryFinished = QtCore.pyqtSignal(object)
 
     def __init__(self, parent=None, sql_conn=None, qmainwindow=None, log=None):
         super(DataView, self).__init__(parent)
@@ -99,14 +141,36 @@ class DataView(QtWidgets.QWidget):
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
 
+        # Feedback for running queries.
+        self.queryStatus = QtWidgets.QLabel(self)
+        self.cancelButton = QtWidgets.QPushButton('Cancel', self)
+        self.cancelButton.setStatusTip('Cancel the running SQL query')
+        self.cancelButton.clicked.connect(self.cancel_query)
+        self.cancelButton.setEnabled(False)
+        query_layout = QtWidgets.QHBoxLayout()
+        query_layout.addWidget(self.queryStatus, 1)
+        query_layout.addWidget(self.cancelButton)
+
+        self.query_timer = QtCore.QTimer(self)
+        self.query_timer.timeout.connect(self.__update_query_status)
+
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.combo)
         layout.addWidget(self.table)
+        layout.addLayout(query_layout)
         layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(layout)
 
         self.__sql_query = None
         self.__sql_idx = 0
+        self.__query_worker = None
+        self.__query_thread = None
+        self.__query_callback = None
+        self.__pending_query = None
+        self.__idle_callbacks = []
+        self.__query_start = None
+        self.query_cancelled = False
+        self.query_error = None
 
         if sql_conn != None:
             self.set_connection(sql_conn)
@@ -134,19 +198,13 @@ class DataView(QtWidgets.QWidget):
         tbl = self.combo.itemText(index)
         self.log.info(f'Loading {tbl} table')
 
-        try:
-            if tbl != "SQL" and tbl != "":
-                sql_query = f'SELECT * FROM {tbl}'
-                df = data.query_sql(sql_query, self.__conn)
-                self.display_dataframe(df)
-            elif self.__sql_query:
-                df = data.query_sql(self.__sql_query, self.__conn)
-                self.display_dataframe(df)
-            else:
-                self.display_dataframe(pd.DataFrame(columns=["Empty"]))
-
-        except (DatabaseError, TypeError) as e:
-            self.log.error(str(e))
+        if tbl != "SQL" and tbl != "":
+            sql_query = f'SELECT * FROM {tbl}'
+            self.run_query(sql_query)
+        elif self.__sql_query:
+            self.run_query(self.__sql_query)
+        else:
+            self.display_dataframe(pd.DataFrame(columns=["Empty"]))
 
     def display_dataframe(self, df):
         """
@@ -156,26 +214,217 @@ class DataView(QtWidgets.QWidget):
         model = PandasModel(df)
         self.table.setModel(model)
 
-    def set_custom_sql(self, sql_query):
-        try:
-            df = data.query_sql(sql_query, self.__conn)
-        except TypeError:
-            return None
-        self.display_dataframe(df)
-        self.__sql_query = sql_query
-        self.combo.setCurrentIndex(self.__sql_idx)
+    def append_dataframe(self, df):
+        """
+        Append the rows of the given Pandas DataFrame to the displayed one.
+        """
+        df.columns = df.columns.str.capitalize()
+        self.table.model().append(df)
+
+    def run_query(self, sql_query, callback=None):
+        """
+        Execute the query in a separate thread and stream the results into
+        the table as they arrive.
+        Returns at once; the GUI stays responsive while the query runs and
+        the query can be cancelled via the cancel button.
+        Starting a query while another one is running cancels the running
+        query and executes the new one once it stopped.
+
+        Parameters
+        ----------
+        sql_query : str
+        callback : callable, optional
+            Called with the complete query result as DataFrame once the query
+            finished, or with None if it was cancelled or failed.
+            `query_cancelled` and `query_error` tell both cases apart.
+            Errors of queries without a callback are logged.
+        """
+        if self.__query_worker is not None:
+            self.__pending_query = (sql_query, callback)
+            self.cancel_query()
+            return
+
+        thread = QtCore.QThread()
+        worker = QueryWorker(sql_query, self.__conn)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+
+        worker.chunk.connect(self.__receive_chunk)
+        worker.finished.connect(self.__query_finished)
+
+        self.__query_worker = worker
+        self.__query_thread = thread
+        self.__query_callback = callback
+        self.__received_chunks = 0
+        self.__query_start = time.perf_counter()
+        self.cancelButton.setEnabled(True)
+        self.combo.setEnabled(False)
+        self.query_timer.start(100)
+
+        thread.start()
+
+    @property
+    def query_running(self):
+        """
+        Whether a query is running or waiting to be executed.
+        """
+        return self.__query_worker is not None
+
+    def call_when_idle(self, callback):
+        """
+        Call `callback` once all running and pending queries finished,
+        or at once if no query is running.
+        """
+        if self.query_running:
+            self.__idle_callbacks.append(callback)
+        else:
+            callback()
+
+    def cancel_query(self):
+        if self.__query_worker is not None:
+            self.__query_worker.cancel()
+
+    def __query_finished(self):
+        worker, callback = self.__query_worker, self.__query_callback
+        self.__query_thread.quit()
+        self.__query_thread.wait()
+
+        self.query_timer.stop()
+        self.cancelButton.setEnabled(False)
+        self.combo.setEnabled(True)
+        self.__query_worker = None
+        self.__query_thread = None
+        self.__query_callback = None
+        self.query_cancelled = worker.cancelled
+        self.query_error = worker.exception
+        self.__update_query_status(done=True, cancelled=worker.cancelled)
+
+        df = None
+        if worker.cancelled:
+            self.log.info('SQL query was cancelled')
+        elif worker.exception is not None:
+            if callback is None:
+                self.log.error(str(worker.exception))
+        else:
+            if self.__received_chunks == 0:
+                # Query yielded no rows; still show its columns.
+                empty = worker.empty_result
+                self.display_dataframe(empty if empty is not None else pd.DataFrame())
+            df = self.table.model().df
+
+        if callback is not None:
+            callback(df)
+        self.queryFinished.emit(df)
+
+        if self.__pending_query is not None:
+            sql_query, callback = self.__pending_query
+            self.__pending_query = None
+            self.run_query(sql_query, callback)
+        else:
+            callbacks, self.__idle_callbacks = self.__idle_callbacks, []
+            for callback in callbacks:
+                callback()
+
+    def __receive_chunk(self, df):
+        if self.__received_chunks == 0:
+            self.display_dataframe(df)
+        else:
+            self.append_dataframe(df)
+        self.__received_chunks += 1
+
+    def __update_query_status(self, done=False, cancelled=False):
+        elapsed = time.perf_counter() - self.__query_start
+        model = self.table.model()
+        rows = model.rowCount() if self.__received_chunks > 0 else 0
+        if cancelled:
+            state = 'Cancelled after'
+        elif done:
+            state = 'Finished in'
+        else:
+            state = 'Running for'
+        self.queryStatus.setText(f'{state} {elapsed:.1f} s, {rows} rows')
 
-        return df
+    def set_custom_sql(self, sql_query, callback=None):
+        """
+        Run the given query and display its results as the "SQL" entry.
+
+        Parameters
+        ----------
+        sql_query : str
+        callback : callable, optional
+            Called like the callback of `run_query`.
+        """
+        def finished(df):
+            if df is not None:
+                self.__sql_query = sql_query
+                # The results are displayed already; do not trigger another query.
+                self.combo.blockSignals(True)
+                self.combo.setCurrentIndex(self.__sql_idx)
+                self.combo.blockSignals(False)
+            if callback is not None:
+                callback(df)
+
+        self.run_query(sql_query, finished)
 
     def get_custom_sql(self):
         return self.__sql_query
 
     def load_dataframe(self, df):
         self.__sql_query = None
+        self.combo.blockSignals(True)
         self.combo.setCurrentIndex(self.__sql_idx)
+        self.combo.blockSignals(False)
         self.display_dataframe(df)
 
 
+class QueryWorker(QtCore.QObject):
+    """
+    Worker executing an SQL query and emitting its results in chunks.
+
+    After `finished` was emitted, `exception` holds the raised exception
+    (if any) and `cancelled` whether the query was cancelled.
+    """
+    finished = QtCore.pyqtSignal()
+    chunk = QtCore.pyqtSignal(object)
+
+    chunksize = 5000
+
+    def __init__(self, sql_query, connection):
+        super().__init__()
+        self.sql_query = sql_query
+        self.connection = connection
+        self.exception = None
+        self.empty_result = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Interrupting is thread-safe and stops a running statement at once.
+        self.connection.interrupt()
+
+    def run(self):
+        try:
+            with data.cancellable(self.connection, self._cancelled.is_set):
+                chunks = data.query_sql_chunks(self.sql_query, self.connection,
+                                               chunksize=self.chunksize)
+                for df in chunks:
+                    if len(df.index) == 0:
+                        # Keep the columns of queries without any rows.
+                        if self.empty_result is None:
+                            self.empty_result = df
+                        continue
+                    self.chunk.emit(df)
+        except Exception as e:
+            if not self.cancelled:
+                self.exception = e
+        finally:
+            self.finished.emit()
+
+
 class DatabaseLayoutWidget(QtWidgets.QWidget):
 
     def __init__(self, qmainwindow, filepath_db, log):
@@ -216,18 +465,54 @@ class DatabaseLayoutWidget(QtWidgets.QWidget):
 
         self.filepath_db = filepath
         self.sql_tabs.set_db_filepath(filepath)
-        self.__conn = data.connect(self.filepath_db)
+        # Queries are executed in a worker thread of the data view.
+        self.__conn = data.connect(self.filepath_db, check_same_thread=False)
         self.pandas_dataview.set_connection(self.__conn)
 
     def connectDatabaseFromCsv(self, filepath, delimiter=','):
+        """
+        Creates an in-memory database from the given file.
+        The file is imported in a separate thread, showing the progress
+        in a dialog from which the import can be cancelled.
+        """
         self.log.info('Creating in memory database from  %s', filepath)
-        df = pd.read_csv(filepath, delimiter=delimiter)
         table_name = pathlib.Path(filepath).stem
-
+        # The connection is filled in the import thread and handed over to
+        # the GUI thread afterwards; it is never used by both at once.
+        # It only replaces the shared connection once the import succeeded.
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+
+        self.csv_progress = QtWidgets.QProgressDialog(
+            f'Importing {pathlib.Path(filepath).name}...', 'Cancel', 0, 100, self)
+        self.csv_progress.setWindowModality(QtCore.Qt.WindowModal)
+        self.csv_progress.setMinimumDuration(500)
+
+        self.csv_thread = QtCore.QThread()
+        self.csv_worker = CsvImporter(filepath, conn, table_name, delimiter)
+        self.csv_worker.moveToThread(self.csv_thread)
+        self.csv_thread.started.connect(self.csv_worker.run)
+
+        self.csv_worker.progress.connect(self.csv_progress.setValue)
+        self.csv_worker.error.connect(self.log.error)
+        # Not a slot of the worker, so it is called directly from the GUI
+        # thread while the worker thread is busy importing.
+        self.csv_progress.canceled.connect(lambda: self.csv_worker.cancel())
+
+        self.csv_worker.success.connect(
+            lambda: self._connectImportedCsv(filepath, conn, table_name))
+
+        self.csv_worker.finished.connect(self.csv_progress.reset)
+        self.csv_worker.finished.connect(self.csv_thread.quit)
+        self.csv_worker.finished.connect(self.csv_worker.deleteLater)
+        self.csv_thread.finished.connect(self.csv_thread.deleteLater)
+
+        self.csv_thread.start()
+
+    def _connectImportedCsv(self, filepath, conn, table_name):
         self.filepath_db = filepath
         self.sql_tabs.set_db_filepath(filepath)
-        self.__conn = data.connect(':memory:')
-        df.to_sql(table_name, self.__conn, index=False)
+        self.__conn = conn
+        data.db_conn = conn
 
         self.pandas_dataview.set_connection(self.__conn)
 
@@ -237,29 +522,30 @@ class DatabaseLayoutWidget(QtWidgets.QWidget):
         self.displaySql(query)
 
     def displaySql(self, sql_query=None, f_id=None, l_id=None):
+        self.pandas_dataview.set_custom_sql(
+            sql_query, lambda sql_df: self._sqlDisplayed(sql_df, f_id, l_id))
 
-        try:
-            sql_df = self.pandas_dataview.set_custom_sql(sql_query)
-
-            if sql_df is not None:
-                self.sql_df = sql_df
+    def _sqlDisplayed(self, sql_df, f_id, l_id):
+        error = self.pandas_dataview.query_error
 
-                self.features_id = f_id
-                self.labels_id = l_id
+        if sql_df is not None:
+            self.sql_df = sql_df
 
-                self.qmainwindow.sql_df = self.sql_df
+            self.features_id = f_id
+            self.labels_id = l_id
 
-                # TODO: better way to do access the method
-                self.qmainwindow.settings.simple_tab.refresh_labels()
-                self.qmainwindow.prediction.refresh_labels()
-                self.qmainwindow.settings.simple_tab.trainButton.setEnabled(True)
-            else:
-                self.log.info('Data has been inserted successfully')
-                cb_index = self.pandas_dataview.combo.currentIndex()
-                self.pandas_dataview.selection_changed(cb_index)
+            self.qmainwindow.sql_df = self.sql_df
 
-        except (DatabaseError, TypeError) as e:
-            self.log.error(str(e))
+            # TODO: better way to do access the method
+            self.qmainwindow.settings.simple_tab.refresh_labels()
+            self.qmainwindow.prediction.refresh_labels()
+            self.qmainwindow.settings.simple_tab.trainButton.setEnabled(True)
+        elif error is not None and not isinstance(error, TypeError):
+            self.log.error(str(error))
+        elif not self.pandas_dataview.query_cancelled:
+            self.log.info('Data has been inserted successfully')
+            cb_index = self.pandas_dataview.combo.currentIndex()
+            self.pandas_dataview.selection_changed(cb_index)
 
     def displayDataframe(self, df):
         self.sql_df = df
@@ -313,5 +599,46 @@ class DatabaseLayoutWidget(QtWidgets.QWidget):
             delimiter = dialog.get_delim()
             self.connectDatabaseFromCsv(file_path, delimiter)
 
+        elif file_extension.lower() in data.COLUMNAR_FORMATS:
+            self.displayDataframe(data.read_columnar(file_path))
+            self.qmainwindow.settings.simple_tab.trainButton.setEnabled(True)
+
         else:
             self.log.error(f'{file_extension} is not supported.')
+
+
+class CsvImporter(QtCore.QObject):
+    """
+    Worker importing a delimiter separated file into a database table
+    via `rapp.data.load_csv`.
+    """
+    finished = QtCore.pyqtSignal()
+    success = QtCore.pyqtSignal()
+    progress = QtCore.pyqtSignal(int)
+    error = QtCore.pyqtSignal(str)
+
+    def __init__(self, filepath, connection, table_name, delimiter=','):
+        super().__init__()
+        self.filepath = filepath
+        self.connection = connection
+        self.table_name = table_name
+        self.delimiter = delimiter
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            data.load_csv(self.filepath, self.connection, self.table_name,
+                          delimiter=self.delimiter,
+                          progress=lambda f: self.progress.emit(int(100 * f)),
+                          cancelled=self._cancelled.is_set)
+        except data.IngestCancelled:
+            self.error.emit(f'Import of {self.filepath} was cancelled')
+        except Exception as e:
+            self.error.emit(str(e))
+        else:
+            self.success.emit()
+        finally:
+            self.finished.emit()
@@ -153,7 +153,10 @@ class MenuBar(QtWidgets.QMenuBar):
 
         # load required settings
 
-        self.databaseLayoutWidget.connectDatabase(os.path.normpath(cf.filename))
+        if cf.data_file is not None:
+            self.databaseLayoutWidget.open_data_file(os.path.normpath(cf.data_file))
+        else:
+            self.databaseLayoutWidget.connectDatabase(os.path.normpath(cf.filename))
 
         self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbType.setCurrentText(cf.type.capitalize())
 
@@ -173,19 +176,22 @@ class MenuBar(QtWidgets.QMenuBar):
             self.databaseLayoutWidget.sql_tabs.targetSelect.setCurrentText(cf.labels_id)
             self.databaseLayoutWidget.sql_tabs.load_selected_sql_template()
 
-        # load optional settings
+        # load optional settings once the data has been queried
         # TODO: Better way to access MLTab attributes
-        if hasattr(cf, 'label_name'):
-            self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbName.setCurrentText(cf.label_name)
+        def load_optional_settings():
+            if hasattr(cf, 'label_name'):
+                self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbName.setCurrentText(cf.label_name)
+
+            if hasattr(cf, 'sensitive_attributes'):
+                self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbSAttributes.check_items(cf.sensitive_attributes)
 
-        if hasattr(cf, 'sensitive_attributes'):
-            self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbSAttributes.check_items(cf.sensitive_attributes)
+            if hasattr(cf, 'report_path'):
+                self.databaseLayoutWidget.qmainwindow.settings.simple_tab.lePath.setText(cf.report_path)
 
-        if hasattr(cf, 'report_path'):
-            self.databaseLayoutWidget.qmainwindow.settings.simple_tab.lePath.setText(cf.report_path)
+            if hasattr(cf, 'estimators'):
+                self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbEstimator.check_items(cf.estimators)
 
-        if hasattr(cf, 'estimators'):
-            self.databaseLayoutWidget.qmainwindow.settings.simple_tab.cbEstimator.check_items(cf.estimators)
+        self.databaseLayoutWidget.pandas_dataview.call_when_idle(load_optional_settings)
 
     def saveConfigurationFile(self):
         cf = self.databaseLayoutWidget.qmainwindow.settings.simple_tab.parse_settings()
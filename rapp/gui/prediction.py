@@ -94,18 +94,19 @@ class PredictionWidget(QtWidgets.QWidget):
         if len(self.loadModelView.loadedModels) == 0:
             log.error(f"No models to predict with")
             return
-        # preprocess df based on currently loaded data
+        # preprocess df based on currently loaded data, for models saved without their preprocessor
         X = preprocess_data(data_df, data_df.select_dtypes(exclude=["number"]).columns)
 
         # if no index is selected the whole df is passed for prediction
         if len(selected_indexes) > 0:
             selected = [selected_index.row() for selected_index in selected_indexes]
             X = X.iloc[selected]
+            data_df = data_df.iloc[selected]
             log.debug(f"Student No. {selected} selected.")
             log.debug(f"Student's features: \n {X}")
 
         try:
-            self.loadModelView.predict(X)
+            self.loadModelView.predict(X, data_df)
         except Exception as e:
             log.error(traceback.format_exc())
             traceback.print_exc()
@@ -120,6 +121,7 @@ class PredictionWidget(QtWidgets.QWidget):
         The model file can be a trained estimator, or a dictionary with the form:
 
         {'model' : trained estimator,
+        'preprocessor': rapp.pipeline.Preprocessor fitted on the train data,
         'studies_id': studies_id of train data,
         'features_id': features_id of train data,
         'labels_id': predicting label_id of the model,
@@ -159,15 +161,21 @@ class PredictionWidget(QtWidgets.QWidget):
                             log.warning("The data has been updated; Ensure that the loaded models are still compatible.")
 
             estimator = model['model']
+            preprocessor = model.get('preprocessor')
 
         else:
             estimator = model
+            preprocessor = None
 
-        df = self.qmainwindow.databasePredictionLayoutWidget.get_current_df()
-        pos_targets = df.columns.tolist()
+        def load_model():
+            df = self.qmainwindow.databasePredictionLayoutWidget.get_current_df()
+            pos_targets = df.columns.tolist()
 
-        self.loadModelView.load_model(estimator, model_name, pos_targets)
-        self.loadModelView.update_labels(pos_targets)
+            self.loadModelView.load_model(estimator, model_name, pos_targets, preprocessor)
+            self.loadModelView.update_labels(pos_targets)
+
+        # The data of updated templates is still being queried.
+        self.qmainwindow.databasePredictionLayoutWidget.pandas_dataview.call_when_idle(load_model)
 
     def showLoadModelDialog(self):
         options = QtWidgets.QFileDialog.Options()
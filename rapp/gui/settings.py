@@ -101,6 +101,7 @@ class SimpleSettings(QtWidgets.QWidget):
         The Model is saved in a dictionary as a .joblib file
 
         {'model' : trained estimator,
+        'preprocessor': rapp.pipeline.Preprocessor fitted on the train data,
         'studies_id': studies_id of train data,
         'features_id': features_id of train data,
         'labels_id': predicting label_id of the model,
@@ -125,13 +126,20 @@ class SimpleSettings(QtWidgets.QWidget):
 
         file_name += self.cbModels.currentText()
 
+        model = list(self.pipeline.fairness_results.keys())[model_idx]
+        preprocessor = getattr(self.pipeline, 'preprocessor', None)
+
         if model_dict.get("uses_templates", None) is not None:
-            model_dict['model'] = list(self.pipeline.fairness_results.keys())[model_idx]
+            model_dict['model'] = model
+            model_dict['preprocessor'] = preprocessor
 
             model_file = model_dict
 
+        elif preprocessor is not None:
+            model_file = {'model': model, 'preprocessor': preprocessor}
+
         else:
-            model_file = list(self.pipeline.fairness_results.keys())[model_idx]
+            model_file = model
 
         options = QtWidgets.QFileDialog.Options()
         options |= QtWidgets.QFileDialog.DontUseNativeDialog
@@ -69,18 +69,26 @@ class SQLWidget(QtWidgets.QWidget):
         self.featuresSelect.clear()
         self.targetSelect.clear()
         # setup path
-        dirs_feats = sqlbuilder.list_available_features()
-        dirs_labels = sqlbuilder.list_available_labels()
+        catalog = sqlbuilder.template_catalog()
+        db_name = sqlbuilder._LOADEDDB
+        feats = catalog.templates('features', db_name)
+        labels = catalog.templates('labels', db_name)
 
         self.featuresSelect.addItem("")
-        for feat_id in dirs_feats:
+        for feat_id in sorted(feats):
             self.log.debug(f"Adding feature '{feat_id}' to SQL templates")
-            self.featuresSelect.addItem(feat_id)
+            self.__add_template_option(self.featuresSelect, feats[feat_id])
 
         self.targetSelect.addItem("")
-        for label_id in dirs_labels:
+        for label_id in sorted(labels):
             self.log.debug(f"Adding label '{label_id}' to SQL templates")
-            self.targetSelect.addItem(label_id)
+            self.__add_template_option(self.targetSelect, labels[label_id])
+
+    def __add_template_option(self, combo_box, info):
+        combo_box.addItem(info.id)
+        combo_box.setItemData(combo_box.count() - 1,
+                              ', '.join(info.columns),
+                              QtCore.Qt.ToolTipRole)
 
     def __init_advanced_tab(self):
         self.sql_field = QtWidgets.QPlainTextEdit()
@@ -232,7 +240,8 @@ class SQLWidget(QtWidgets.QWidget):
             return
 
         # Display the queried template in the advanced tab
-        sql = load_sql(f_id, l_id)
+        sql = sqlbuilder.inline_parameters(load_sql(f_id, l_id),
+                                           sqlbuilder.load_parameters(f_id, l_id))
         self.sql_field.setPlainText(sql)
 
         # Load the data
@@ -3,6 +3,7 @@ from PyQt5 import QtWidgets, QtGui, QtCore
 from scipy.stats import stats
 
 from rapp.gui.helper import IdButton
+from rapp.pipeline import design_matrix
 
 
 class LoadModelView(QtWidgets.QWidget):
@@ -81,7 +82,7 @@ class LoadModelView(QtWidgets.QWidget):
         self.main_layout.addWidget(self.defaultTextLabel)
         self.main_layout.setAlignment(QtCore.Qt.AlignCenter)
 
-    def load_model(self, model, model_name, labels):
+    def load_model(self, model, model_name, labels, preprocessor=None):
         index = len(self.loadedModels)
 
         # first model is loaded
@@ -94,7 +95,8 @@ class LoadModelView(QtWidgets.QWidget):
             self.main_layout.setAlignment(QtCore.Qt.AlignTop)
 
         # create model widget
-        widget = LoadedModelWidget(model, model_name, labels, index, pred_labels=self.prediction)
+        widget = LoadedModelWidget(model, model_name, labels, index, pred_labels=self.prediction,
+                                   preprocessor=preprocessor)
         widget.removeButton.set_click_function(self._remove_model)
 
         # add to layout
@@ -103,7 +105,7 @@ class LoadModelView(QtWidgets.QWidget):
         self.predVBoxLayout.addWidget(widget)
         self.predVBoxLayout.addItem(self.stretch_models)
 
-    def predict(self, data):
+    def predict(self, data, raw_data=None):
         self._clear_ensemble_labels()
         # add pred headers
         self.headersLayout.addItem(self.predStretch)
@@ -113,7 +115,7 @@ class LoadModelView(QtWidgets.QWidget):
         self.prediction = True
         ensemble = {}
         for model in self.loadedModels:
-            model.predict(data)
+            model.predict(data, raw_data)
 
             # ensemble learning
             target = model.cbTarget.currentText()
@@ -233,12 +235,16 @@ class LoadedModelWidget(QtWidgets.QWidget):
 
     pred_labels: bool , default=False
         specifies if the pred and proba labels are displayed.
+
+    preprocessor: rapp.pipeline.Preprocessor, default=None
+        preprocessor fitted with the model, which prepares the raw data for prediction.
     """
 
-    def __init__(self, model, file_name, labels, index, pred_labels=False):
+    def __init__(self, model, file_name, labels, index, pred_labels=False, preprocessor=None):
         super(LoadedModelWidget, self).__init__()
 
         self.model = model
+        self.preprocessor = preprocessor
         self.index = index
 
         self.mainHBoxLayout = QtWidgets.QHBoxLayout()
@@ -286,7 +292,11 @@ class LoadedModelWidget(QtWidgets.QWidget):
 
         self.setLayout(self.mainHBoxLayout)
 
-    def _prepare_data(self, df):
+    def _prepare_data(self, df, raw_df=None):
+        # the preprocessor only selects the columns the model was trained on
+        if self.preprocessor is not None and raw_df is not None:
+            return design_matrix(self.preprocessor.transform(raw_df), self.model)
+
         # drop target column
         target = self.cbTarget.currentText()
 
@@ -296,10 +306,10 @@ class LoadedModelWidget(QtWidgets.QWidget):
 
         return df.to_numpy()
 
-    def predict(self, df):
+    def predict(self, df, raw_df=None):
         self._clear_prediction()
 
-        X = self._prepare_data(df)
+        X = self._prepare_data(df, raw_df)
 
         # TODO: What happens if multiple rows are selected?
         # Classification
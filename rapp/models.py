@@ -3,6 +3,8 @@ Organisation of usecases and methods for different ML models.
 The necessary functions are determined by the respective getters.
 """
 
+import numpy as np
+
 # ML classifiers
 from numpy import mod
 from sklearn.ensemble import RandomForestClassifier
@@ -21,52 +23,97 @@ from sklearn.kernel_ridge import KernelRidge
 from sklearn.neural_network import MLPRegressor
 
 # Dispatch information about how models are called and which methods are used.
+# `sparse` states whether a model can be fitted on a sparse design matrix,
+# `float32` whether it computes in single precision (trees do so internally,
+# all other models convert their input to float64).
 models = {
     'classification': {
         'RF': {'class': RandomForestClassifier,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True,
+               'float32': True
                },
         'DT': {'class': DecisionTreeClassifier,
                'kwargs': {'random_state': 0,
-                          'class_weight': 'balanced'}
+                          'class_weight': 'balanced'},
+               'sparse': True,
+               'float32': True
                },
         'SVM': {'class': SVC,
                 'kwargs': {'random_state': 0,
-                           'probability': True}
+                           'probability': True},
+                'sparse': True
                 },
         'NB': {'class': GaussianNB,
-               'kwargs': {}
+               'kwargs': {},
+               'sparse': False
                },
         'LR': {'class': LogisticRegression,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True
                },
         'NN': {'class': MLPClassifier,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True
                },
     },
     'regression': {
         'EL': {'class': ElasticNet,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True
                },
         'LR': {'class': LinearRegression,
-               'kwargs': {}
+               'kwargs': {},
+               'sparse': True
                },
         'BR': {'class': BayesianRidge,
-               'kwargs': {}
+               'kwargs': {},
+               'sparse': False
                },
         'DT': {'class': DecisionTreeRegressor,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True,
+               'float32': True
                },
         'KR': {'class': KernelRidge,
-               'kwargs': {}
+               'kwargs': {},
+               'sparse': True
                },
         'NN': {'class': MLPRegressor,
-               'kwargs': {'random_state': 0}
+               'kwargs': {'random_state': 0},
+               'sparse': True
                },
     }
 }
 
 
+def accepts_sparse(estimator):
+    """
+    Returns whether the given estimator can be fitted on a sparse matrix.
+    Unknown estimators are assumed to require dense input.
+    """
+    return _model_info(estimator).get('sparse', False)
+
+
+def input_dtype(estimator):
+    """
+    Returns the floating point type the given estimator computes with,
+    so that its design matrix is not converted again on every call.
+    Unknown estimators are assumed to compute with float64.
+    """
+    if _model_info(estimator).get('float32', False):
+        return np.float32
+    return np.float64
+
+
+def _model_info(estimator):
+    for mode_models in models.values():
+        for model_info in mode_models.values():
+            if type(estimator) is model_info['class']:
+                return model_info
+    return {}
+
+
 def get(model_id, **model_args):
     """
     Returns a classification model object for a given `model_id`.
@@ -36,6 +36,14 @@ class RappConfigParser(object):
 
         # Double Check that the SQL-information was given correctly.
         has_arg = lambda arg: parsed.__dict__[arg] is not None  # Helper fun.
+
+        # A columnar data file replaces the database and its SQL settings.
+        if has_arg('data_file'):
+            return parsed
+        if not has_arg('filename'):
+            self.parser.error("one of the arguments -f/--filename "
+                              "-df/--data_file is required")
+
         uses_templating = (has_arg('studies_id') or
                            has_arg('features_id') or
                            has_arg('labels_id'))
@@ -64,9 +72,27 @@ class RappConfigParser(object):
                    is_config_file=True, help='config file path')
 
         # methodical settings
+        # Either --filename or --data_file is required.
         parser.add_argument('-f', '--filename', type=str,
                             help='Location of the .db file.',
-                            required=True)
+                            required=False)
+        parser.add_argument('--databases', type=str, nargs='+', default=[],
+                            help='Further .db files with the same schema, e.g. '
+                            'one per export year. The query is run against '
+                            'filename and each of them and the rows are tagged '
+                            'with their database in the column Datenbank.',
+                            required=False)
+        parser.add_argument('--attach', type=str, default='False',
+                            choices=['True', 'False'],
+                            help='Boolean value whether the databases are attached '
+                            'to a single connection instead of being queried in '
+                            'parallel. Requires matching schemas. Default: False',
+                            required=False)
+        parser.add_argument('-df', '--data_file', type=str,
+                            help='Location of a columnar data file '
+                            '(.parquet, .feather, or .npy) to use instead of '
+                            'a database and SQL query.',
+                            required=False)
 
         # The SQL settings need to be manually be cross-checked that they
         # are correctly assessed.
@@ -98,6 +124,85 @@ class RappConfigParser(object):
                             help='Column name of the prediction label.',
                             required=False)
 
+        parser.add_argument('--chunksize', type=int, default=None,
+                            help='Load the SQL results in chunks of this many rows '
+                            'to reduce peak memory. Default: load all at once.',
+                            required=False)
+
+        parser.add_argument('--cache_dir', type=str, default=None,
+                            help='Directory for caching SQL query results between runs. '
+                            'Default: no caching.',
+                            required=False)
+
+        parser.add_argument('--incremental', type=str, default='False',
+                            choices=['True', 'False'],
+                            help='Boolean value whether results in the cache_dir '
+                            'are refreshed incrementally for students with new '
+                            'records. Queries other than the templates have to '
+                            'return the Pseudonym. Default: False',
+                            required=False)
+        parser.add_argument('--feature_store', type=str, default=None,
+                            help='Directory in which the results of the feature '
+                            'templates are stored per student and joined to the '
+                            'labels. Default: no feature store.',
+                            required=False)
+        parser.add_argument('--telemetry', type=str, default='False',
+                            choices=['True', 'False'],
+                            help='Boolean value whether duration, rows and size of '
+                            'all SQL queries are recorded and summarised at the '
+                            'end of the run. Default: False',
+                            required=False)
+        parser.add_argument('--slow_query_threshold', type=float, default=None,
+                            help='Queries taking at least this many seconds are '
+                            'reported as slow. Default: None',
+                            required=False)
+        parser.add_argument('--query_log', type=str, default=None,
+                            help='SQLite database to which slow queries are logged. '
+                            'Default: None',
+                            required=False)
+        parser.add_argument('--sparse', type=str, default='False',
+                            choices=['True', 'False'],
+                            help='Boolean value whether categorical columns are '
+                            'one-hot encoded sparsely. Estimators which accept '
+                            'sparse input are trained on a sparse matrix. '
+                            'Default: False',
+                            required=False)
+        parser.add_argument('--split', type=str, default='random',
+                            choices=['random', 'stratified', 'group', 'hash'],
+                            help='How the data is split into training and test '
+                            'set: randomly, stratified by the label, keeping '
+                            'the rows of each group_column in one set, or '
+                            'assigning each group by a hash of its group_column '
+                            'value, so that the sets stay the same when data '
+                            'is added. Default: random',
+                            required=False)
+        parser.add_argument('--group_column', type=str, default='Pseudonym',
+                            help='Column identifying the groups of a group-aware '
+                            'or hash split. It is not used for training. '
+                            'Default: Pseudonym',
+                            required=False)
+        parser.add_argument('--compact_dtypes', type=str, default='True',
+                            choices=['True', 'False'],
+                            help='Boolean value whether loaded columns are converted '
+                            'into compact data types. Default: True',
+                            required=False)
+        parser.add_argument('--compact_floats', type=str, default='False',
+                            choices=['True', 'False'],
+                            help='Boolean value whether compact_dtypes also stores '
+                            'float columns with single precision. Default: False',
+                            required=False)
+        parser.add_argument('--statistics_file', type=str, default=None,
+                            help='File (.db or columnar format) to which the labels '
+                            'and protected attributes of each set are written to '
+                            'calculate the classification statistics with GROUP BY. '
+                            'Default: statistics are calculated in memory.',
+                            required=False)
+
+        parser.add_argument('--sql_parameters', nargs='+',
+                            help='Values for the parameters of the SQL '
+                            'templates in the form name=value.',
+                            required=False, default=[])
+
         parser.add_argument('-c', '--categorical', nargs='+',
                             help='List of categorical columns.',
                             required=False, default=[])
@@ -1,4 +1,11 @@
+import contextlib
+import copy
+import itertools
 import logging
+import os
+import re
+import sqlite3
+from collections.abc import Mapping
 
 # classification metrics
 from sklearn.metrics import accuracy_score
@@ -16,11 +23,15 @@ from sklearn.metrics import mean_squared_error
 from sklearn.metrics import r2_score
 # evaluation
 from sklearn.model_selection import cross_validate
+from sklearn.model_selection import GroupShuffleSplit
 from sklearn.model_selection import train_test_split
+import numpy as np
 import pandas as pd
+import scipy.sparse
 
 import rapp.fair.regression
 from rapp import sqlbuilder
+from rapp import featurestore
 from rapp import models
 from rapp import data as db
 from rapp.fair import notions
@@ -43,6 +54,10 @@ class Pipeline:
          "test": {"X": Dataframe, "y": Dataframe, "z": Dataframe}}
         ```
 
+    preprocessor : Preprocessor
+        Encoding of the categorical columns, fitted on the training set.
+        It prepares new data, e.g. for prediction, in the layout of X.
+
     database_file : str
         Path/Name of the used database file.
 
@@ -144,10 +159,15 @@ class Pipeline:
         self.type = config.type
         self.estimators = _parse_estimators(config.estimators, self.type)
 
-        if config.filename is not None:
+        if getattr(config, 'data_file', None) is not None:
+            self.data_file = config.data_file
+            self.data = self.prepare_data_from_file()
+        elif config.filename is not None:
             self.database_file = config.filename
             self.sql_query = _load_sql_query(config)
-            self.data = self.prepare_data()
+            self.sql_parameters = _load_sql_parameters(config)
+            with db.query_template(_template_id(config)):
+                self.data = self.prepare_data()
         else:
             self.data = self.prepare_data_from_df(config.sql_df)
 
@@ -176,16 +196,92 @@ class Pipeline:
             self.fairness_functions = {}
 
     def prepare_data(self):
-        log.debug('Connecting to db %s', self.database_file)
-        con = db.connect(self.database_file)
-
-        log.debug('Loading SQL query', self.database_file)
-        df = db.query_sql(self.sql_query, con)
-
-        return _load_test_split_from_dataframe(df, self.config)
+        cache_dir = getattr(self.config, 'cache_dir', None)
+        incremental = getattr(self.config, 'incremental', 'False') == 'True'
+        feature_store = getattr(self.config, 'feature_store', None)
+        df = None
+        if feature_store and _uses_templates(self.config):
+            df = self._join_feature_store(feature_store)
+        if df is not None:
+            df = df[_needed_columns(list(df.columns), self.config)]
+        elif cache_dir and incremental:
+            delta_cache = db.DeltaCache(cache_dir)
+            df = delta_cache.query(self.sql_query, self.database_file,
+                                   params=self.sql_parameters)
+            df = df[_needed_columns(list(df.columns), self.config)]
+        elif getattr(self.config, 'databases', None):
+            df = self._read_databases()
+        else:
+            self.sql_query = self._project_query(self.sql_query)
+            df = _read_sql(self.database_file, self.sql_query, self.config,
+                           self.sql_parameters)
+
+        if getattr(self.config, 'compact_dtypes', 'True') == 'True':
+            with db.pooled_connection(self.database_file) as con:
+                declared_types = db.query_column_types(
+                    self.sql_query, con, self.sql_parameters)
+            df = db.compact_dtypes(
+                df, declared_types, exclude=[_label_column(df, self.config)],
+                downcast_floats=getattr(self.config, 'compact_floats',
+                                        'False') == 'True')
+
+        data, self.preprocessor = _split_dataframe(df, self.config)
+        return data
+
+    def _join_feature_store(self, store_dir):
+        """
+        Join the stored features to the label of the configuration, or
+        return None if the label changes the rows of the features.
+        """
+        store = featurestore.get_feature_store(store_dir)
+        try:
+            return store.join_labels(self.database_file,
+                                     f"{self.config.studies_id}_"
+                                     f"{self.config.features_id}",
+                                     self.config.labels_id,
+                                     params=self.sql_parameters,
+                                     key=_template_key(self.config) is not None)
+        except ValueError as e:
+            log.info("%s; not using the feature store", e)
+            return None
+
+    def _project_query(self, sql_query):
+        """
+        Push the column selection of the configuration into the query
+        so that columns which are ignored anyway are never loaded.
+        """
+        with db.pooled_connection(self.database_file) as con:
+            columns = db.query_columns(sql_query, con, self.sql_parameters)
+        needed = _needed_columns(columns, self.config)
+        if needed == columns:
+            return sql_query
+        log.debug('Projecting query onto columns %s', needed)
+        return sqlbuilder.project_columns(sql_query, needed)
+
+    def _read_databases(self):
+        """
+        Run the query against `filename` and all further `databases`.
+        """
+        db_paths = [self.database_file] + list(self.config.databases)
+        self.sql_query = self._project_query(self.sql_query)
+        df = db.query_databases(
+            db_paths, self.sql_query, self.sql_parameters,
+            attach=getattr(self.config, 'attach', 'False') == 'True')
+        # The column Datenbank is only added here, after the projection.
+        return df[_needed_columns(list(df.columns), self.config)]
+
+    def prepare_data_from_file(self):
+        columns = _needed_columns(db.columnar_columns(self.data_file),
+                                  self.config)
+        log.debug('Loading columns %s from %s', columns, self.data_file)
+        df = db.read_columnar(self.data_file, columns)
+        data, self.preprocessor = _split_dataframe(df, self.config)
+        return data
 
     def prepare_data_from_df(self, df):
-        return _load_test_split_from_dataframe(df, self.config)
+        df = df[_needed_columns(list(df.columns), self.config)]
+        data, self.preprocessor = _split_dataframe(df, self.config)
+        return data
 
     def get_data(self, mode):
         """
@@ -235,39 +331,457 @@ def _load_sql_query(config):
     else:
         feature_id = f"{config.studies_id}_{config.features_id}"
         label_id = config.labels_id
-        sql = sqlbuilder.load_sql(feature_id, label_id)
+        catalog = sqlbuilder.template_catalog()
+        for item_type, item_id in [('features', feature_id),
+                                   ('labels', label_id)]:
+            available = catalog.list(item_type, sqlbuilder._LOADEDDB)
+            if item_id not in available:
+                raise ValueError(f"Unknown {item_type} template '{item_id}'. "
+                                 f"Available: {', '.join(available)}")
+        sql = sqlbuilder.load_sql(feature_id, label_id,
+                                  key=_template_key(config) is not None)
 
     return sql
 
 
-def _load_test_split_from_dataframe(df, config, random_state=42):
+def _read_sql(database_file, sql_query, config, params=None):
+    """
+    Run `sql_query` on the database, using the query cache if configured.
+    """
+    cache_dir = getattr(config, 'cache_dir', None)
+    cache = db.get_query_cache(cache_dir) if cache_dir else None
+
+    df = None
+    if cache is not None:
+        df = cache.get(database_file, sql_query, params)
+        log.debug('Query cache: %s hits, %s misses', cache.hits, cache.misses)
+
+    if df is None:
+        log.debug('Connecting to db %s', database_file)
+        chunksize = getattr(config, 'chunksize', None)
+        with db.pooled_connection(database_file) as con:
+            log.debug('Loading SQL query from %s', database_file)
+            if chunksize:
+                chunks = db.query_sql_chunks(sql_query, con, chunksize,
+                                             params=params)
+                df = db.concat_chunks(chunks)
+            else:
+                df = db.query_sql(sql_query, con, params)
+        if cache is not None:
+            cache.put(database_file, sql_query, df, params)
+    return df
+
+
+def sweep_labels(config, labels_ids):
+    """
+    Create one pipeline per label for the features selected in `config`.
+    The features and all labels are loaded with a single combined query
+    (see `rapp.sqlbuilder.load_combined_sql`) that is sliced per label.
+    Labels which change the rows the features of some students are
+    aggregated over are loaded with their own query instead.
+
+    Parameters
+    ----------
+    config :
+        Pipeline configuration using the templating ids. Its `labels_id`
+        and `label_name` are replaced for each label.
+    labels_ids : list[str]
+
+    Returns
+    -------
+    dict
+        Maps each label id to its `Pipeline`.
+    """
+    features_id = f"{config.studies_id}_{config.features_id}"
+    pipelines = sweep_templates(config, [features_id], labels_ids)
+    return {labels_id: pipelines[(features_id, labels_id)]
+            for labels_id in labels_ids}
+
+
+def sweep_templates(config, features_ids, labels_ids, max_workers=4):
+    """
+    Create one pipeline per combination of feature and label templates.
+    Each feature template is loaded with a single combined query for all
+    labels (see `sweep_labels`), and these queries run concurrently.
+
+    Parameters
+    ----------
+    config :
+        Pipeline configuration. The templating ids and `label_name`
+        are replaced for each combination.
+    features_ids : list[str]
+        Ids of the feature templates, including the study prefix,
+        e.g. 'cs_first_term_grades'.
+    labels_ids : list[str]
+    max_workers : int, default = 4
+        Maximum number of queries running at the same time.
+
+    Returns
+    -------
+    dict
+        Maps each (features_id, labels_id) to its `Pipeline`.
+    """
+    overrides = _parse_sql_parameters(config)
+    key = _template_key(config) is not None
+
+    queries, labels = {}, {}
+    for features_id in features_ids:
+        sql_query, labels[features_id] = sqlbuilder.load_combined_sql(
+            features_id, labels_ids, key=key)
+        queries[(features_id, None)] = (sql_query, labels_ids)
+    results = _run_sweep_queries(config, queries, overrides, max_workers)
+
+    # Labels which change the rows the features of some students are
+    # aggregated over cannot be sliced from the combined result.
+    single = {}
+    for features_id in features_ids:
+        df = results[(features_id, None)]
+        for labels_id, label in labels[features_id].items():
+            if label.mask is not None and df[label.mask].isna().any():
+                log.info('Label %s changes the feature rows of some '
+                         'students, loading it on its own', labels_id)
+                single[(features_id, labels_id)] = (
+                    sqlbuilder.load_sql(features_id, labels_id, key=key),
+                    [labels_id])
+    results.update(_run_sweep_queries(config, single, overrides,
+                                      max_workers))
+
+    pipelines = {}
+    for features_id in features_ids:
+        for labels_id in labels_ids:
+            label_config = copy.copy(config)
+            label_config.studies_id, label_config.features_id = \
+                features_id.split('_', 1)
+            label_config.labels_id = labels_id
+            label_config.filename = None
+            if (features_id, labels_id) in results:
+                # The columns of the label follow those of the features.
+                df = results[(features_id, labels_id)]
+                label_config.label_name = df.columns[-1]
+                label_config.sql_df = df
+            else:
+                label = labels[features_id][labels_id]
+                label_config.label_name = label.names[-1]
+                label_config.sql_df = _slice_label(
+                    results[(features_id, None)], labels[features_id],
+                    labels_id)
+            pipelines[(features_id, labels_id)] = Pipeline(label_config)
+    return pipelines
+
+
+def _run_sweep_queries(config, queries, overrides, max_workers):
+    """
+    Run the queries of a sweep concurrently, using the query cache
+    if configured.
+
+    Parameters
+    ----------
+    queries : dict
+        Maps (features_id, labels_id or None for the combined query)
+        to the query and the ids of the labels it contains.
+
+    Returns
+    -------
+    dict
+        Maps the keys of `queries` to their results.
+    """
+    cache_dir = getattr(config, 'cache_dir', None)
+    cache = db.get_query_cache(cache_dir) if cache_dir else None
+
+    params, results = {}, {}
+    for key, (sql_query, query_labels) in queries.items():
+        params[key] = sqlbuilder.load_parameters(key[0], query_labels)
+        params[key].update(overrides)
+        params[key] = params[key] or None
+        if cache is not None:
+            results[key] = cache.get(config.filename, sql_query, params[key])
+
+    missing = [key for key in queries if results.get(key) is None]
+    timings = db.execute_queries(
+        config.filename, [(queries[key][0], params[key]) for key in missing],
+        max_workers=max_workers,
+        templates=[f"{f}/{labels_id or '+'.join(queries[(f, None)][1])}"
+                   for f, labels_id in missing])
+    for key, timing in zip(missing, timings):
+        log.info('Loaded %s in %.2f s', '/'.join(filter(None, key)),
+                 timing.seconds)
+        results[key] = timing.df
+        if cache is not None:
+            cache.put(config.filename, queries[key][0], timing.df,
+                      params[key])
+    return results
+
+
+def _slice_label(df, labels, labels_id):
+    """
+    Rows and columns of the combined result of
+    `rapp.sqlbuilder.load_combined_sql` which belong to `labels_id`.
+    """
+    label = labels[labels_id]
+    other = set()
+    for other_label in labels.values():
+        other.update(other_label.columns)
+        other.add(other_label.mask)
+
+    rows = df[label.mask] == 1 if label.mask is not None else slice(None)
+    features = [c for c in df.columns if c not in other]
+    df = df.loc[rows, features + label.columns].reset_index(drop=True)
+    return df.rename(columns=dict(zip(label.columns, label.names)))
+
+
+def _load_sql_parameters(config):
+    """
+    Values for the placeholders of the SQL query: the defaults of the
+    templates, overridden by the `sql_parameters` of the configuration.
+    """
+    params = {}
+    if _uses_templates(config):
+        feature_id = f"{config.studies_id}_{config.features_id}"
+        params = sqlbuilder.load_parameters(feature_id, config.labels_id)
+    params.update(_parse_sql_parameters(config))
+    return params or None
+
+
+def _template_id(config):
+    """
+    Identifier of the query of the configuration for the telemetry,
+    e.g. 'cs_first_term_grades/3_dropout' or the name of the SQL file.
+    """
+    if _uses_templates(config):
+        return f"{config.studies_id}_{config.features_id}/{config.labels_id}"
+    if getattr(config, 'sql_file', None) is not None:
+        return os.path.basename(config.sql_file)
+    return None
+
+
+def _uses_templates(config):
+    return (getattr(config, 'sql_file', None) is None
+            and getattr(config, 'sql_query', None) is None)
+
+
+def _template_key(config):
+    """
+    Column identifying the students which the SQL templates are loaded
+    with if the run needs it, i.e. for splitting by student or for
+    refreshing cached results incrementally. It is not used for training.
+    """
+    if not _uses_templates(config):
+        return None
+    incremental = (getattr(config, 'cache_dir', None) and
+                   getattr(config, 'incremental', 'False') == 'True')
+    if incremental or _group_column(config) == 'Pseudonym':
+        return 'Pseudonym'
+    return None
+
+
+def _parse_sql_parameters(config):
+    params = {}
+    for assignment in getattr(config, 'sql_parameters', None) or []:
+        name, sep, value = assignment.partition('=')
+        if not sep:
+            raise ValueError(f"SQL parameter '{assignment}' "
+                             "is not of the form name=value")
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        params[name.strip()] = value
+    return params
+
+
+def _needed_columns(columns, config):
+    """
+    Subset of the available `columns` which the run needs,
+    i.e. all columns except those listed in `config.ignore` and the key
+    of the templates. The label and sensitive attributes are always kept.
+    """
+    ignore = set(getattr(config, 'ignore', None) or [])
+    if _template_key(config) is not None:
+        ignore.add(_template_key(config))
+    keep = set(getattr(config, 'sensitive_attributes', None) or [])
+    # The column of a group-aware split is needed, but not trained on.
+    keep.add(_group_column(config))
+    label = getattr(config, 'label_name', None)
+    keep.add(label if label else columns[-1])
+    return [c for c in columns if c not in ignore or c in keep]
+
+
+def _label_column(df, config):
     # Convention: If no label name given, we use the last column.
-    label_col = (config.label_name
-                 if hasattr(config, 'label_name') and config.label_name
-                 else df.columns[-1])
+    return (config.label_name
+            if hasattr(config, 'label_name') and config.label_name
+            else df.columns[-1])
 
-    # create data
-    X = df.drop(label_col, axis=1, inplace=False)
-    y = df[[label_col]]
-    # TODO: What if sensitive_attributes is empty?
-    z = X[config.sensitive_attributes]
 
-    # Adapt to categorical data.
-    X = preprocess_data(X, config.categorical, label_col)
+def _load_test_split_from_dataframe(df, config, random_state=42):
+    return _split_dataframe(df, config, random_state)[0]
+
+
+def _split_dataframe(df, config, random_state=42):
+    """
+    Split the data into training and test set and encode the categorical
+    columns with a `Preprocessor` fitted on the training set.
+
+    The rows of both sets are gathered while encoding, so that no other
+    copy of the data is made, see `SplitData`.
+
+    Returns
+    -------
+    data : SplitData
+        The format of `Pipeline.data`.
+    preprocessor : Preprocessor
+    """
+    label_col = _label_column(df, config)
+    group_col = _group_column(config)
+    if group_col is not None and group_col not in df.columns:
+        raise ValueError(f"Column '{group_col}' for the group-aware split "
+                         "is missing")
+    features = [c for c in df.columns if c not in (label_col, group_col)]
 
     # split datasets
     # TODO: What about the random seed? Keep fixed or make RNG part of config?
-    split = train_test_split(X, y, z, train_size=0.8,
-                             random_state=random_state)
-    X_train, X_test, y_train, y_test, z_train, z_test = split
+    train, test = _split_indices(df, label_col, group_col,
+                                 getattr(config, 'split', 'random'),
+                                 random_state)
+    order = np.concatenate([train, test])
+
+    # Adapt to categorical data.
+    categorical = [c for c in config.categorical if c in features]
+    preprocessor = Preprocessor(
+        categorical, sparse=getattr(config, 'sparse', 'False') == 'True')
+    preprocessor.fit(df, rows=train, columns=features)
+    X = preprocessor.transform(df, rows=order)
+    y = df[[label_col]].iloc[order]
+    # TODO: What if sensitive_attributes is empty?
+    z = df[config.sensitive_attributes].iloc[order]
 
-    data = {"train": {"X": X_train, "y": y_train, "z": z_train},
-            "test": {"X": X_test, "y": y_test, "z": z_test}}
+    data = SplitData(X, y, z, {'train': len(train), 'test': len(test)})
+    log.debug('Splitting by index saved %.1f MB', data.bytes_saved / 2 ** 20)
+    return data, preprocessor
 
-    return data
 
+def _split_indices(df, label_col, group_col, split, random_state):
+    """
+    Positions of the rows of the training and the test set.
+
+    split : {'random', 'stratified', 'group', 'hash'}
+        'stratified' keeps the distribution of the label in both sets,
+        'group' keeps all rows with the same value in `group_col`,
+        e.g. of one student, in the same set. 'hash' does so as well,
+        but assigns each value by its hash instead of `random_state`,
+        so that the sets of existing values never change when rows are
+        added, see `_hash_split`.
+    """
+    if split == 'hash':
+        return _hash_split(df[group_col])
+    positions = np.arange(len(df))
+    if split == 'group':
+        splitter = GroupShuffleSplit(n_splits=1, train_size=0.8,
+                                     random_state=random_state)
+        return next(splitter.split(positions, groups=df[group_col]))
+    stratify = df[label_col].to_numpy() if split == 'stratified' else None
+    return train_test_split(positions, train_size=0.8,
+                            random_state=random_state, stratify=stratify)
+
+
+def _hash_split(groups, train_size=0.8):
+    # The values are hashed as strings, so that a group keeps its set
+    # regardless of the dtype the column is read with. Integral floats,
+    # e.g. IDs of a column with NULLs, are hashed like integers.
+    keys = groups.astype(str)
+    if pd.api.types.is_float_dtype(groups):
+        integral = groups.notna() & (groups % 1 == 0)
+        keys[integral] = groups[integral].astype('int64').astype(str)
+    hashes = pd.util.hash_array(keys.to_numpy(dtype=object))
+    # Map the upper 53 bits of the 64 bit hashes onto [0, 1).
+    in_train = (hashes >> np.uint64(11)) / 2 ** 53 < train_size
+    return np.flatnonzero(in_train), np.flatnonzero(~in_train)
+
+
+def _group_column(config):
+    if getattr(config, 'split', 'random') not in ('group', 'hash'):
+        return None
+    return getattr(config, 'group_column', None) or 'Pseudonym'
+
+
+class SplitData(Mapping):
+    """
+    Data of all modes, stored as one DataFrame each for X, y and z with
+    the rows of the modes one after another. The data of a mode is handed
+    out as slices of these frames, so splitting copies no data.
+
+    Maps each mode to a dictionary `{"X": ..., "y": ..., "z": ...}` like
+    the plain dictionaries `Pipeline.data` used to be.
+
+    Attributes
+    ----------
+    X, y, z : DataFrame
+        Features, labels and protected attributes of all modes.
+
+    bytes_saved : int
+        Size of the copies of the rows of each mode which a split into
+        separate DataFrames, e.g. by `train_test_split(X, y, z)`, makes.
+        The slices handed out here share the memory of X, y and z.
 
-def preprocess_data(X, categorical, label=None):
+    The NumPy input of the estimators is built once as well, see
+    `design_matrix` and `labels`.
+    """
+
+    def __init__(self, X, y, z, sizes):
+        self.X, self.y, self.z = X, y, z
+        self._slices = {}
+        self._matrices = {}  # (sparse, dtype) -> design matrix of all modes
+        self._labels = None
+        start = 0
+        for mode, size in sizes.items():
+            self._slices[mode] = slice(start, start + size)
+            start += size
+        # The size of a slice is that of a copy of its rows and index.
+        self.bytes_saved = sum(int(df.memory_usage(deep=True).sum())
+                               for mode in self
+                               for df in self[mode].values())
+
+    def __getitem__(self, mode):
+        rows = self._slices[mode]
+        return {'X': self.X.iloc[rows],
+                'y': self.y.iloc[rows],
+                'z': self.z.iloc[rows]}
+
+    def __iter__(self):
+        return iter(self._slices)
+
+    def design_matrix(self, estimator, mode):
+        """
+        Returns the input of `estimator` for the rows of `mode`, see
+        `rapp.pipeline.design_matrix`. The matrix is built on first use
+        and shared by all estimators taking the same kind of input.
+        """
+        key = (models.accepts_sparse(estimator), models.input_dtype(estimator))
+        if key not in self._matrices:
+            self._matrices[key] = {}
+            matrix = design_matrix(self.X, estimator)
+            for name, rows in self._slices.items():
+                # Row slices of a C-contiguous array are contiguous views.
+                self._matrices[key][name] = matrix[rows]
+        return self._matrices[key][mode]
+
+    def labels(self, mode):
+        """
+        Returns the labels of `mode` as 1-D array.
+        """
+        if self._labels is None:
+            labels = np.ascontiguousarray(self.y.to_numpy().ravel())
+            self._labels = {name: labels[rows]
+                            for name, rows in self._slices.items()}
+        return self._labels[mode]
+
+    def __len__(self):
+        return len(self._slices)
+
+
+def preprocess_data(X, categorical, label=None, sparse=False):
     """
         Preprocesses X data.
 
@@ -281,22 +795,167 @@ def preprocess_data(X, categorical, label=None):
         label : str, default = None
             Target variable to be predicted on in X.
 
+        sparse : bool, default = False
+            If True, the one-hot encoded columns are stored sparsely,
+            see `design_matrix`.
+
         Returns
         -------
         X : Dataframe
             Preprocessed X data.
         """
-    # Adapt to categorical data.
+    # Adapt to categorical data. The encoded columns replace the original
+    # ones and are appended after the remaining columns.
     cat_columns = [c for c in categorical if c != label]
     if len(cat_columns) != 0:
-        categorical = pd.get_dummies(data=X[cat_columns], columns=cat_columns)
-        X = pd.concat([X, categorical], axis=1)
-        # Remove old categorical attributes from input features
-        X = X.drop(cat_columns, axis=1)
+        X = pd.get_dummies(data=X, columns=cat_columns, sparse=sparse)
 
     return X
 
 
+class Preprocessor:
+    """
+    One-hot encoding of categorical columns which is fitted once, e.g. on
+    the training set, and stored along with the models. In contrast to
+    `preprocess_data`, the encoded columns do not depend on the categories
+    present in the data to transform: unknown categories are encoded as
+    all zeros and missing categories still get their column.
+
+    Attributes
+    ----------
+    categorical : list[str]
+        Columns to encode.
+
+    sparse : bool
+        Whether the encoded columns are sparse, see `design_matrix`.
+
+    columns : list[str]
+        Columns which are passed through, in their order.
+
+    categories : dict[str -> list]
+        Categories of each encoded column.
+
+    feature_names : list[str]
+        Columns of the transformed data, in their order.
+    """
+
+    def __init__(self, categorical, sparse=False):
+        self.categorical = list(categorical)
+        self.sparse = sparse
+        self.columns = None
+        self.categories = None
+        self.feature_names = None
+
+    def fit(self, X, rows=None, columns=None):
+        """
+        Learn the columns of `X` and the categories of the categorical
+        columns, with the same order and names as `preprocess_data`.
+        Only the rows at the positions `rows` and the given `columns`
+        are considered, if given.
+        """
+        if columns is None:
+            columns = X.columns
+        self.columns = [c for c in columns if c not in self.categorical]
+        self.categories = {c: list(pd.Categorical(_rows(X[c], rows))
+                                   .categories)
+                           for c in self.categorical}
+        self.feature_names = self.columns + [
+            f"{c}_{v}" for c, values in self.categories.items()
+            for v in values]
+        return self
+
+    def transform(self, X, rows=None):
+        """
+        Encode `X` in one pass over each categorical column. Columns which
+        were not seen by `fit`, like a label, are left out.
+        If `rows` is given, only the rows at these positions are encoded,
+        in the given order, without copying `X` first.
+        """
+        if self.feature_names is None:
+            raise ValueError("Preprocessor has to be fitted first")
+        if rows is None:
+            passthrough = X[self.columns]
+        else:
+            passthrough = X.iloc[rows, X.columns.get_indexer(self.columns)]
+        if not self.categorical:
+            return passthrough
+
+        hits, cols, offset = [], [], 0
+        for c, values in self.categories.items():
+            codes = pd.Categorical(_rows(X[c], rows), categories=values).codes
+            known = np.flatnonzero(codes >= 0)
+            hits.append(known)
+            cols.append(codes[known] + offset)
+            offset += len(values)
+        hits, cols = np.concatenate(hits), np.concatenate(cols)
+        names = self.feature_names[len(self.columns):]
+
+        n = len(passthrough)
+        if self.sparse:
+            onehot = scipy.sparse.csr_matrix(
+                (np.ones(len(hits), dtype=bool), (hits, cols)),
+                shape=(n, offset))
+            dummies = pd.DataFrame.sparse.from_spmatrix(
+                onehot, index=passthrough.index, columns=names)
+        else:
+            onehot = np.zeros((n, offset), dtype=bool)
+            onehot[hits, cols] = True
+            dummies = pd.DataFrame(onehot, index=passthrough.index,
+                                   columns=names)
+        return pd.concat([passthrough, dummies], axis=1)
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+
+def _rows(data, rows):
+    return data if rows is None else data.iloc[rows]
+
+
+def design_matrix(X, estimator):
+    """
+    Returns the input of `estimator` for the preprocessed data `X`.
+
+    The columns of `X` are converted to a C-contiguous array of the
+    floating point type the estimator computes with (see
+    `rapp.models.input_dtype`), so that scikit-learn does not validate
+    and convert the DataFrame again on every call.
+    If `X` contains sparse one-hot encoded columns and the estimator
+    accepts sparse input (see `rapp.models.accepts_sparse`), a
+    `scipy.sparse.csr_matrix` with the columns of `X` in the same order
+    is returned instead.
+    """
+    if not isinstance(X, pd.DataFrame):
+        return X
+    dtype = models.input_dtype(estimator)
+    sparse = [isinstance(t, pd.SparseDtype) for t in X.dtypes]
+    if not any(sparse) or not models.accepts_sparse(estimator):
+        return np.ascontiguousarray(X.to_numpy(dtype=dtype))
+
+    # Consecutive columns of the same kind are converted as one block.
+    blocks = []
+    for is_sparse, group in itertools.groupby(zip(X.columns, sparse),
+                                              key=lambda c: c[1]):
+        block = X[[c for c, _ in group]]
+        if is_sparse:
+            blocks.append(block.sparse.to_coo())
+        else:
+            blocks.append(scipy.sparse.csr_matrix(block.to_numpy(dtype=dtype)))
+    return scipy.sparse.hstack(blocks, format='csr', dtype=dtype)
+
+
+def _design_matrix(data, mode, estimator):
+    if isinstance(data, SplitData):
+        return data.design_matrix(estimator, mode)
+    return design_matrix(data[mode]['X'], estimator)
+
+
+def _labels(data, mode):
+    if isinstance(data, SplitData):
+        return data.labels(mode)
+    return np.ravel(data[mode]['y'])
+
+
 def train_models(pipeline, cross_validation=False):
     """
     Trains the models which are stored in the `pipeline`.
@@ -320,10 +979,19 @@ def train_models(pipeline, cross_validation=False):
     pipeline
         Reference to the pipeline which was put in.
     """
-    X_train, y_train, _ = pipeline.get_data('train')
+    data = getattr(pipeline, 'data', None)
+    if isinstance(data, SplitData):
+        y_train = data.labels('train')
+    else:
+        X_data, y_data, _ = pipeline.get_data('train')
+        y_train = np.ravel(y_data)
     for est in pipeline.estimators:
         log.info("Training model: %s", est)
-        est.fit(X_train, y_train.to_numpy().ravel())
+        if isinstance(data, SplitData):
+            X_train = data.design_matrix(est, 'train')
+        else:
+            X_train = design_matrix(X_data, est)
+        est.fit(X_train, y_train)
         if cross_validation:
             k = 5  # Number of fold, hard coded for now.
             log.info("%s-fold crossvalidation on model: %s", k, est)
@@ -332,7 +1000,7 @@ def train_models(pipeline, cross_validation=False):
             scorers = {name: make_scorer(fun)
                        for name, fun in pipeline.score_functions.items()}
 
-            cv_result = cross_validate(est, X_train, y_train.to_numpy().ravel(), cv=k,
+            cv_result = cross_validate(est, X_train, y_train, cv=k,
                                        scoring=scorers,
                                        return_estimator=True,
                                        return_train_score=True)
@@ -427,7 +1095,9 @@ def evaluate_estimator_fairness(estimator, data, notion_dict,
         protected_attributes = [protected_attributes]
     fairness_results = {}
 
-    predictions = {mode: estimator.predict(data[mode]['X']) for mode in data}
+    predictions = {mode: estimator.predict(_design_matrix(data, mode,
+                                                          estimator))
+                   for mode in data}
 
     for prot_attr in protected_attributes:
         fairness_results[prot_attr] = {}
@@ -497,9 +1167,8 @@ def evaluate_estimators_performance(estimator, data, score_dict, calc_confusion_
     for mode in data:
         performance_results[mode] = {}
         performance_results[mode]["scores"] = {}
-        X, y = (data[mode]['X'],
-                data[mode]['y'])
-        y_pred = estimator.predict(X)
+        y = _labels(data, mode)
+        y_pred = estimator.predict(_design_matrix(data, mode, estimator))
 
         for score_name, score in score_dict.items():
             log.debug("Evaluating %s over %s set on %s",
@@ -518,6 +1187,14 @@ def evaluate_estimators_performance(estimator, data, score_dict, calc_confusion_
 
 
 def calculate_statistics(pipeline):
+    statistics_file = getattr(getattr(pipeline, 'config', None),
+                              'statistics_file', None)
+    # The dataset plots of regression show all outcomes, not a summary.
+    if statistics_file and pipeline.type == 'classification':
+        pipeline.statistics_results = _calculate_statistics_from_file(
+            pipeline, statistics_file)
+        return pipeline
+
     for mode in pipeline.data:
         X, y, z = pipeline.get_data(mode)
         if pipeline.type == 'classification':
@@ -605,3 +1282,202 @@ def calculate_regression_set_statistics(X, y, z):
         set_stats['groups'][g] = group_stats
 
     return set_stats
+
+
+def split_frame(pipeline, split_column='split'):
+    """
+    Labels and protected attributes of all modes of the pipeline in one
+    DataFrame, tagged with their mode in the column `split_column`.
+    It can be stored in SQLite or as a columnar file for
+    `calculate_statistics_sql` and `calculate_statistics_columnar`.
+    """
+    frames = []
+    for mode in pipeline.data:
+        _, y, z = pipeline.get_data(mode)
+        df = pd.concat([pd.DataFrame(z).reset_index(drop=True),
+                        pd.DataFrame(y).reset_index(drop=True)], axis=1)
+        df[split_column] = mode
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _calculate_statistics_from_file(pipeline, path):
+    """
+    Write the `split_frame` of the pipeline to `path`, a columnar file or
+    else an SQLite database, and calculate the statistics of each split
+    from it with `calculate_statistics_columnar` or
+    `calculate_statistics_sql`.
+    """
+    _, y, z = pipeline.get_data(next(iter(pipeline.data)))
+    label, attributes = y.columns[0], list(z.columns)
+    df = split_frame(pipeline)
+    if os.path.splitext(path)[1].lower() in db.COLUMNAR_FORMATS:
+        db.write_columnar(df, path)
+        del df
+        return calculate_statistics_columnar(path, label, attributes,
+                                             pipeline.type)
+
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        df.to_sql('statistics', connection, index=False, if_exists='replace')
+        del df
+        return calculate_statistics_sql(connection, 'statistics', label,
+                                        attributes, pipeline.type)
+
+
+def calculate_statistics_sql(connection, source, label, attributes, pl_type,
+                             split_column='split', params=None):
+    """
+    Calculates the statistics of each split with GROUP BY queries in
+    SQLite, so that the data never has to be loaded into memory.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+
+    source : str
+        Table or SELECT query with the columns `label`, `attributes` and
+        `split_column`, e.g. `split_frame` stored in SQLite.
+
+    label : str
+
+    attributes : list[str]
+        Protected attributes.
+
+    pl_type : {'classification', 'regression'}
+
+    split_column : str, default = 'split'
+
+    params : dict, default = None
+        Values for the placeholders in `source`.
+
+    Returns
+    -------
+    dict[mode -> set_stats]
+        For classification in the format of
+        `calculate_classification_set_statistics`. For regression like
+        `calculate_regression_set_statistics`, but with a summary of the
+        outcomes instead of all of them, see `_regression_summary`.
+    """
+    if re.match(r'\s*(select|with)\b', source, re.IGNORECASE):
+        source = f"({source.strip().rstrip(';')})"
+    else:
+        source = f'"{source}"'
+
+    if pl_type == 'classification':
+        aggregates = 'count(*) AS n'
+        outcome, group_by = 'y', ', outcome'
+    else:
+        # The squared deviations from the mean m of the group do not
+        # cancel out like sum(y * y) / n - mean * mean does.
+        aggregates = ('count(*) AS n, avg(y) AS mean, '
+                      'sum((y - m) * (y - m)) / (count(y) - 1) AS var, '
+                      'min(y) AS min, max(y) AS max')
+        outcome, group_by = 'NULL', ''
+
+    selects = []
+    for i, attribute in enumerate([None] + list(attributes)):
+        if attribute is None:
+            name, value, keys = 'NULL', 'NULL', f'"{split_column}"'
+        else:
+            name, value = f':attribute_{i}', f'"{attribute}"'
+            keys = f'"{split_column}", {value}'
+        mean = (f', avg("{label}") OVER (PARTITION BY {keys}) AS m'
+                if pl_type != 'classification' else '')
+        selects.append(
+            f'SELECT split, {name} AS attribute, value, {outcome} AS outcome, '
+            f'{aggregates} FROM (SELECT "{split_column}" AS split, '
+            f'{value} AS value, "{label}" AS y{mean} FROM {source}) '
+            f'GROUP BY split, value{group_by}')
+    params = dict(params or {})
+    params.update({f'attribute_{i}': a
+                   for i, a in enumerate(attributes, start=1)})
+
+    groups = db.query_sql('\nUNION ALL\n'.join(selects), connection, params)
+    if pl_type != 'classification':
+        # Groups of a single outcome have no variance (NULL).
+        groups[['mean', 'var']] = groups[['mean', 'var']].astype(float)
+    return _statistics_from_groups(groups, attributes, pl_type)
+
+
+def calculate_statistics_columnar(path, label, attributes, pl_type,
+                                  split_column='split'):
+    """
+    Calculates the statistics of each split like `calculate_statistics_sql`
+    from a columnar file, e.g. `split_frame` written with
+    `rapp.data.write_columnar`. Only the needed columns are read.
+    Missing values form groups of their own, as in SQL.
+    """
+    df = db.read_columnar(path, [split_column, label] + list(attributes))
+    df = df.rename(columns={split_column: 'split'})
+
+    groups = []
+    for attribute in [None] + list(attributes):
+        keys = ['split'] if attribute is None else ['split', attribute]
+        if pl_type == 'classification':
+            g = df.groupby(keys + [label], sort=False, observed=True,
+                           dropna=False).size()
+            g = g.rename('n').reset_index().rename(columns={label: 'outcome'})
+        else:
+            g = (df[keys].assign(y=df[label].astype(float))
+                 .groupby(keys, sort=False, observed=True, dropna=False)
+                 .agg(n=('y', 'size'), mean=('y', 'mean'), var=('y', 'var'),
+                      min=('y', 'min'), max=('y', 'max'))
+                 .reset_index())
+        g['attribute'] = attribute
+        groups.append(g.rename(columns={attribute: 'value'}))
+    groups = pd.concat(groups, ignore_index=True)
+    return _statistics_from_groups(groups, attributes, pl_type)
+
+
+def _none_if_missing(value):
+    # NaN never equals itself, so it is useless as a dictionary key.
+    return None if pd.isna(value) else value
+
+
+def _statistics_from_groups(groups, attributes, pl_type):
+    """
+    Nested statistics per split from aggregated groups with the columns
+    split, attribute, value, (outcome and) the aggregates of the group.
+    Missing values and outcomes are reported under None.
+    """
+    results = {}
+    for split, split_groups in groups.groupby('split', sort=False):
+        overall = split_groups[split_groups['attribute'].isna()]
+        set_stats = {'total': 0, 'groups': {}}
+        if pl_type == 'classification':
+            outcomes = dict(zip(map(_none_if_missing, overall['outcome']),
+                                overall['n'].astype(int)))
+            set_stats['total'] = sum(outcomes.values())
+            set_stats['outcomes'] = outcomes
+        else:
+            set_stats.update(_regression_summary(overall.iloc[0]))
+
+        for attribute in attributes:
+            rows = split_groups[split_groups['attribute'] == attribute]
+            group_stats = {}
+            for value, value_rows in rows.groupby('value', sort=False,
+                                                  dropna=False):
+                value = _none_if_missing(value)
+                if pl_type == 'classification':
+                    counts = dict(zip(map(_none_if_missing,
+                                          value_rows['outcome']),
+                                      value_rows['n'].astype(int)))
+                    group_stats[value] = {
+                        'total': sum(counts.values()),
+                        'outcomes': {v: counts.get(v, 0) for v in outcomes}}
+                else:
+                    group_stats[value] = _regression_summary(
+                        value_rows.iloc[0])
+            set_stats['groups'][attribute] = group_stats
+        results[split] = set_stats
+    return results
+
+
+def _regression_summary(row):
+    """
+    Total and summary (mean, sample standard deviation, min and max)
+    of the outcomes of an aggregated group.
+    """
+    return {'total': int(row['n']),
+            'summary': {'mean': row['mean'], 'std': row['var'] ** 0.5,
+                        'min': row['min'], 'max': row['max']}}
@@ -5,15 +5,30 @@ desired features id and label id.
 It is assumed, that the features and labels are stored under the directories
 called `sqltemplates/features` and `sqltemplates/labels`, respectively.
 """
+import argparse
+from collections import namedtuple
+import hashlib
+import json
+import logging
 import os
 from os import path
+import re
+import sqlite3
+import time
 
 import chevron
+import chevron.tokenizer
+
+log = logging.getLogger('rapp.sqlbuilder')
 
 _DEFAULTTEMPLATEDIR = path.join(os.getcwd(), 'sqltemplates')
 
 _LOADEDDB = None  # String name of the database.
 
+_FILE_CACHE = {}  # (path, tokenized) -> (mtime, content)
+_QUERY_CACHE = {}  # (features, labels, dir, db, features, key) -> (mtimes, query)
+_CATALOGS = {}  # template dir -> TemplateCatalog
+
 
 def set_database_name(db_name):
     """
@@ -31,28 +46,110 @@ def reset_database_name():
     set_database_name(None)
 
 
-def load_sql(features_id, labels_id, template_dir=None):
+def load_sql(features_id, labels_id, template_dir=None, key=False):
     """
     Parameters
     ----------
     features_id: str
     labels_id: str
     template_dir: str
+    key: bool
+        Whether the query starts with a `Pseudonym` column identifying
+        the student of each row.
 
     Returns
     -------
     SQL query as a string with the selected features and labels
     """
+    return __render(features_id, labels_id, template_dir, key=key)
+
+
+def load_feature_sql(features_id, template_dir=None, rows=False):
+    """
+    Query of the features of `features_id` for each student, without any
+    label, followed by a `Pseudonym` column identifying the student.
+
+    Parameters
+    ----------
+    features_id: str
+    template_dir: str
+    rows: bool
+        Whether the features are followed by a `rapp_rows` column
+        identifying the rows each student is aggregated over.
+
+    Returns
+    -------
+    SQL query as a string
+    """
+    return __render(features_id, None, template_dir, rows=rows)
+
+
+def load_label_sql(features_id, labels_id, template_dir=None, rows=False):
+    """
+    Query with the same rows as `load_sql`, but only the `Pseudonym`
+    of each student instead of the features, followed by the label.
+    Joined with the result of `load_feature_sql` on the `Pseudonym`,
+    it yields the result of `load_sql` as long as both queries aggregate
+    a student over the same rows, i.e. as long as their `rapp_rows`
+    are equal. The conditions of a label may remove rows of a student,
+    e.g. those of another enrolment.
+
+    Parameters
+    ----------
+    features_id: str
+    labels_id: str
+    template_dir: str
+    rows: bool
+        Whether the `Pseudonym` is followed by a `rapp_rows` column,
+        see `load_feature_sql`.
+
+    Returns
+    -------
+    SQL query as a string
+    """
+    return __render(features_id, labels_id, template_dir, features=False,
+                    rows=rows)
+
+
+_PSEUDONYM_SELECT = "S.Pseudonym AS Pseudonym"
+# Identifies the rows of basetemplate.sql a student's features are
+# aggregated over, so that queries over different rows can be told apart.
+_ROW_FINGERPRINT = ("COUNT(*) || ':' || TOTAL(SSP.rowid) || ':' || "
+                    "TOTAL(E.rowid)")
+
+
+def __render(features_id, labels_id, template_dir=None, features=True,
+             key=False, rows=False):
     if template_dir is None:
         template_dir = _DEFAULTTEMPLATEDIR
 
+    # Rendered queries are reused until one of the files they were built
+    # from changes, appears or disappears.
+    cache_key = (features_id, labels_id, template_dir, _LOADEDDB, features,
+                 key, rows)
+    cached = _QUERY_CACHE.get(cache_key)
+    if cached is not None and __unchanged(cached[0]):
+        return cached[1]
+
+    dependencies = {}
     f_select, f_join, f_where = __load_components(
-        "features", features_id, template_dir=template_dir)
-    l_select, l_join, l_where = __load_components(
-        "labels", labels_id, template_dir=template_dir)
+        "features", features_id, template_dir=template_dir,
+        dependencies=dependencies)
+    if not features:
+        f_select = _PSEUDONYM_SELECT
+    elif key:
+        f_select = f"{_PSEUDONYM_SELECT},\n{f_select}"
+    if rows:
+        f_select = f"{f_select},\n{_ROW_FINGERPRINT} AS rapp_rows"
+    if labels_id is None:
+        l_select, l_join, l_where = _PSEUDONYM_SELECT, "", ""
+    else:
+        l_select, l_join, l_where = __load_components(
+            "labels", labels_id, template_dir=template_dir,
+            dependencies=dependencies)
 
     templates_path = path.join(template_dir, 'basetemplate.sql')
-    template = __load_text(templates_path)
+    template = __load_text(templates_path, dependencies, tokenize=True)
     mustache = {
         "feature_select": f_select,
         "feature_join": f_join,
@@ -63,10 +160,20 @@ def load_sql(features_id, labels_id, template_dir=None):
     }
     query = chevron.render(template, mustache)
 
+    _QUERY_CACHE[cache_key] = (dependencies, query)
     return query
 
 
-def __load_components(type, id, template_dir=None):
+def clear_template_cache():
+    """
+    Forget all loaded template files, rendered queries and catalogs.
+    """
+    _FILE_CACHE.clear()
+    _QUERY_CACHE.clear()
+    _CATALOGS.clear()
+
+
+def __load_components(type, id, template_dir=None, dependencies=None):
     """
     For the given type and identifier,
     load the contents of the SELECT, the JOIN, and the WHERE statements.
@@ -83,6 +190,19 @@ def __load_components(type, id, template_dir=None):
     where: str
         Contents for the WHERE statement.
     """
+    template_path = __template_path(type, id, template_dir, dependencies)
+
+    sel_sql = path.join(template_path, "select.sql")
+    sel_sql = __load_text(sel_sql, dependencies)
+    join_sql = path.join(template_path, "join.sql")
+    join_sql = __load_sql_if_exists(join_sql, dependencies)
+    where_sql = path.join(template_path, "where.sql")
+    where_sql = __load_sql_if_exists(where_sql, dependencies)
+
+    return sel_sql.strip(), join_sql.strip(), where_sql.strip()
+
+
+def __template_path(type, id, template_dir=None, dependencies=None):
     if template_dir is None:
         template_dir = _DEFAULTTEMPLATEDIR
     template_path = path.join(template_dir, type, id)
@@ -90,67 +210,794 @@ def __load_components(type, id, template_dir=None):
     # We need to check whether the selected item is specific to the loaded db.
     if _LOADEDDB is not None:
         db_template_path = path.join(template_dir, _LOADEDDB, type, id)
-        if path.exists(db_template_path):
+        if __mtime(db_template_path, dependencies) is not None:
             template_path = db_template_path
+    return template_path
 
-    sel_sql = path.join(template_path, "select.sql")
-    sel_sql = __load_text(sel_sql)
-    join_sql = path.join(template_path, "join.sql")
-    join_sql = __load_sql_if_exists(join_sql)
-    where_sql = path.join(template_path, "where.sql")
-    where_sql = __load_sql_if_exists(where_sql)
 
-    return sel_sql.strip(), join_sql.strip(), where_sql.strip()
+def load_parameters(features_id, labels_id, template_dir=None):
+    """
+    Default values of the parameters used by the given templates.
 
+    Templates can use named placeholders like `:min_date` instead of
+    hard-coded constants. Their default values are declared in a
+    `parameters.json` next to `select.sql`, e.g.
+    `{"min_date": "2007-01-01"}`.
+    The parameters are bound when the query is executed, so the same
+    prepared statement is reused for different values.
 
-def __load_sql_if_exists(resource_path):
+    Parameters
+    ----------
+    features_id: str
+    labels_id: str or list[str]
+    template_dir: str
+
+    Returns
+    -------
+    dict
+    """
+    if isinstance(labels_id, str):
+        labels_id = [labels_id]
+
+    parameters = {}
+    items = [("features", features_id)] + [("labels", l) for l in labels_id]
+    for type, id in items:
+        template_path = __template_path(type, id, template_dir)
+        text = __load_sql_if_exists(path.join(template_path,
+                                              "parameters.json"))
+        for name, value in (json.loads(text) if text else {}).items():
+            if parameters.get(name, value) != value:
+                raise ValueError(f"Conflicting defaults for parameter "
+                                 f"'{name}' in template '{id}'")
+            parameters[name] = value
+    return parameters
+
+
+def inline_parameters(sql_query, parameters):
+    """
+    Replace the placeholders `:name` in the query by the literal values of
+    `parameters`, e.g. to show a self-contained query to the user.
+    """
+    def literal(match):
+        name = match.group(1)
+        if name not in parameters:
+            return match.group(0)
+        value = parameters[name]
+        if value is None:
+            return "NULL"
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return "'{}'".format(str(value).replace("'", "''"))
+
+    # Skip string literals and comments, which may contain colons.
+    return re.sub(r"('[^']*'|--[^\n]*)|([^'-]+|-)",
+                  lambda m: m.group(0) if m.group(1) else
+                  re.sub(r'(?<!:):([A-Za-z_]\w*)', literal, m.group(0)),
+                  sql_query)
+
+
+def __load_sql_if_exists(resource_path, dependencies=None):
     try:
-        sql = __load_text(resource_path)
+        sql = __load_text(resource_path, dependencies)
     except FileNotFoundError:
         sql = ""
     return sql
 
 
-def __load_text(file_path):
+def __load_text(file_path, dependencies=None, tokenize=False):
+    """
+    Load a file through the process-wide cache, which is invalidated by
+    the modification time of the file.
+    With `tokenize` the file is returned as pre-tokenised mustache template.
+    """
+    mtime = __mtime(file_path, dependencies)
+    if mtime is None:
+        raise FileNotFoundError(file_path)
+
+    cached = _FILE_CACHE.get((file_path, tokenize))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
     with open(file_path, 'r') as f:
-        return f.read()
+        content = f.read()
+    if tokenize:
+        content = list(chevron.tokenizer.tokenize(content))
+    _FILE_CACHE[(file_path, tokenize)] = (mtime, content)
+    return content
+
+
+def __mtime(file_path, dependencies=None):
+    """
+    Modification time of `file_path` or None if it does not exist.
+    The result is recorded in `dependencies`, if given.
+    """
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if dependencies is not None:
+        dependencies[file_path] = mtime
+    return mtime
+
+
+def __unchanged(dependencies):
+    return all(__mtime(p) == mtime for p, mtime in dependencies.items())
+
+
+def _unchanged_since(dependencies):
+    """
+    Whether none of the files recorded in `dependencies` changed.
+    Module-level wrapper of `__unchanged` for use within classes.
+    """
+    return dependencies is not None and __unchanged(dependencies)
 
 
 def list_available_features(template_dir=None):
     """
     List all available features.
     """
-    return __list_available_items('features', template_dir=template_dir)
+    return template_catalog(template_dir).list('features', _LOADEDDB)
 
 
 def list_available_labels(template_dir=None):
     """
     List all available labels.
     """
-    return __list_available_items('labels', template_dir=template_dir)
+    return template_catalog(template_dir).list('labels', _LOADEDDB)
+
+
+TemplateInfo = namedtuple(
+    'TemplateInfo', ['id', 'path', 'source', 'components', 'hash', 'columns'])
+TemplateInfo.__doc__ = """
+Metadata of a single feature or label template.
+
+Attributes
+----------
+id : str
+    Name of the template directory.
+path : str
+    Directory containing the template files.
+source : str or None
+    Name of the database the template is specific to,
+    or None for the default templates.
+components : tuple[str]
+    Present parts of the template out of 'select', 'join', and 'where'.
+hash : str
+    SHA-256 over the contents of all components.
+columns : list[str]
+    Names of the columns the SELECT part outputs.
+"""
+
+
+class TemplateCatalog:
+    """
+    In-memory index of the templates below a template directory.
+
+    A directory is only rescanned when its modification time changed,
+    i.e. when templates were added, removed, or replaced. The metadata of
+    a template is read again once one of its files changed, like the
+    files cached by `load_sql`.
+    """
+
+    def __init__(self, template_dir):
+        self.template_dir = template_dir
+        self._dirs = {}  # directory -> (mtime, {id: TemplateInfo})
+        self._dependencies = {}  # template path -> {file path: mtime}
+
+    def list(self, item_type, db_name=None):
+        """
+        Sorted ids of all templates of `item_type`
+        ('features' or 'labels').
+        """
+        return sorted(self.templates(item_type, db_name))
+
+    def get(self, item_type, id, db_name=None):
+        """
+        Metadata of the template `id`, or None if it does not exist.
+        """
+        return self.templates(item_type, db_name).get(id)
+
+    def templates(self, item_type, db_name=None):
+        """
+        Mapping of template ids to their `TemplateInfo`.
+        Items which are both in the database specific and in the default
+        directory only ever refer to the database specific version.
+        """
+        items = dict(self._scan(path.join(self.template_dir, item_type)))
+        if db_name is not None:
+            db_dir = path.join(self.template_dir, db_name, item_type)
+            items.update(self._scan(db_dir, source=db_name, optional=True))
+        return items
+
+    def _scan(self, directory, source=None, optional=False):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            if optional:
+                return {}
+            raise
+
+        cached_mtime, entries = self._dirs.get(directory, (None, {}))
+        if cached_mtime == mtime:
+            paths = {id: info.path for id, info in entries.items()}
+        else:
+            log.debug('Scanning template directory %s', directory)
+            with os.scandir(directory) as it:
+                paths = {d.name: d.path for d in it if d.is_dir()}
+
+        updated = {}
+        for id, template_path in paths.items():
+            info = entries.get(id)
+            if info is None or not _unchanged_since(
+                    self._dependencies.get(template_path)):
+                dependencies = {}
+                info = _read_template_info(id, template_path, source,
+                                           dependencies)
+                self._dependencies[template_path] = dependencies
+            updated[id] = info
+        self._dirs[directory] = (mtime, updated)
+        return updated
+
+
+def template_catalog(template_dir=None):
+    """
+    Process-wide `TemplateCatalog` of the given template directory.
+    """
+    if template_dir is None:
+        template_dir = _DEFAULTTEMPLATEDIR
+    catalog = _CATALOGS.get(template_dir)
+    if catalog is None:
+        catalog = _CATALOGS[template_dir] = TemplateCatalog(template_dir)
+    return catalog
+
+
+def _read_template_info(id, template_path, source, dependencies=None):
+    components = []
+    digest = hashlib.sha256()
+    select_sql = ""
+    for component in ('select', 'join', 'where'):
+        file_path = path.join(template_path, f"{component}.sql")
+        if __mtime(file_path, dependencies) is None:
+            continue
+        try:
+            with open(file_path) as f:
+                text = f.read()
+        except FileNotFoundError:
+            continue
+        components.append(component)
+        digest.update(text.encode('utf-8'))
+        if component == 'select':
+            select_sql = text
+    return TemplateInfo(id, template_path, source, tuple(components),
+                        digest.hexdigest(), select_columns(select_sql))
+
+
+def select_columns(select_sql):
+    """
+    Best-effort extraction of the output column names of a SELECT list.
+    Columns are named by their alias, the column name of plain references,
+    or otherwise the expression itself, as SQLite does.
+    """
+    return [name for _, name in _select_items(select_sql)]
 
 
-def __list_available_items(item_type, template_dir=None):
+def _select_items(select_sql):
     """
-    List all available items of any type.
+    Split a SELECT list into (expression, column name) pairs.
+    """
+    sql = _strip_comments(select_sql)
+    masked = _mask_nested(sql)
+    bounds = [-1] + [m.start() for m in re.finditer(',', masked)] + [len(sql)]
+
+    items = []
+    for start, end in zip(bounds, bounds[1:]):
+        expr = ' '.join(sql[start + 1:end].split())
+        if not expr:
+            continue
+        alias = re.search(r'\s+as\s+(?:"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|(\w+))$',
+                          expr, re.IGNORECASE)
+        if alias:
+            name = next(g for g in alias.groups() if g)
+            expr = expr[:alias.start()]
+        elif re.fullmatch(r'[\w.]+', expr):
+            name = expr.split('.')[-1]
+        else:
+            name = expr
+        items.append((expr, name))
+    return items
+
+
+def _strip_comments(sql):
+    return re.sub(r'--[^\n]*', '', sql)
+
+
+def _mask_nested(sql):
+    """
+    Replace everything within parentheses and quotes by spaces, so that
+    regular expressions on the result only match on the top level.
+    Positions in the result correspond to positions in `sql`.
+    """
+    masked, depth, quote = [], 0, None
+    for char in sql:
+        if quote:
+            masked.append(' ')
+            quote = None if char == quote else quote
+        elif char in '\'"`[':
+            masked.append(' ')
+            quote = ']' if char == '[' else char
+        elif char == '(':
+            masked.append(' ' if depth else char)
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            masked.append(' ' if depth else char)
+        else:
+            masked.append(' ' if depth else char)
+    return ''.join(masked)
+
+
+CombinedLabel = namedtuple('CombinedLabel', ['columns', 'names', 'mask'])
+CombinedLabel.__doc__ = """
+Location of a label within the result of `load_combined_sql`.
+
+Attributes
+----------
+columns : list[str]
+    Result columns holding the label.
+names : list[str]
+    Names of these columns in the query of the label alone.
+mask : str or None
+    Result column which is 1 for the rows of the label, 0 for the other
+    rows and NULL for the students whose feature rows the label changes.
+    None if the label does not filter any rows.
+"""
+
+
+def load_combined_sql(features_id, labels_ids, template_dir=None, key=False):
+    """
+    Build a single query with the features of `features_id` and the labels
+    of all `labels_ids` as additional columns, so that a sweep over the
+    labels only needs to run the base query once.
+
+    Labels consisting of a `select.sql` only are aggregated over the rows
+    of the features. The rows of a label with a `join.sql` or `where.sql`
+    are the students of its `load_label_sql` query, which is LEFT JOINed
+    as a mask column instead of removing rows. The conditions of such a
+    label may also remove single rows of a student, e.g. of other
+    enrolments, and thereby change the feature aggregates of `load_sql`.
+    The mask is NULL for these students, whose rows then have to be
+    loaded with `load_sql`.
+
+    Parameters
+    ----------
+    features_id: str
+    labels_ids: list[str]
+    template_dir: str
+    key: bool
+        Whether the query starts with a `Pseudonym` column, see `load_sql`.
+
+    Returns
+    -------
+    query : str
+        The combined SQL query.
+    labels : dict
+        Maps each label id to its `CombinedLabel`.
     """
     if template_dir is None:
         template_dir = _DEFAULTTEMPLATEDIR
+    f_select, f_join, f_where = __load_components(
+        "features", features_id, template_dir=template_dir)
+    template = __load_text(path.join(template_dir, 'basetemplate.sql'))
+
+    names = {n.lower() for n in select_columns(f_select)}
+    selects, joins, labels = [], [], {}
+    for i, labels_id in enumerate(labels_ids):
+        l_select, l_join, l_where = __load_components(
+            "labels", labels_id, template_dir=template_dir)
+        items = _select_items(l_select)
+        source = f"rapp_label_{i}"
+
+        columns, label_names = [], []
+        for expr, name in items:
+            # Labels may share column names, e.g. different definitions
+            # of the same target, so their result columns are made unique.
+            column = name if name.lower() not in names else f"{name}_{i}"
+            if column.lower() in names:
+                raise ValueError(f"Column '{name}' of label '{labels_id}' "
+                                 "is not unique")
+            names.add(column.lower())
+            columns.append(column)
+            label_names.append(name)
+            if l_join or l_where:
+                expr = f'{source}."{name}"'
+            selects.append(f'{expr} AS "{column}"')
+
+        mask = None
+        if l_join or l_where:
+            # The rows of load_label_sql, with the label columns renamed.
+            label_query = chevron.render(template, {
+                "feature_select": f"{_PSEUDONYM_SELECT},\n"
+                                  f"{_ROW_FINGERPRINT} AS rapp_rows",
+                "feature_join": f_join,
+                "feature_where": f_where,
+                "label_select": ',\n'.join(f'{expr} AS "{name}"'
+                                            for expr, name in items),
+                "label_join": l_join,
+                "label_where": l_where,
+            })
+            joins.append(f"LEFT JOIN (\n{label_query}\n) AS {source}\n"
+                         f"  ON {source}.Pseudonym = S.Pseudonym")
+            mask = f"rapp_mask_{labels_id}"
+            selects.append(f"CASE WHEN {source}.Pseudonym IS NULL THEN 0\n"
+                           f"     WHEN {source}.rapp_rows = "
+                           f"{_ROW_FINGERPRINT} THEN 1 END "
+                           f'AS "{mask}"')
+        labels[labels_id] = CombinedLabel(columns, label_names, mask)
 
-    dir = path.join(template_dir, item_type)
-    items = __list_subdirs(dir)
+    mustache = {
+        "feature_select": (f"{_PSEUDONYM_SELECT},\n{f_select}" if key
+                           else f_select),
+        "feature_join": f_join,
+        "feature_where": f_where,
+        "label_select": ',\n'.join(selects),
+        "label_join": '\n'.join(joins),
+        "label_where": "",
+    }
+    return chevron.render(template, mustache), labels
 
-    if _LOADEDDB is not None:
-        db_dir = path.join(template_dir, _LOADEDDB, item_type)
-        if path.exists(db_dir):
-            items += __list_subdirs(db_dir)
 
-    # Transform to set so we can remove duplicates.
-    # Items which are both in the _LOADEDDB and in the default directory
-    # will only ever refer to the _LOADEDDB version.
-    return sorted(set(items))
+def project_columns(sql_query, columns):
+    """
+    Wrap `sql_query` into an outer SELECT that only returns `columns`,
+    so that SQLite can skip loading everything else.
+
+    Parameters
+    ----------
+    sql_query : str
+        A single SELECT statement.
+    columns : list[str]
+        Output columns of `sql_query` to keep, in the desired order.
 
+    Returns
+    -------
+    str
+    """
+    inner = sql_query.strip().rstrip(';')
+    projection = ', '.join('"{}"'.format(c.replace('"', '""'))
+                           for c in columns)
+    # The newline keeps a trailing line comment from swallowing the ')'.
+    return f"SELECT {projection} FROM (\n{inner}\n)"
+
+
+def explain_query_plan(sql_query, connection):
+    """
+    Run `EXPLAIN QUERY PLAN` for the given query.
+
+    Returns
+    -------
+    list[str]
+        The detail lines of the query plan.
+    """
+    cur = connection.execute("EXPLAIN QUERY PLAN " + sql_query)
+    return [row[-1] for row in cur.fetchall()]
 
-def __list_subdirs(directory: str):
-    with os.scandir(directory) as it:
-        return [d.name for d in it if d.is_dir()]
+
+def analyse_query_plan(plan, sql_query=""):
+    """
+    Flag the expensive steps of a query plan.
+
+    Parameters
+    ----------
+    plan : list[str]
+        Query plan as returned by `explain_query_plan`.
+    sql_query : str
+        The explained query; used to resolve table aliases.
+
+    Returns
+    -------
+    dict
+        `{'full_scans': [table, ...],
+          'automatic_indexes': [table, ...],
+          'temp_btrees': [plan detail, ...]}`
+        where tables are given by their name if the alias could be resolved.
+    """
+    aliases = {alias: table for table, alias in
+               re.findall(r'(\w+)\s+as\s+(\w+)', sql_query, re.IGNORECASE)}
+    result = {'full_scans': [], 'automatic_indexes': [], 'temp_btrees': []}
+    for detail in plan:
+        scan = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        search = re.match(r'SEARCH (?:TABLE )?(\w+)', detail)
+        if scan and 'USING' not in detail and scan.group(1) != 'CONSTANT':
+            name = scan.group(1)
+            result['full_scans'].append(aliases.get(name, name))
+        elif search and 'AUTOMATIC' in detail:
+            name = search.group(1)
+            result['automatic_indexes'].append(aliases.get(name, name))
+        elif 'USE TEMP B-TREE' in detail:
+            result['temp_btrees'].append(detail)
+    return result
+
+
+_SQL_KEYWORDS = {'on', 'where', 'join', 'left', 'inner', 'cross', 'outer',
+                 'natural', 'group', 'order', 'limit', 'union', 'using',
+                 'having', 'window', 'except', 'intersect'}
+_EQUALITY = r'(?:==?|\bIN\b|\bIS\b)'
+
+
+def _table_aliases(sql_query, tables):
+    """
+    Map the aliases of the FROM and JOIN clauses onto the database tables
+    they stand for. Aliases reused for different tables map onto all of them.
+    """
+    aliases = {}
+    for table, alias in re.findall(
+            r'(?:\bFROM|\bJOIN|,)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?',
+            sql_query, re.IGNORECASE):
+        table = tables.get(table.lower())
+        if table is None:
+            continue
+        if not alias or alias.lower() in _SQL_KEYWORDS:
+            alias = table
+        aliases.setdefault(alias.lower(), set()).add(table)
+        aliases.setdefault(table.lower(), set()).add(table)
+    return aliases
+
+
+def index_candidates(sql_query, connection, plan=None):
+    """
+    Derive covering indexes from the expensive steps of a query plan.
+
+    - Tables searched via an automatic index get an index keyed by the
+      columns SQLite builds the automatic index on.
+    - Scanned tables get an index keyed by the columns they are compared
+      for equality in join and filter conditions.
+    - Temporary B-trees of a GROUP BY over the columns of one table, or of
+      an ORDER BY over a single column, get an index keyed by these columns.
+
+    All other columns the query uses of the table are appended to the key,
+    so that the query can be answered from the index alone. Columns are
+    only recognised if they are qualified as `alias.column`.
+
+    Parameters
+    ----------
+    sql_query : str
+    connection : sqlite3.Connection
+    plan : list[str], default = None
+        Query plan as returned by `explain_query_plan`.
+
+    Returns
+    -------
+    dict[table -> dict[tuple[str] -> set[str]]]
+        The sorted key columns of the candidate indexes per table, mapped
+        onto the further columns they cover. The keys are equality lookups
+        and groupings, so the order of their columns is free.
+    """
+    if plan is None:
+        plan = explain_query_plan(sql_query, connection)
+    tables = {name.lower(): name for (name,) in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'")}
+    aliases = _table_aliases(sql_query, tables)
+    columns = {}
+    for table in {t for ts in aliases.values() for t in ts}:
+        cur = connection.execute(f'PRAGMA table_info("{table}")')
+        columns[table] = {row[1].lower(): row[1] for row in cur.fetchall()}
+
+    def resolve(alias, names):
+        """Tables of `alias` having all `names`, with their spelling."""
+        for table in aliases.get(alias.lower(), ()):
+            if all(n.lower() in columns[table] for n in names):
+                yield table, tuple(columns[table][n.lower()] for n in names)
+
+    sql = _strip_comments(sql_query)
+    used, compared = {}, {}
+    for alias, col in re.findall(r'\b(\w+)\.(\w+)\b', sql):
+        for table, (col,) in resolve(alias, [col]):
+            used.setdefault(table, set()).add(col)
+    for pattern in (rf'\b(\w+)\.(\w+)\s*{_EQUALITY}',
+                    r'(?<![<>!=])==?\s*(\w+)\.(\w+)\b'):
+        for alias, col in re.findall(pattern, sql, re.IGNORECASE):
+            for table, (col,) in resolve(alias, [col]):
+                compared.setdefault(table, set()).add(col)
+
+    keys = []
+    for detail in plan:
+        scan = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        search = re.match(r'SEARCH (?:TABLE )?(\w+) .*AUTOMATIC.*\((.*)\)',
+                          detail)
+        if scan and 'USING' not in detail:
+            for table in aliases.get(scan.group(1).lower(), ()):
+                keys.append((table, sorted(compared.get(table, ()))))
+        elif search:
+            names = re.findall(r'(\w+)\s*[=<>]', search.group(2))
+            keys.extend((table, sorted(cols)) for table, cols
+                        in resolve(search.group(1), names))
+        elif re.match(r'USE TEMP B-TREE FOR (GROUP|ORDER) BY', detail):
+            kind = 'GROUP' if 'GROUP BY' in detail else 'ORDER'
+            for clause in re.findall(
+                    rf'\b{kind}\s+BY\s+((?:\w+\.\w+\s*,\s*)*\w+\.\w+)\b',
+                    sql, re.IGNORECASE):
+                refs = re.findall(r'(\w+)\.(\w+)', clause)
+                if (len({alias.lower() for alias, _ in refs}) != 1
+                        or kind == 'ORDER' and len(refs) > 1):
+                    continue
+                keys.extend((table, sorted(cols)) for table, cols in
+                            resolve(refs[0][0], [col for _, col in refs]))
+
+    candidates = {}
+    for table, key in keys:
+        if key:
+            covered = candidates.setdefault(table, {}).setdefault(
+                tuple(key), set())
+            covered.update(used.get(table, set()) - set(key))
+    return candidates
+
+
+def render_all_templates(template_dir=None):
+    """
+    Render the query of every combination of available features and labels.
+    Template parameters are replaced by their default values.
+
+    Returns
+    -------
+    dict[(features_id, labels_id) -> str]
+    """
+    queries = {}
+    for features_id in list_available_features(template_dir=template_dir):
+        for labels_id in list_available_labels(template_dir=template_dir):
+            sql = load_sql(features_id, labels_id, template_dir=template_dir)
+            parameters = load_parameters(features_id, labels_id,
+                                         template_dir=template_dir)
+            queries[(features_id, labels_id)] = inline_parameters(sql,
+                                                                  parameters)
+    return queries
+
+
+def advise_indexes(db_path, working_copy, template_dir=None, repeat=3):
+    """
+    Profile all templates over a database and evaluate index recommendations.
+
+    The database at `db_path` is copied to `working_copy`, all rendered
+    templates are explained and timed, the covering indexes derived by
+    `index_candidates` from their query plans are created on the copy,
+    and the templates are timed again.
+    The original database is not altered.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the database to profile.
+    working_copy : str
+        Path for the copy on which the indexes are created.
+    template_dir : str, default = None
+    repeat : int, default = 3
+        Each template is timed as the best out of `repeat` runs.
+
+    Returns
+    -------
+    report : dict
+        `{'indexes': [created index statements],
+          'templates': {(features_id, labels_id):
+                            {'before': analysis, 'after': analysis,
+                             'time_before': float, 'time_after': float,
+                             'speedup': float}}}`
+        where the analyses are given by `analyse_query_plan`.
+    """
+    source = sqlite3.connect(db_path)
+    conn = sqlite3.connect(working_copy)
+    source.backup(conn)
+    source.close()
+
+    queries = render_all_templates(template_dir=template_dir)
+    report = {'indexes': [], 'templates': {}}
+
+    candidates = {}
+    for ids, sql in queries.items():
+        try:
+            plan = explain_query_plan(sql, conn)
+        except sqlite3.Error as e:
+            log.warning('Skipping template %s: %s', ids, e)
+            continue
+        for table, keys in index_candidates(sql, conn, plan).items():
+            for key, covered in keys.items():
+                candidates.setdefault(table, {}).setdefault(
+                    key, set()).update(covered)
+        report['templates'][ids] = {
+            'before': analyse_query_plan(plan, sql),
+            'time_before': _time_query(sql, conn, repeat),
+        }
+
+    for table in sorted(candidates):
+        for stmt in _index_statements(table, candidates[table]):
+            log.info('Creating index: %s', stmt)
+            conn.execute(stmt)
+            report['indexes'].append(stmt)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    for ids, result in report['templates'].items():
+        sql = queries[ids]
+        result['after'] = analyse_query_plan(explain_query_plan(sql, conn), sql)
+        result['time_after'] = _time_query(sql, conn, repeat)
+        result['speedup'] = (result['time_before'] / result['time_after']
+                             if result['time_after'] > 0 else float('inf'))
+        log.info('Template %s_%s: %.3fs -> %.3fs (x%.1f)', *ids,
+                 result['time_before'], result['time_after'],
+                 result['speedup'])
+    conn.close()
+
+    return report
+
+
+def _index_statements(table, candidates):
+    """
+    CREATE INDEX statements for the candidate indexes of `table`.
+    Keys containing each other share one index, whose columns start with
+    the smallest key and grow key by key.
+    """
+    groups = []  # [(nested key sets, covered columns)]
+    for key in sorted(candidates, key=len):
+        for keys, covered in groups:
+            if all(other <= set(key) for other in keys):
+                keys.append(set(key))
+                covered.update(candidates[key])
+                break
+        else:
+            groups.append(([set(key)], set(candidates[key])))
+
+    statements = []
+    for keys, covered in groups:
+        columns = []
+        for key in keys:
+            columns += sorted(key - set(columns))
+        columns += sorted(covered - set(columns))
+        name = '_'.join(['idx', table] + sorted(keys[0]))
+        quoted = ', '.join(f'"{col}"' for col in columns)
+        statements.append(f'CREATE INDEX IF NOT EXISTS "{name}" '
+                          f'ON "{table}" ({quoted})')
+    return statements
+
+
+def _time_query(sql_query, connection, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(sql_query).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    """
+    Command line interface of `advise_indexes`:
+
+        python -m rapp.sqlbuilder DATABASE WORKING_COPY
+
+    prints the derived indexes and the timings of the templates before and
+    after creating them on the working copy.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m rapp.sqlbuilder',
+        description='Derive covering indexes from the query plans of all '
+                    'templates and time them on a copy of the database.')
+    parser.add_argument('database', help='Database to profile.')
+    parser.add_argument('working_copy',
+                        help='Path of the copy the indexes are created on.')
+    parser.add_argument('--template_dir', default=None,
+                        help='Template directory. Default: sqltemplates')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs per template. Default: 3')
+    args = parser.parse_args(argv)
+
+    report = advise_indexes(args.database, args.working_copy,
+                            template_dir=args.template_dir,
+                            repeat=args.repeat)
+    for stmt in report['indexes']:
+        print(f'{stmt};')
+    for (features_id, labels_id), result in sorted(report['templates'].items()):
+        print(f"{features_id}_{labels_id}: {result['time_before']:.3f}s -> "
+              f"{result['time_after']:.3f}s (x{result['speedup']:.1f})")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ LEFT JOIN
     WHERE P.Nummer = SSP.Nummer
       AND P.Version = SSP.Version
       AND P.Modul IN ('Lineare Algebra', 'Lineare Algebra I')
-      AND SSP.Fachsemester <= 1
+      AND SSP.Fachsemester <= :max_term
     GROUP BY SSP.Pseudonym
     ) as LA
   ON LA.Pseudonym = SSP.Pseudonym
@@ -25,7 +25,7 @@ LEFT JOIN
     WHERE P.Nummer = SSP.Nummer
       AND P.Version = SSP.Version
       AND P.Modul IN ('Programmierung ', 'Grundlagen der Softwareentwicklung und Programmierung')
-      AND SSP.Fachsemester <= 1
+      AND SSP.Fachsemester <= :max_term
     GROUP BY SSP.Pseudonym
     ) as Prog
   ON Prog.Pseudonym = SSP.Pseudonym
@@ -40,7 +40,7 @@ LEFT JOIN
     WHERE P.Nummer = SSP.Nummer
       AND P.Version = SSP.Version
       AND P.Modul IN ('Programmierung ', 'Grundlagen der Softwareentwicklung und Programmierung')
-      AND SSP.Fachsemester <= 1
+      AND SSP.Fachsemester <= :max_term
     ORDER BY SSP.Pseudonym
     ) as ProgNote
   ON Prog.Pseudonym = ProgNote.Pseudonym AND Prog.Versuche = ProgNote.Versuch
@@ -55,7 +55,7 @@ LEFT JOIN
     WHERE P.Nummer = SSP.Nummer
       AND P.Version = SSP.Version
       AND P.Modul = 'Analysis I'
-      AND SSP.Fachsemester <= 1
+      AND SSP.Fachsemester <= :max_term
     GROUP BY SSP.Pseudonym
     ) as Ana
   ON Ana.Pseudonym = SSP.Pseudonym
@@ -0,0 +1,46 @@
+-- Same features as cs_first_term_modules, but read from the materialised
+-- per-student exam aggregates (see rapp.data.materialise_exam_aggregates)
+-- instead of scanning Student_schreibt_Pruefung once per module.
+LEFT JOIN
+  ( SELECT
+      max(A.Bestanden) as Bestanden,
+      max(A.Versuche) as Versuche,
+      A.Pseudonym
+    FROM Student_Modul_Aggregat as A
+    WHERE A.Modul IN ('Lineare Algebra', 'Lineare Algebra I')
+      AND A.Fachsemester <= :max_term
+    GROUP BY A.Pseudonym
+    ) as LA
+  ON LA.Pseudonym = SSP.Pseudonym
+LEFT JOIN
+  ( SELECT
+      max(A.Bestanden) as Bestanden,
+      max(A.Versuche) as Versuche,
+      A.Pseudonym
+    FROM Student_Modul_Aggregat as A
+    WHERE A.Modul IN ('Programmierung ', 'Grundlagen der Softwareentwicklung und Programmierung')
+      AND A.Fachsemester <= :max_term
+    GROUP BY A.Pseudonym
+    ) as Prog
+  ON Prog.Pseudonym = SSP.Pseudonym
+LEFT JOIN
+  ( SELECT
+      A.Versuche as Versuch,
+      A.LetzteNote as Note,
+      A.Pseudonym
+    FROM Student_Modul_Aggregat as A
+    WHERE A.Modul IN ('Programmierung ', 'Grundlagen der Softwareentwicklung und Programmierung')
+      AND A.Fachsemester <= :max_term
+    ) as ProgNote
+  ON Prog.Pseudonym = ProgNote.Pseudonym AND Prog.Versuche = ProgNote.Versuch
+LEFT JOIN
+  ( SELECT
+      max(A.Bestanden) as Bestanden,
+      max(A.Versuche) as Versuche,
+      A.Pseudonym
+    FROM Student_Modul_Aggregat as A
+    WHERE A.Modul = 'Analysis I'
+      AND A.Fachsemester <= :max_term
+    GROUP BY A.Pseudonym
+    ) as Ana
+  ON Ana.Pseudonym = SSP.Pseudonym
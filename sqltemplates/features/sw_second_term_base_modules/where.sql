@@ -10,4 +10,4 @@ AND NOT (EV_AP.Versuche IS NULL
           AND Komm_AP.Versuche IS NULL
           )
 -- Only consider since PO 2007
-AND '2007-01-01' <= date(E.Immatrikulationsdatum)
+AND :min_enrolment_date <= date(E.Immatrikulationsdatum)
@@ -5,8 +5,9 @@ INNER JOIN
     E.Abschluss,
     -- E.Bestanden,
     -- LetztePruefung.SemesterCode,
-    CASE WHEN LetztePruefung.SemesterCode < 20192 THEN NOT E.Bestanden ELSE null END as Dropout
-    -- 20192 is the code for wintersemester 2019 (summersemester would be 20191).
+    CASE WHEN LetztePruefung.SemesterCode < :dropout_cutoff_semester THEN NOT E.Bestanden ELSE null END as Dropout
+    -- The default cutoff 20192 is the code for wintersemester 2019
+    -- (summersemester would be 20191), see parameters.json.
     -- This is three terms ago, given the age of the dataset.
     -- Thus, everybody not writing an exam in the last three terms is assumed
     -- to have ended their studyship, and those whom did not graduate are deemed
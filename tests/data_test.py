@@ -0,0 +1,531 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from rapp import data
+from rapp.data import ConnectionPool
+
+from tests import testutil
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return testutil.create_sample_db_file(tmp_path / "rapp.db", n_students=5)
+
+
+def test_pooled_connection_is_read_only(db_file):
+    pool = ConnectionPool()
+    with pool.connection(db_file) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM Student")
+
+
+def test_pooled_connection_queries_data(db_file):
+    with data.pooled_connection(db_file) as conn:
+        df = data.query_sql("SELECT * FROM Student", conn)
+
+    assert len(df) == 5
+
+
+def test_pool_reuses_connection_within_thread(db_file):
+    pool = ConnectionPool()
+    with pool.connection(db_file) as outer:
+        with pool.connection(db_file) as inner:
+            assert outer is inner
+    with pool.connection(db_file) as again:
+        assert again is outer
+
+
+def test_pool_hands_out_distinct_connections_per_thread(db_file):
+    pool = ConnectionPool(max_connections=2)
+    barrier = threading.Barrier(2)
+    seen = []
+
+    def work():
+        with pool.connection(db_file) as conn:
+            seen.append(conn)
+            barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(seen) == 2 and seen[0] is not seen[1]
+
+
+def test_pool_is_bounded(db_file):
+    pool = ConnectionPool(max_connections=1, timeout=0.1)
+    errors = []
+
+    def work():
+        try:
+            with pool.connection(db_file):
+                pass
+        except Exception as e:
+            errors.append(e)
+
+    with pool.connection(db_file):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+
+    assert len(errors) == 1
+
+
+def test_pool_rejects_memory_database():
+    with pytest.raises(ValueError):
+        with ConnectionPool().connection(":memory:"):
+            pass
+
+
+def test_query_sql_chunks_respects_chunksize(db_file):
+    with data.pooled_connection(db_file) as conn:
+        chunks = list(data.query_sql_chunks("SELECT * FROM Student", conn,
+                                            chunksize=2))
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+
+
+def test_concat_chunks_equals_full_query(db_file):
+    sql = "SELECT * FROM Student_schreibt_Pruefung ORDER BY Pseudonym"
+    with data.pooled_connection(db_file) as conn:
+        expected = data.query_sql(sql, conn)
+        actual = data.concat_chunks(data.query_sql_chunks(sql, conn,
+                                                          chunksize=2))
+
+    pd.testing.assert_frame_equal(expected, actual)
+
+
+def test_query_cache_hits_on_repeated_query(db_file, tmp_path):
+    cache = data.QueryCache(str(tmp_path / "cache"))
+    sql = "SELECT * FROM Student ORDER BY Pseudonym"
+
+    first = cache.query(sql, db_file)
+    second = cache.query(sql, db_file)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_query_cache_ignores_layout_of_sql(db_file, tmp_path):
+    cache = data.QueryCache(str(tmp_path / "cache"))
+    cache.query("SELECT *\n  FROM Student", db_file)
+    cache.query("  SELECT *\n\nFROM Student  ", db_file)
+
+    assert cache.hits == 1
+
+
+def test_query_cache_invalidated_by_database_change(db_file, tmp_path):
+    cache = data.QueryCache(str(tmp_path / "cache"))
+    sql = "SELECT * FROM Student"
+    cache.query(sql, db_file)
+
+    conn = sqlite3.connect(db_file)
+    testutil.insert_into_Student(conn, 100)
+    conn.commit()
+    conn.close()
+
+    df = cache.query(sql, db_file)
+    assert cache.hits == 0 and len(df) == 6
+
+
+def test_query_cache_evicts_least_recently_used(db_file, tmp_path):
+    cache = data.QueryCache(str(tmp_path / "cache"))
+    queries = [f"SELECT * FROM Student WHERE Pseudonym > {i}" for i in range(3)]
+    for sql in queries:
+        cache.query(sql, db_file)
+    cache.query(queries[0], db_file)  # Mark first query as recently used.
+
+    cache.max_bytes = cache.size() - 1
+    cache.put(db_file, queries[2], cache.get(db_file, queries[2]))
+
+    assert cache.get(db_file, queries[0]) is not None
+    assert cache.get(db_file, queries[1]) is None
+
+
+def test_declared_column_types(db_file):
+    with data.pooled_connection(db_file) as conn:
+        types = data.declared_column_types(conn)
+
+    assert types['Studienfach'] == 'VARCHAR(50)'
+    assert types['Note'] == 'REAL'
+
+
+def test_query_column_types_resolve_origin_tables(db_file):
+    sql = """
+    SELECT p.Modul AS Nummer, e.Studienfach, ssp.Note, ssp.Note * 2 AS Doppelt
+    FROM Pruefung p, Einschreibung e, Student_schreibt_Pruefung ssp
+    """
+    with data.pooled_connection(db_file) as conn:
+        types = data.query_column_types(sql, conn)
+
+    # Nummer is declared as INTEGER in Pruefung, but originates from Modul.
+    assert types == {'Nummer': 'TEXT', 'Studienfach': 'TEXT', 'Note': 'REAL',
+                     'Doppelt': ''}
+
+
+def test_compact_dtypes():
+    df = pd.DataFrame({
+        'Versuche': [1, 2, 3, 1],
+        'Note': [1.3, 2.0, 5.0, 1.0],
+        'Geschlecht': ['m', 'w', 'm', 'm'],
+        'Studienfach': ['Informatik', 'Physik', 'Mathe', 'Chemie'],
+        'Nummer': ['1', '1', 'x', '1'],
+        'Label': [0.5, 1.5, 2.5, 3.5],
+    })
+    compact = data.compact_dtypes(df, {'Studienfach': 'TEXT', 'Nummer': 'INT'},
+                                  exclude=['Label'])
+
+    assert compact['Versuche'].dtype == 'int8'
+    assert compact['Note'].dtype == 'float64'
+    assert compact['Geschlecht'].dtype == 'category'
+    # Unique text, e.g. identifiers, is not worth a category.
+    assert compact['Studienfach'].dtype != 'category'
+    assert compact['Nummer'].dtype != 'category'
+    assert compact['Label'].dtype == 'float64'
+
+
+def test_compact_dtypes_downcasts_floats_on_request():
+    df = pd.DataFrame({'Note': [1.3, 2.0], 'Label': [0.5, 1.5]})
+    compact = data.compact_dtypes(df, exclude=['Label'], downcast_floats=True)
+
+    assert compact['Note'].dtype == 'float32'
+    assert compact['Label'].dtype == 'float64'
+
+
+def test_compact_dtypes_keeps_unique_undeclared_text():
+    df = pd.DataFrame({'Name': ['a', 'b', 'c', 'd']})
+    compact = data.compact_dtypes(df)
+
+    assert compact['Name'].dtype != 'category'
+
+
+def test_materialise_exam_aggregates(db_file):
+    with data.pooled_connection(db_file) as conn:
+        df = data.query_sql(
+            f"SELECT * FROM {data.EXAM_AGGREGATE_TABLE} ORDER BY Pseudonym",
+            conn)
+
+    assert df['Pseudonym'].tolist() == [1, 2, 3, 4, 5]
+    assert df['Bestanden'].tolist() == [0, 1, 0, 1, 0]
+    assert df['LetzteNote'].tolist() == pytest.approx([1.1, 1.2, 1.3, 1.4, 1.5])
+    # The source database is not written.
+    with sqlite3.connect(db_file) as conn:
+        tables = conn.execute("SELECT name FROM sqlite_master").fetchall()
+    assert (data.EXAM_AGGREGATE_TABLE,) not in tables
+
+
+def add_second_attempt(db_file, pseudonym):
+    db = testutil.TestDb(empty=True)
+    db.db = sqlite3.connect(db_file)
+    db.modules["Analysis I"] = {"version": 1, "nummer": 100}
+    db.students[pseudonym] = {"abschluss": "Bachelor",
+                              "studienfach": "Informatik"}
+    db.add_exam(pseudonym, "Analysis I", attempt=2, semester=2, passed=True,
+                grade=2.0)
+    db.db.commit()
+    db.db.close()
+
+
+def test_materialise_exam_aggregates_only_rebuilds_on_change(db_file):
+    conn = sqlite3.connect(db_file)
+    assert data.materialise_exam_aggregates(conn)
+    assert not data.materialise_exam_aggregates(conn)
+
+    add_second_attempt(db_file, 1)
+    assert data.materialise_exam_aggregates(conn)
+
+    # Corrected grades leave the rows of the table as they were.
+    with sqlite3.connect(db_file) as writer:
+        writer.execute("UPDATE Student_schreibt_Pruefung SET Note = 4.0 "
+                       "WHERE Pseudonym = 2")
+    writer.close()
+    assert data.materialise_exam_aggregates(conn)
+    df = data.query_sql(f"SELECT LetzteNote FROM {data.EXAM_AGGREGATE_TABLE} "
+                        "WHERE Pseudonym = 2", conn)
+    assert df['LetzteNote'].tolist() == [4.0]
+    conn.close()
+
+
+def test_materialise_exam_aggregates_incrementally(db_file):
+    sql = f"SELECT * FROM {data.EXAM_AGGREGATE_TABLE} ORDER BY 1, 2, 3, 4, 5"
+    conn = sqlite3.connect(db_file)
+    data.materialise_exam_aggregates(conn)
+    add_second_attempt(db_file, 1)
+    add_second_attempt(db_file, 3)
+
+    data.materialise_exam_aggregates(conn)
+    incremental = data.query_sql(sql, conn)
+    data.materialise_exam_aggregates(conn, force=True)
+    full = data.query_sql(sql, conn)
+    conn.close()
+
+    pd.testing.assert_frame_equal(incremental, full)
+    assert len(full) == 7
+
+
+def test_appended_keys(db_file):
+    conn = sqlite3.connect(db_file)
+    tables = ['Student_schreibt_Pruefung', 'Pruefung']
+    old = data.table_watermarks(conn, tables)
+    add_second_attempt(db_file, 4)
+    keys = {'Student_schreibt_Pruefung': 'Pseudonym'}
+
+    new = data.table_watermarks(conn, tables)
+    assert data.appended_keys(conn, old, new, keys) == {4}
+
+    conn.execute("DELETE FROM Student_schreibt_Pruefung WHERE Pseudonym = 2")
+    new = data.table_watermarks(conn, tables)
+    assert data.appended_keys(conn, old, new, keys) is None
+
+
+def test_delta_cache_merges_affected_students(db_file, tmp_path,
+                                              monkeypatch):
+    sql = ("SELECT S.Pseudonym, count(*) AS Pruefungen, max(Note) AS Note "
+           "FROM Student AS S JOIN Student_schreibt_Pruefung AS SSP "
+           "ON S.Pseudonym = SSP.Pseudonym GROUP BY S.Pseudonym")
+    cache = data.DeltaCache(tmp_path / "cache")
+    cache.query(sql, db_file)
+    add_second_attempt(db_file, 2)
+
+    calls = []
+    original = data.query_sql
+
+    def spy(sql_query, connection=None, params=None):
+        calls.append(params)
+        return original(sql_query, connection, params)
+    monkeypatch.setattr(data, "query_sql", spy)
+    refreshed = cache.query(sql, db_file)
+    monkeypatch.undo()
+
+    assert calls == [{'rapp_delta_keys': '[2]'}]
+    with sqlite3.connect(db_file) as conn:
+        pd.testing.assert_frame_equal(refreshed, data.query_sql(sql, conn))
+    assert refreshed['Pruefungen'].tolist() == [1, 2, 1, 1, 1]
+
+
+def test_delta_cache_refreshes_updated_rows(db_file, tmp_path):
+    sql = ("SELECT S.Pseudonym, max(Note) AS Note "
+           "FROM Student AS S JOIN Student_schreibt_Pruefung AS SSP "
+           "ON S.Pseudonym = SSP.Pseudonym GROUP BY S.Pseudonym")
+    cache = data.DeltaCache(tmp_path / "cache")
+    cache.query(sql, db_file)
+
+    # A corrected grade keeps the row count and rowids of the table.
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("UPDATE Student_schreibt_Pruefung SET Note = 4.0 "
+                     "WHERE Pseudonym = 3")
+    conn.close()
+    refreshed = cache.query(sql, db_file)
+
+    assert refreshed['Note'].tolist()[2] == 4.0
+    assert cache.query(sql, db_file)['Note'].tolist()[2] == 4.0
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "students.csv"
+    lines = ["Pseudonym;Geschlecht;Note"]
+    lines += [f"{i};{'w' if i % 2 else 'm'};{1 + i / 10}" for i in range(25)]
+    lines += ["25;m;"]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_load_csv(csv_file):
+    conn = sqlite3.connect(":memory:")
+    fractions = []
+
+    n = data.load_csv(csv_file, conn, "students", delimiter=";",
+                      chunksize=10, progress=fractions.append)
+    df = data.query_sql("SELECT * FROM students", conn)
+
+    assert n == 26 and len(df) == 26
+    assert df['Note'].isna().sum() == 1
+    assert fractions[-1] == 1.0 and len(fractions) == 3
+
+
+def test_load_csv_declares_column_types(csv_file):
+    conn = sqlite3.connect(":memory:")
+    data.load_csv(csv_file, conn, "students", delimiter=";")
+
+    types = data.declared_column_types(conn)
+    assert types == {'Pseudonym': 'INTEGER', 'Geschlecht': 'TEXT',
+                     'Note': 'REAL'}
+
+
+def test_load_csv_cancelled(csv_file):
+    conn = sqlite3.connect(":memory:")
+    calls = []
+
+    def cancel_after_first_chunk():
+        calls.append(1)
+        return len(calls) > 1
+
+    with pytest.raises(data.IngestCancelled):
+        data.load_csv(csv_file, conn, "students", delimiter=";",
+                      chunksize=10, cancelled=cancel_after_first_chunk)
+
+    tables = conn.execute("SELECT name FROM sqlite_master").fetchall()
+    assert tables == []
+
+
+def test_cancellable_aborts_query(db_file):
+    conn = sqlite3.connect(db_file)
+    sql = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c) "
+           "SELECT count(*) FROM c")
+
+    with data.cancellable(conn, lambda: True):
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(sql).fetchall()
+
+    # The handler is removed afterwards.
+    assert conn.execute("SELECT count(*) FROM Student").fetchone() == (5,)
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".feather", ".npy"])
+def test_columnar_roundtrip_reads_selected_columns(tmp_path, suffix):
+    df = pd.DataFrame({'Pseudonym': [1, 2, 3],
+                       'Note': [1.0, 2.3, 4.0],
+                       'Bestanden': [1, 1, 0]})
+    path = tmp_path / f"features{suffix}"
+    data.write_columnar(df, path)
+
+    assert data.columnar_columns(path) == ['Pseudonym', 'Note', 'Bestanden']
+    loaded = data.read_columnar(path, columns=['Note', 'Bestanden'])
+    pd.testing.assert_frame_equal(loaded, df[['Note', 'Bestanden']])
+
+
+def test_columnar_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        data.read_columnar(tmp_path / "features.xlsx")
+
+
+def test_execute_queries_in_submission_order(db_file):
+    queries = ["SELECT count(*) AS n FROM Student",
+               ("SELECT Pseudonym FROM Student WHERE Pseudonym <= :p",
+                {"p": 2}),
+               "SELECT 1 AS one"]
+
+    results = data.execute_queries(db_file, queries, max_workers=2,
+                                   immutable=True)
+
+    assert [r.df.columns[0] for r in results] == ['n', 'Pseudonym', 'one']
+    assert results[0].df['n'][0] == 5
+    assert len(results[1].df) == 2
+    assert all(r.seconds >= 0 for r in results)
+
+
+def test_execute_queries_raises_errors(db_file):
+    with pytest.raises(Exception):
+        data.execute_queries(db_file, ["SELECT * FROM Missing"])
+
+
+@pytest.fixture
+def telemetry():
+    yield data.enable_telemetry(capacity=3)
+    data.disable_telemetry()
+
+
+def test_telemetry_records_queries_per_template(db_file, telemetry):
+    with sqlite3.connect(db_file) as conn:
+        with data.query_template('students'):
+            data.query_sql("SELECT * FROM Student", conn)
+        chunks = data.query_sql_chunks("SELECT * FROM Student", conn,
+                                       chunksize=2)
+        assert sum(len(c) for c in chunks) == 5
+
+    first, second = telemetry.records
+    assert (first.template, first.rows) == ('students', 5)
+    assert (second.template, second.rows) == (None, 5)
+    assert first.bytes > 0 and first.seconds >= 0
+    summary = telemetry.summary()
+    assert summary.loc['students', 'queries'] == 1
+    assert summary.loc['-', 'rows'] == 5
+
+
+def test_telemetry_keeps_latest_queries(db_file, telemetry):
+    with sqlite3.connect(db_file) as conn:
+        for n in range(1, 6):
+            data.query_sql(f"SELECT * FROM Student LIMIT {n}", conn)
+
+    assert [r.rows for r in telemetry.records] == [3, 4, 5]
+
+
+def test_telemetry_of_concurrent_queries(db_file, telemetry):
+    data.execute_queries(db_file, ["SELECT 1", "SELECT 2"],
+                         templates=['one', 'two'])
+
+    assert sorted(r.template for r in telemetry.records) == ['one', 'two']
+
+
+def test_slow_queries_are_logged(db_file, tmp_path):
+    log_path = tmp_path / "queries.db"
+    telemetry = data.enable_telemetry(slow_threshold=0, log_path=log_path)
+    try:
+        with sqlite3.connect(db_file) as conn:
+            data.query_sql("SELECT * FROM Student", conn)
+    finally:
+        data.disable_telemetry()
+
+    assert len(telemetry.slow_queries()) == 1
+    summary = data.query_log_summary(log_path)
+    assert summary.loc['-', 'slow'] == 1
+    assert summary.loc['-', 'rows'] == 5
+
+
+@pytest.mark.parametrize("attach", [False, True])
+def test_query_databases_tags_rows_with_source(tmp_path, attach):
+    db_paths = [testutil.create_sample_db_file(tmp_path / f"rapp_{year}.db",
+                                               n_students=n)
+                for year, n in [(2019, 3), (2020, 5)]]
+
+    df = data.query_databases(db_paths, "SELECT Pseudonym FROM Student",
+                              attach=attach)
+
+    assert list(df.columns) == ['Datenbank', 'Pseudonym']
+    assert df['Datenbank'].tolist() == ['rapp_2019'] * 3 + ['rapp_2020'] * 5
+    assert df['Pseudonym'].tolist() == [1, 2, 3, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("attach", [False, True])
+def test_query_databases_with_relative_paths(tmp_path, monkeypatch, attach):
+    for year in [2019, 2020]:
+        testutil.create_sample_db_file(tmp_path / f"rapp_{year}.db",
+                                       n_students=2)
+    monkeypatch.chdir(tmp_path)
+
+    df = data.query_databases(["rapp_2019.db", "rapp_2020.db"],
+                              "SELECT Pseudonym FROM Student", attach=attach)
+
+    assert df['Datenbank'].tolist() == ['rapp_2019'] * 2 + ['rapp_2020'] * 2
+    with data.ConnectionPool().connection("rapp_2019.db") as conn:
+        assert len(data.query_sql("SELECT * FROM Student", conn)) == 2
+
+
+@pytest.mark.parametrize("attach", [False, True])
+def test_query_databases_aggregates_each_database(tmp_path, attach):
+    db_paths = [testutil.create_sample_db_file(tmp_path / f"rapp_{n}.db",
+                                               n_students=n)
+                for n in [3, 5]]
+
+    df = data.query_databases(
+        db_paths, f"SELECT count(*) AS n FROM {data.EXAM_AGGREGATE_TABLE}",
+        attach=attach)
+
+    assert df['n'].tolist() == [3, 5]
+
+
+def test_query_attached_databases_requires_same_schema(tmp_path, db_file):
+    other = tmp_path / "other.db"
+    with sqlite3.connect(other) as conn:
+        conn.execute("CREATE TABLE Student (Pseudonym INTEGER)")
+    conn.close()
+
+    with pytest.raises(ValueError):
+        data.query_databases([db_file, other], "SELECT * FROM Student",
+                             attach=True)
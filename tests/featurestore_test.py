@@ -0,0 +1,85 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from rapp import data
+from rapp import sqlbuilder
+from rapp.featurestore import FeatureStore
+
+from tests import testutil
+from tests.data_test import add_second_attempt
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return testutil.create_sample_db_file(tmp_path / "rapp.db")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FeatureStore(tmp_path / "features")
+
+
+@pytest.mark.parametrize("features_id, labels_id", [
+    ('cs_first_term_grades', '4term_cp'),
+    ('cs_first_term_grades', '3_dropout'),
+    ('cs_first_term_modules_aggregated', '4term_ap'),
+])
+def test_join_labels_equals_template_query(db_file, store, features_id,
+                                           labels_id):
+    params = sqlbuilder.load_parameters(features_id, labels_id)
+
+    joined = store.join_labels(db_file, features_id, labels_id, params)
+
+    with sqlite3.connect(db_file) as conn:
+        expected = data.query_sql(
+            sqlbuilder.load_sql(features_id, labels_id), conn, params)
+    pd.testing.assert_frame_equal(joined, expected, check_dtype=False)
+
+
+def test_join_labels_refuses_labels_changing_feature_rows(db_file, store):
+    with sqlite3.connect(db_file) as conn:
+        # Student 2 has a second enrolment, which the dropout label removes.
+        testutil.insert_into_Einschreibung(conn, 2, studienfach="Informatik")
+        conn.execute("UPDATE Einschreibung SET Immatrikulationsdatum = "
+                     "'2005-10-01' WHERE ID = "
+                     "(SELECT max(ID) FROM Einschreibung)")
+    conn.close()
+
+    with pytest.raises(ValueError, match="1 students"):
+        store.join_labels(db_file, 'cs_first_term_grades', '3_dropout')
+    assert 'rapp_rows' not in store.features(db_file, 'cs_first_term_grades')
+
+
+def test_features_are_refreshed_on_new_records(db_file, store, tmp_path):
+    features = store.features(db_file, 'cs_first_term_modules')
+    assert store.features(db_file, 'cs_first_term_modules') is features
+
+    add_second_attempt(db_file, 1)
+    refreshed = store.features(db_file, 'cs_first_term_modules')
+
+    assert refreshed is not features
+    expected = FeatureStore(tmp_path / "fresh").features(
+        db_file, 'cs_first_term_modules')
+    pd.testing.assert_frame_equal(refreshed, expected)
+
+
+def test_features_are_refreshed_on_updated_records(db_file, store):
+    features = store.features(db_file, 'cs_first_term_ects')
+
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("UPDATE Student_schreibt_Pruefung SET ECTS = 7 "
+                     "WHERE Pseudonym = 2")
+    conn.close()
+    refreshed = store.features(db_file, 'cs_first_term_ects')
+
+    assert refreshed.loc[2].tolist() != features.loc[2].tolist()
+
+
+def test_version_depends_on_used_parameters(store):
+    version = store.version('cs_first_term_grades')
+
+    assert store.version('cs_first_term_grades', {'unused': 1}) == version
+    assert store.version('cs_first_term_grades',
+                         {'min_enrolment_date': '2020-01-01'}) != version
@@ -0,0 +1,145 @@
+import logging
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from rapp import data
+from rapp.gui import Window
+from rapp.gui.dbview import DataView, PandasModel, QueryWorker
+
+from tests import testutil
+
+
+# Far more rows than are streamed before the query is cancelled.
+LONG_QUERY = '''
+WITH RECURSIVE numbers(n) AS (
+    SELECT 1 UNION ALL SELECT n + 1 FROM numbers WHERE n < 100000000
+)
+SELECT n FROM numbers
+'''
+
+
+def _data_view(qtbot, tmp_path):
+    conn = sqlite3.connect(tmp_path / 'test.db', check_same_thread=False)
+    conn.execute('CREATE TABLE Student (Matrikelnummer INTEGER)')
+    conn.executemany('INSERT INTO Student VALUES (?)', [(i,) for i in range(25)])
+    conn.commit()
+
+    view = DataView(sql_conn=conn, log=logging.getLogger('rapp.gui'))
+    qtbot.addWidget(view)
+    qtbot.waitUntil(lambda: not view.query_running)
+    return view
+
+
+def test_run_query_returns_before_results(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(QueryWorker, 'chunksize', 10)
+    view = _data_view(qtbot, tmp_path)
+    results = []
+
+    with qtbot.waitSignal(view.queryFinished):
+        view.run_query('SELECT * FROM Student', results.append)
+        assert view.query_running
+
+    assert len(results) == 1
+    assert results[0]['Matrikelnummer'].tolist() == list(range(25))
+    assert view.table.model().rowCount() == 25
+
+
+def test_cancelled_query_keeps_partial_result(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(QueryWorker, 'chunksize', 100)
+    view = _data_view(qtbot, tmp_path)
+    results = []
+
+    view.run_query(LONG_QUERY, results.append)
+    # Wait for the first chunk replacing the initially displayed table.
+    qtbot.waitUntil(lambda: 'N' in view.table.model().df.columns)
+    with qtbot.waitSignal(view.queryFinished, timeout=10000):
+        view.cancel_query()
+
+    assert results == [None]
+    assert view.query_cancelled
+    assert view.query_error is None
+    assert not view.query_running
+
+    partial = view.table.model().df
+    assert 0 < len(partial.index) < 100000000
+    assert partial['N'].tolist() == list(range(1, len(partial.index) + 1))
+
+
+def test_query_started_while_running_replaces_running_query(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(QueryWorker, 'chunksize', 100)
+    view = _data_view(qtbot, tmp_path)
+    results = []
+    idle = []
+
+    view.run_query(LONG_QUERY, results.append)
+    view.run_query('SELECT * FROM Student', results.append)
+    view.call_when_idle(lambda: idle.append(len(results)))
+    qtbot.waitUntil(lambda: not view.query_running, timeout=10000)
+
+    assert results[0] is None
+    assert len(results[1].index) == 25
+    assert idle == [2]
+
+
+def test_appended_chunks_are_displayed_in_order():
+    model = PandasModel(pd.DataFrame({'a': [0, 1]}))
+    model.append(pd.DataFrame({'a': [2, 3, 4]}))
+    model.append(pd.DataFrame({'a': [5]}))
+
+    assert model.rowCount() == 6
+    assert [model.data(model.index(row, 0)) for row in range(6)] == \
+        [str(row) for row in range(6)]
+    assert model.df['a'].tolist() == list(range(6))
+    assert model.df.index.tolist() == list(range(6))
+
+
+@pytest.fixture
+def window(qtbot, tmp_path):
+    loggers = [logging.getLogger(name)
+               for name in ('GUI', 'prediction', 'rapp.pipeline')]
+    handlers = [list(logger.handlers) for logger in loggers]
+
+    window = Window(testutil.create_sample_db_file(tmp_path / 'rapp.db'))
+    qtbot.addWidget(window)
+    view = window.databaseLayoutWidget.pandas_dataview
+    qtbot.waitUntil(lambda: not view.query_running)
+    yield window
+
+    # The window logs into its own widgets, which are deleted after the test.
+    for logger, before in zip(loggers, handlers):
+        logger.handlers = before
+
+
+def test_csv_import_replaces_connection_once_it_succeeded(qtbot, tmp_path,
+                                                          window):
+    layout = window.databaseLayoutWidget
+    csv_file = tmp_path / 'students.csv'
+    csv_file.write_text('Pseudonym,Note\n1,1.3\n2,2.7\n3,4.0\n')
+    shared = data.db_conn
+
+    layout.connectDatabaseFromCsv(str(csv_file))
+    # The import runs in its own thread on its own connection.
+    assert data.db_conn is shared
+    qtbot.waitUntil(lambda: layout.sql_df is not None
+                    and not layout.pandas_dataview.query_running,
+                    timeout=10000)
+
+    assert data.db_conn is not shared
+    assert layout.sql_df['Pseudonym'].tolist() == [1, 2, 3]
+    assert data.query_sql('SELECT * FROM students')['Note'].tolist() == \
+        [1.3, 2.7, 4.0]
+
+
+def test_failed_csv_import_keeps_connection(qtbot, tmp_path, window):
+    layout = window.databaseLayoutWidget
+    shared = data.db_conn
+
+    layout.connectDatabaseFromCsv(str(tmp_path / 'missing.csv'))
+    # The thread is only stopped from the event loop, which runs here.
+    with qtbot.waitSignal(layout.csv_thread.finished, timeout=10000):
+        pass
+
+    assert data.db_conn is shared
+    assert layout.filepath_db.endswith('rapp.db')
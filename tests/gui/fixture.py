@@ -10,7 +10,9 @@ import tests.resources as rc
 def gui(qtbot):
     gui = Window(rc.get_path('test.db'))
     qtbot.addWidget(gui)
-    return GuiTestApi(gui, qtbot)
+    api = GuiTestApi(gui, qtbot)
+    api.wait_for_queries()
+    return api
 
 
 class GuiTestApi():
@@ -51,7 +53,7 @@ class GuiTestApi():
 
         # Menubar
         self.menubar = widget.menubar
-        self.load_cf = lambda file: widget.menubar.loadConfigurationFile(file)
+        self.load_cf = lambda file: self._wait_after(widget.menubar.loadConfigurationFile, file)
 
         # Fairness Tab
         self.fairness_tabs = widget.evaluation.tabs
@@ -73,12 +75,25 @@ class GuiTestApi():
         self.populate_interpretability_tab = lambda pl: self._populate_interpretability_tab(widget, pl)
 
         # Prediction Tab
-        self.load_model = widget.prediction._load_model
+        self.load_model = lambda file: self._wait_after(widget.prediction._load_model, file)
         self.predict = widget.prediction.predict
         self.predictionView = widget.prediction.loadModelView
         self.loadedModels = widget.prediction.loadModelView.loadedModels
         self.ensembleLabels = widget.prediction.loadModelView.ensembleLabels
 
+    def wait_for_queries(self, timeout=10000):
+        """
+        Wait until the SQL queries of all data views have finished.
+        """
+        views = [self.widget.databaseLayoutWidget.pandas_dataview,
+                 self.widget.databasePredictionLayoutWidget.pandas_dataview]
+        self.qtbot.waitUntil(lambda: not any(v.query_running for v in views),
+                             timeout=timeout)
+
+    def _wait_after(self, action, *args):
+        action(*args)
+        self.wait_for_queries()
+
     def get_df(self):
         return self.widget.databaseLayoutWidget.sql_df
 
@@ -115,7 +130,7 @@ class GuiTestApi():
 
     def click(self, element, btn=Qt.MouseButton.LeftButton, **kwargs):
         """
-        Click on the given GUI element.
+        Click on the given GUI element and wait for the queries it started.
 
         Parameters
         ----------
@@ -124,6 +139,7 @@ class GuiTestApi():
         btn : Qt.MouseButton flag
         """
         self.qtbot.mouseClick(element, btn, **kwargs)
+        self.wait_for_queries()
 
     def lclick(self, element, **kwargs):
         """
@@ -181,3 +181,21 @@ def test_parsing_from_empty_file_fails():
 
     with pytest.raises(SystemExit):
         cf = parser.parse_file(file)
+
+
+def test_data_file_instead_of_database():
+    ini_file = rc.get_path('empty.ini')
+    args = f"-cf {ini_file} -df features.parquet --label_name target"
+    parser = RappConfigParser()
+    cf = parser.parse_args(args)
+
+    assert cf.data_file == "features.parquet" and cf.filename is None
+
+
+def test_missing_filename_and_data_file():
+    ini_file = rc.get_path('empty.ini')
+    args = f"-cf {ini_file} -sf foo.sql --label_name target"
+    parser = RappConfigParser()
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(args)
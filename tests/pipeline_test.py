@@ -1,31 +1,43 @@
+import logging
+import shutil
+import sqlite3
+import tracemalloc
 from types import SimpleNamespace
 
 import numpy as np
 import pandas as pd
 import pytest
 from sklearn.dummy import DummyClassifier
+from sklearn.naive_bayes import GaussianNB
 from sklearn.metrics import accuracy_score, balanced_accuracy_score
 from sklearn.metrics import confusion_matrix
+from sklearn.model_selection import train_test_split
 from sklearn.neural_network import MLPClassifier
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
 from sklearn.utils.validation import check_is_fitted
 
+from rapp import data
 from rapp import sqlbuilder
 from rapp.fair.notions import group_fairness, predictive_equality
 from rapp.pipeline import Pipeline, _parse_estimators, preprocess_data
+from rapp.pipeline import design_matrix, Preprocessor
 from rapp.pipeline import _load_sql_query
 from rapp.pipeline import _load_test_split_from_dataframe
 from rapp.pipeline import train_models
+from rapp.pipeline import sweep_labels, sweep_templates
 from rapp.pipeline import evaluate_estimator_fairness
 from rapp.pipeline import calculate_classification_set_statistics
 from rapp.pipeline import calculate_regression_set_statistics
 from rapp.pipeline import calculate_statistics
+from rapp.pipeline import calculate_statistics_sql
+from rapp.pipeline import calculate_statistics_columnar, split_frame
 from rapp.pipeline import evaluate_estimators_performance
 from rapp.pipeline import evaluate_performance
 from rapp.parser import RappConfigParser
 
 import tests.resources as rc
+from tests import testutil
 
 
 def test_estimator_parsing():
@@ -135,6 +147,147 @@ def test_df_train_split():
     assert not errors, "\n".join(errors)
 
 
+def _split_config(split):
+    cf = SimpleNamespace(label_name='y', categorical=['b'],
+                         sensitive_attributes=['z'], split=split,
+                         group_column='Pseudonym')
+    df = pd.DataFrame({'Pseudonym': [n // 4 for n in range(40)],
+                       'a': range(40),
+                       'b': [f'c{n % 3}' for n in range(40)],
+                       'z': [n % 2 for n in range(40)],
+                       'y': [int(n % 5 == 0) for n in range(40)]})
+    return df, cf
+
+
+def test_df_train_split_stratified():
+    df, cf = _split_config('stratified')
+
+    data = _load_test_split_from_dataframe(df, cf, random_state=42)
+
+    assert data['train']['y']['y'].sum() == 6
+    assert data['test']['y']['y'].sum() == 2
+    assert 'Pseudonym' in data['train']['X'].columns
+
+
+def test_df_train_split_by_group():
+    df, cf = _split_config('group')
+
+    data = _load_test_split_from_dataframe(df, cf, random_state=42)
+
+    train = set(df.loc[data['train']['X'].index, 'Pseudonym'])
+    test = set(df.loc[data['test']['X'].index, 'Pseudonym'])
+    assert len(train) == 8 and len(test) == 2
+    assert not train & test
+    assert 'Pseudonym' not in data['train']['X'].columns
+
+
+def test_df_train_split_by_hash_is_stable():
+    df, cf = _split_config('hash')
+    df['Pseudonym'] = [f'student{n // 2}' for n in range(40)]
+    new = df.iloc[:6].assign(Pseudonym=['new0', 'new0', 'new1', 'new1',
+                                        'new2', 'new2'])
+
+    data = _load_test_split_from_dataframe(df, cf)
+    grown = _load_test_split_from_dataframe(pd.concat([df, new],
+                                                      ignore_index=True), cf)
+
+    for mode in data:
+        students = set(df.loc[data[mode]['X'].index, 'Pseudonym'])
+        assert students
+        assert grown[mode]['X'].index[:len(data[mode]['X'])].equals(
+            data[mode]['X'].index)
+    assert not (set(df.loc[data['train']['X'].index, 'Pseudonym'])
+                & set(df.loc[data['test']['X'].index, 'Pseudonym']))
+    assert 'Pseudonym' not in data['train']['X'].columns
+
+
+def test_df_train_split_by_hash_ignores_float_ids():
+    df, cf = _split_config('hash')
+    df['Pseudonym'] = [n // 2 for n in range(40)]
+    as_float = df.assign(Pseudonym=df['Pseudonym'].astype(float))
+
+    data = _load_test_split_from_dataframe(df, cf)
+    data_float = _load_test_split_from_dataframe(as_float, cf)
+
+    for mode in data:
+        assert data[mode]['X'].index.equals(data_float[mode]['X'].index)
+
+
+@pytest.mark.parametrize("store", [False, True])
+def test_template_split_by_hash_keeps_students_in_their_set(tmp_path, store):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '4term_cp',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch', '--split', 'hash']
+    if store:
+        args += ['--feature_store', str(tmp_path / "features")]
+
+    def students(pipeline):
+        sql = sqlbuilder.load_sql('cs_first_term_grades', '4term_cp',
+                                  key=True)
+        with sqlite3.connect(db_file) as conn:
+            pseudonyms = data.query_sql(sql, conn,
+                                        pipeline.sql_parameters)['Pseudonym']
+        sets = {}
+        for mode in ['train', 'test']:
+            X, _, _ = pipeline.get_data(mode)
+            assert 'Pseudonym' not in X.columns
+            sets[mode] = set(pseudonyms[X.index])
+        return sets
+
+    before = students(Pipeline(RappConfigParser().parse_args(args)))
+    conn = sqlite3.connect(db_file)
+    for pseudonym in range(21, 31):
+        testutil.insert_into_Student(conn, pseudonym)
+        testutil.insert_into_Einschreibung(conn, pseudonym)
+        testutil.insert_into_Student_schreibt_Pruefung(
+            conn, pseudonym, 1, 100, "nicht bestanden", 5.0, 0, 1)
+    conn.commit()
+    conn.close()
+    after = students(Pipeline(RappConfigParser().parse_args(args)))
+
+    assert before['train'] and before['test']
+    assert not before['train'] & before['test']
+    for mode in ['train', 'test']:
+        assert before[mode] <= after[mode]
+
+
+def test_df_train_split_shares_memory():
+    df, cf = _split_config('random')
+
+    data = _load_test_split_from_dataframe(df, cf, random_state=42)
+
+    X_train = data['train']['X']
+    assert np.shares_memory(X_train['a'].to_numpy(), data.X['a'].to_numpy())
+    assert len(X_train) + len(data['test']['X']) == len(data.X) == 40
+
+
+def test_df_train_split_reports_saved_copies():
+    rng = np.random.default_rng(seed=123)
+    n = 20000
+    df = pd.DataFrame({'a': rng.random(n), 'b': rng.integers(5, size=n),
+                       'z': rng.integers(2, size=n),
+                       'y': rng.integers(2, size=n)})
+    cf = SimpleNamespace(categorical=[], sensitive_attributes=['z'],
+                         label_name='y')
+    data = _load_test_split_from_dataframe(df, cf)
+
+    # Measure the copies a split into separate frames allocates.
+    X, y, z = (part.reset_index(drop=True)
+               for part in (data.X, data.y, data.z))
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        copies = train_test_split(X, y, z, train_size=0.8)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert len(copies) == 6
+    assert data.bytes_saved == pytest.approx(allocated, rel=0.05)
+
+
 def test_df_train_split_without_label_name():
     # Helper functions to create data.
     def raw_data(n):
@@ -328,6 +481,287 @@ def test_load_data_from_sql_file():
         z_test) == 20), "Wrong amount of test data"
 
 
+def test_load_data_in_chunks(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    query = ("SELECT Geschlecht, Deutsch, Note "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym")
+    args = ['-t', 'regression', '-f', db_file, '-sq', query,
+            '--chunksize', '3', '--categorical', 'Geschlecht']
+    chunked = Pipeline(RappConfigParser().parse_args(args))
+    full = Pipeline(RappConfigParser().parse_args(args[:-4] + args[-2:]))
+
+    for mode in ['train', 'test']:
+        for lhs, rhs in zip(chunked.get_data(mode), full.get_data(mode)):
+            pd.testing.assert_frame_equal(lhs, rhs)
+
+
+def test_compact_dtypes_keep_float_precision(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    query = ("SELECT Geschlecht, Note, Versuch, ECTS "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym")
+    args = ['-t', 'regression', '-f', db_file, '-sq', query,
+            '--categorical', 'Geschlecht']
+    compact = Pipeline(RappConfigParser().parse_args(args))
+    full = Pipeline(RappConfigParser().parse_args(
+        args + ['--compact_dtypes', 'False']))
+
+    for mode in ['train', 'test']:
+        X_compact, y_compact, _ = compact.get_data(mode)
+        X_full, y_full, _ = full.get_data(mode)
+        assert X_compact['Versuch'].dtype == 'int8'
+        assert X_compact['Note'].dtype == 'float64'
+        pd.testing.assert_frame_equal(X_compact, X_full, check_dtype=False)
+        pd.testing.assert_frame_equal(y_compact, y_full, check_dtype=False)
+
+
+def test_ignored_columns_are_not_queried(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    query = ("SELECT S.Pseudonym, Geschlecht, Deutsch, Note "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym;")
+    args = ['-t', 'regression', '-f', db_file, '-sq', query,
+            '--ignore', 'Pseudonym', 'Deutsch',
+            '--categorical', 'Geschlecht', 'Deutsch']
+    pipeline = Pipeline(RappConfigParser().parse_args(args))
+
+    assert pipeline.sql_query.startswith('SELECT "Geschlecht", "Note" FROM')
+    X, y, _ = pipeline.get_data('train')
+    assert sorted(X.columns) == ['Geschlecht_männlich', 'Geschlecht_weiblich']
+    assert list(y.columns) == ['Note']
+
+
+def test_sweep_labels_runs_one_pipeline_per_label(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch']
+    config = RappConfigParser().parse_args(args)
+
+    pipelines = sweep_labels(config, ['3_dropout', '4term_ap'])
+
+    assert set(pipelines) == {'3_dropout', '4term_ap'}
+    for labels_id, label in [('3_dropout', 'Dropout'),
+                             ('4term_ap', 'FourthTermAP')]:
+        X, y, _ = pipelines[labels_id].get_data('train')
+        assert list(y.columns) == [label]
+        assert 'Dropout' not in X.columns and 'FourthTermAP' not in X.columns
+
+
+def test_sweep_loads_labels_changing_feature_rows_on_their_own(
+        tmp_path, monkeypatch, caplog):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    template_dir = tmp_path / "templates"
+    shutil.copytree(sqlbuilder._DEFAULTTEMPLATEDIR, template_dir)
+    label_dir = template_dir / "labels" / "passed_exams"
+    label_dir.mkdir()
+    (label_dir / "select.sql").write_text("COUNT(*) AS BestandenePruefungen")
+    (label_dir / "where.sql").write_text("AND SSP.Status = 'bestanden'")
+    monkeypatch.setattr(sqlbuilder, '_DEFAULTTEMPLATEDIR', str(template_dir))
+    conn = sqlite3.connect(db_file)
+    # Student 2 has rows inside and outside of the filter of the label.
+    testutil.insert_into_Student_schreibt_Pruefung(
+        conn, 2, 1, 100, "nicht bestanden", 5.0, 0, 1, versuch=2)
+    conn.commit()
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch']
+    config = RappConfigParser().parse_args(args)
+    labels_ids = ['passed_exams', '3_dropout', '4term_ap']
+
+    with caplog.at_level(logging.INFO, logger='rapp.pipeline'):
+        pipelines = sweep_labels(config, labels_ids)
+
+    on_their_own = [record.args[0] for record in caplog.records
+                    if 'loading it on its own' in record.getMessage()]
+    assert on_their_own == ['passed_exams']
+    for labels_id in labels_ids:
+        sql = sqlbuilder.load_sql('cs_first_term_grades', labels_id)
+        params = sqlbuilder.load_parameters('cs_first_term_grades', labels_id)
+        expected = pd.read_sql_query(sql, conn, params=params)
+        pd.testing.assert_frame_equal(pipelines[labels_id].config.sql_df,
+                                      expected, check_dtype=False)
+    conn.close()
+
+
+def test_sql_parameters_are_bound(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    query = ("SELECT Geschlecht, Note "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym "
+             "WHERE Note <= :max_grade")
+    args = ['-t', 'regression', '-f', db_file, '-sq', query,
+            '--categorical', 'Geschlecht', '--sql_parameters']
+    pipelines = [Pipeline(RappConfigParser().parse_args(args + [p]))
+                 for p in ['max_grade=2.0', 'max_grade=3']]
+
+    for pipeline, n_rows in zip(pipelines, [10, 20]):
+        assert pipeline.sql_query == query
+        n = sum(len(pipeline.get_data(mode)[0]) for mode in ['train', 'test'])
+        assert n == n_rows
+
+
+def test_sweep_templates_runs_all_combinations(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch',
+            '--cache_dir', str(tmp_path / "cache")]
+    config = RappConfigParser().parse_args(args)
+    features_ids = ['cs_first_term_grades', 'cs_first_term_ects']
+
+    pipelines = sweep_templates(config, features_ids, ['3_dropout', '4term_ap'])
+
+    assert len(pipelines) == 4
+    pipeline = pipelines[('cs_first_term_ects', '4term_ap')]
+    assert pipeline.config.features_id == 'first_term_ects'
+    assert 'EctsFirstTerm' in pipeline.get_data('train')[0].columns
+    # A second sweep is answered from the query cache with one combined
+    # query per features.
+    sweep_templates(config, features_ids, ['3_dropout', '4term_ap'])
+    assert data.get_query_cache(config.cache_dir).hits == 2
+
+
+def test_incremental_cache_drops_ignored_key(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    query = ("SELECT S.Pseudonym, Geschlecht, max(Note) AS Note "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym "
+             "GROUP BY S.Pseudonym")
+    args = ['-t', 'regression', '-f', db_file, '-sq', query,
+            '--categorical', 'Geschlecht', '--ignore', 'Pseudonym',
+            '--cache_dir', str(tmp_path / "cache"), '--incremental', 'True']
+    pipeline = Pipeline(RappConfigParser().parse_args(args))
+
+    X, y, _ = pipeline.get_data('train')
+    assert 'Pseudonym' not in X.columns
+    assert len(X) + len(pipeline.get_data('test')[0]) == 20
+
+
+def test_incremental_cache_refreshes_template_results(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '4term_cp',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch']
+    cached = args + ['--cache_dir', str(tmp_path / "cache"),
+                     '--incremental', 'True']
+    Pipeline(RappConfigParser().parse_args(cached))
+
+    conn = sqlite3.connect(db_file)
+    for pseudonym in range(21, 26):
+        testutil.insert_into_Student(conn, pseudonym)
+        testutil.insert_into_Einschreibung(conn, pseudonym)
+        testutil.insert_into_Student_schreibt_Pruefung(
+            conn, pseudonym, 1, 100, "bestanden", 2.0, 5, 1)
+    conn.commit()
+    conn.close()
+    pipeline = Pipeline(RappConfigParser().parse_args(cached))
+
+    X, _, _ = pipeline.get_data('train')
+    assert 'Pseudonym' not in X.columns
+    expected = Pipeline(RappConfigParser().parse_args(args))
+    for mode in ['train', 'test']:
+        for actual, wanted in zip(pipeline.get_data(mode),
+                                  expected.get_data(mode)):
+            pd.testing.assert_frame_equal(actual, wanted)
+
+
+def test_load_data_from_feature_store(tmp_path, caplog):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    store_dir = tmp_path / "features"
+    for labels_id in ['3_dropout', '4term_cp']:
+        args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+                '-fid', 'first_term_grades', '-lid', labels_id,
+                '--sensitive_attributes', 'Geschlecht',
+                '--categorical', 'Geschlecht', 'Deutsch']
+        expected = Pipeline(RappConfigParser().parse_args(args))
+        store_args = args + ['--feature_store', str(store_dir)]
+
+        for _ in range(2):
+            pipeline = Pipeline(RappConfigParser().parse_args(store_args))
+            for mode in ['train', 'test']:
+                for actual, wanted in zip(pipeline.get_data(mode),
+                                          expected.get_data(mode)):
+                    pd.testing.assert_frame_equal(actual, wanted)
+    assert (store_dir / 'cs_first_term_grades').exists()
+
+    conn = sqlite3.connect(db_file)
+    # The dropout label removes the second enrolment of student 2 from the
+    # rows of the features, so it is queried as usual.
+    testutil.insert_into_Einschreibung(conn, 2, studienfach="Informatik")
+    conn.execute("UPDATE Einschreibung SET Immatrikulationsdatum = "
+                 "'2005-10-01' WHERE ID = (SELECT max(ID) FROM Einschreibung)")
+    conn.commit()
+    conn.close()
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch']
+    expected = Pipeline(RappConfigParser().parse_args(args))
+    with caplog.at_level(logging.INFO, logger='rapp.pipeline'):
+        pipeline = Pipeline(RappConfigParser().parse_args(
+            args + ['--feature_store', str(store_dir)]))
+
+    assert 'not using the feature store' in caplog.text
+    for mode in ['train', 'test']:
+        for actual, wanted in zip(pipeline.get_data(mode),
+                                  expected.get_data(mode)):
+            pd.testing.assert_frame_equal(actual, wanted)
+
+
+def test_load_data_from_several_databases(tmp_path):
+    db_files = [testutil.create_sample_db_file(tmp_path / f"rapp_{year}.db")
+                for year in [2019, 2020]]
+    args = ['-t', 'classification', '-f', db_files[0], '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht', '--databases', db_files[1],
+            '--categorical', 'Geschlecht', 'Deutsch', 'Datenbank']
+    pipeline = Pipeline(RappConfigParser().parse_args(args))
+
+    X, y, _ = pipeline.get_data('train')
+    assert len(X) + len(pipeline.get_data('test')[0]) == 40
+    assert {'Datenbank_rapp_2019', 'Datenbank_rapp_2020'} <= set(X.columns)
+    assert list(y.columns) == ['Dropout']
+
+
+def test_database_column_can_be_ignored(tmp_path):
+    db_files = [testutil.create_sample_db_file(tmp_path / f"rapp_{year}.db")
+                for year in [2019, 2020]]
+    query = ("SELECT Geschlecht, Note "
+             "FROM Student_schreibt_Pruefung as SSP "
+             "JOIN Student as S ON S.Pseudonym = SSP.Pseudonym")
+    args = ['-t', 'regression', '-f', db_files[0], '-sq', query,
+            '--databases', db_files[1], '--categorical', 'Geschlecht',
+            '--ignore', 'Datenbank', '--estimators', 'DT']
+    pipeline = Pipeline(RappConfigParser().parse_args(args))
+
+    X, _, _ = pipeline.get_data('train')
+    assert len(X) + len(pipeline.get_data('test')[0]) == 40
+    assert not any(c.startswith('Datenbank') for c in X.columns)
+    train_models(pipeline)
+
+
+def test_load_data_from_columnar_file(tmp_path):
+    df = pd.DataFrame({'Pseudonym': range(10),
+                       'Geschlecht': ['m', 'w'] * 5,
+                       'Note': [1.0 + i / 10 for i in range(10)]})
+    data_file = tmp_path / "features.parquet"
+    data.write_columnar(df, data_file)
+    args = ['-t', 'regression', '-df', str(data_file),
+            '--ignore', 'Pseudonym', '--categorical', 'Geschlecht']
+    pipeline = Pipeline(RappConfigParser().parse_args(args))
+
+    X, y, z = pipeline.get_data('train')
+    assert 'Pseudonym' not in X.columns
+    assert list(y.columns) == ['Note']
+    assert len(X) + len(pipeline.get_data('test')[0]) == 10
+
+
 def test_load_correct_sql_query_from_file():
     sql_file = rc.get_path('sql/short.sql')
     args = ['-t', 'classification', '-f', rc.get_path('test.db'),
@@ -367,6 +801,110 @@ def test_preprocess_data_with_label():
     pd.testing.assert_frame_equal(actual, expected)
 
 
+def test_preprocess_data_sparse():
+    X = pd.DataFrame({'Note': [1.0, 2.3, 1.7],
+                      'Geschlecht': ['m', 'w', 'w'],
+                      'Fach': ['Informatik', 'Mathematik', 'Physik']})
+    dense = preprocess_data(X, ['Geschlecht', 'Fach'])
+
+    sparse = preprocess_data(X, ['Geschlecht', 'Fach'], sparse=True)
+
+    assert list(sparse.columns) == list(dense.columns)
+    matrix = design_matrix(sparse, DecisionTreeClassifier())
+    assert matrix.format == 'csr'
+    np.testing.assert_array_equal(matrix.toarray(),
+                                  dense.to_numpy(np.float32))
+    # Estimators without sparse support get the dense columns.
+    np.testing.assert_array_equal(design_matrix(sparse, GaussianNB()),
+                                  dense.to_numpy(float))
+
+
+def test_design_matrix_dtype():
+    X = pd.DataFrame({'Note': [1.0, 2.3, 1.7], 'Fach_Physik': [1, 0, 1]})
+
+    tree = design_matrix(X, DecisionTreeClassifier())
+    nb = design_matrix(X, GaussianNB())
+
+    assert tree.dtype == np.float32 and tree.flags.c_contiguous
+    assert nb.dtype == np.float64 and nb.flags.c_contiguous
+    np.testing.assert_array_equal(nb, X.to_numpy(float))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_preprocessor_keeps_training_layout(sparse):
+    X = pd.DataFrame({'Note': [1.0, 2.3, 1.7],
+                      'Geschlecht': ['m', 'w', 'w'],
+                      'Fach': ['Informatik', 'Mathematik', 'Physik']})
+    preprocessor = Preprocessor(['Geschlecht', 'Fach'], sparse=sparse)
+
+    X_train = preprocessor.fit_transform(X)
+
+    pd.testing.assert_frame_equal(
+        X_train, preprocess_data(X, ['Geschlecht', 'Fach'], sparse=sparse))
+    new = pd.DataFrame({'Fach': ['Physik', 'Chemie'],
+                        'Geschlecht': ['w', 'w'],
+                        'Note': [1.3, 4.0],
+                        'Dropout': [0, 1]})
+    X_new = preprocessor.transform(new)
+    assert list(X_new.columns) == list(X_train.columns)
+    assert X_new.loc[0, 'Fach_Physik'] and not X_new.loc[1, 'Fach_Physik']
+    assert not X_new.loc[:, 'Geschlecht_m'].any()
+    # Unknown categories are encoded as all zeros.
+    assert not X_new.loc[1, ['Fach_Informatik', 'Fach_Mathematik']].any()
+
+
+def test_pipeline_preprocessor_prepares_new_data():
+    df = pd.DataFrame({'a': range(20),
+                       'b': [f'c{n % 3}' for n in range(20)],
+                       'y': [n % 2 for n in range(20)]})
+    cf = SimpleNamespace(label_name='y', categorical=['b'],
+                         sensitive_attributes=[], type='classification',
+                         estimators=['DT'], sql_df=df,
+                         filename=None)
+    pipeline = Pipeline(cf)
+
+    X, _, _ = pipeline.get_data('test')
+    pd.testing.assert_frame_equal(
+        pipeline.preprocessor.transform(df.loc[X.index]), X)
+
+
+def test_training_on_sparse_data(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    args = ['-t', 'classification', '-f', db_file, '-sid', 'cs',
+            '-fid', 'first_term_grades', '-lid', '3_dropout',
+            '--sensitive_attributes', 'Geschlecht',
+            '--categorical', 'Geschlecht', 'Deutsch',
+            '--estimators', 'DT', 'NB']
+    dense = Pipeline(RappConfigParser().parse_args(args))
+    sparse = Pipeline(RappConfigParser().parse_args(args + ['--sparse', 'True']))
+
+    for pipeline in [dense, sparse]:
+        train_models(pipeline)
+
+    X_dense, X_sparse = dense.get_data('test')[0], sparse.get_data('test')[0]
+    for est_dense, est_sparse in zip(dense.estimators, sparse.estimators):
+        np.testing.assert_array_equal(
+            est_dense.predict(design_matrix(X_dense, est_dense)),
+            est_sparse.predict(design_matrix(X_sparse, est_sparse)))
+
+
+def test_split_data_builds_design_matrix_once():
+    df, cf = _split_config('random')
+    data = _load_test_split_from_dataframe(df, cf, random_state=42)
+
+    X_train = data.design_matrix(DecisionTreeClassifier(), 'train')
+    X_test = data.design_matrix(DecisionTreeClassifier(), 'test')
+
+    assert X_train is data.design_matrix(DecisionTreeClassifier(), 'train')
+    assert X_train.dtype == np.float32 and X_train.flags.c_contiguous
+    assert X_train.base is X_test.base
+    assert data.design_matrix(GaussianNB(), 'train').dtype == np.float64
+    np.testing.assert_array_equal(X_test, data['test']['X'].to_numpy(float))
+    y_test = data.labels('test')
+    assert y_test.ndim == 1
+    np.testing.assert_array_equal(y_test, data['test']['y']['y'])
+
+
 def test_training_with_cross_validation():
     est = DummyClassifier()
 
@@ -764,3 +1302,130 @@ def test_calculate_regression_set_statistics_with_pipeline():
         np.testing.assert_equal(expected, pipeline.statistics_results)
     except AssertionError:
         pytest.fail(f"Items are not equal Expected: {expected} ,Got: {pipeline.statistics_results}")
+
+
+def _pipeline_with_splits(labels):
+    rng = np.random.default_rng(seed=123)
+    pipeline = SimpleNamespace(statistics_results={})
+    pipeline.data = {}
+    for mode, n in [('train', 30), ('test', 10)]:
+        pipeline.data[mode] = {
+            'X': rng.random((n, 2)),
+            'y': pd.DataFrame({'label': labels(rng, n)}),
+            'z': pd.DataFrame({'protected': rng.integers(2, size=(n,)),
+                               'sex': rng.choice(['m', 'w'], size=(n,))})}
+    pipeline.get_data = lambda mode: (pipeline.data[mode]['X'],
+                                      pipeline.data[mode]['y'],
+                                      pipeline.data[mode]['z'])
+    return pipeline
+
+
+def test_calculate_classification_statistics_sql_and_columnar(tmp_path):
+    pipeline = _pipeline_with_splits(lambda rng, n: rng.integers(2, size=n))
+    pipeline.type = 'classification'
+    calculate_statistics(pipeline)
+    df = split_frame(pipeline)
+    connection = sqlite3.connect(":memory:")
+    df.to_sql('splits', connection)
+    data.write_columnar(df, tmp_path / "splits.feather")
+
+    attributes = ['protected', 'sex']
+    from_sql = calculate_statistics_sql(connection, 'splits', 'label',
+                                        attributes, 'classification')
+    from_file = calculate_statistics_columnar(
+        tmp_path / "splits.feather", 'label', attributes, 'classification')
+
+    assert from_sql == pipeline.statistics_results
+    assert from_file == pipeline.statistics_results
+
+
+@pytest.mark.parametrize("suffix", ['.db', '.feather'])
+def test_calculate_statistics_from_statistics_file(tmp_path, suffix):
+    pipeline = _pipeline_with_splits(lambda rng, n: rng.integers(2, size=n))
+    pipeline.type = 'classification'
+    expected = calculate_statistics(pipeline).statistics_results
+    statistics_file = str(tmp_path / f"statistics{suffix}")
+    pipeline.config = SimpleNamespace(statistics_file=statistics_file)
+    pipeline.statistics_results = {}
+
+    calculate_statistics(pipeline)
+
+    assert (tmp_path / f"statistics{suffix}").exists()
+    assert pipeline.statistics_results == expected
+
+
+def test_calculate_regression_statistics_sql_and_columnar(tmp_path):
+    pipeline = _pipeline_with_splits(lambda rng, n: rng.random(n))
+    df = split_frame(pipeline)
+    connection = sqlite3.connect(":memory:")
+    df.to_sql('splits', connection)
+    data.write_columnar(df, tmp_path / "splits.feather")
+
+    from_sql = calculate_statistics_sql(
+        connection, "SELECT * FROM splits WHERE sex = :sex", 'label',
+        ['protected'], 'regression', params={'sex': 'm'})
+    from_file = calculate_statistics_columnar(
+        tmp_path / "splits.feather", 'label', ['protected'], 'regression')
+
+    outcomes = df[(df['split'] == 'train') & (df['sex'] == 'm')]['label']
+    train = from_sql['train']
+    assert train['total'] == len(outcomes)
+    assert train['summary']['mean'] == pytest.approx(outcomes.mean())
+    assert train['summary']['std'] == pytest.approx(outcomes.std())
+    assert train['summary']['max'] == outcomes.max()
+    group = outcomes[df['protected'] == 1]
+    assert train['groups']['protected'][1]['total'] == len(group)
+    assert from_file['test']['total'] == 10
+
+
+def test_calculate_regression_statistics_std_of_large_outcomes(tmp_path):
+    # Adding up the squares of large outcomes loses their variance.
+    pipeline = _pipeline_with_splits(lambda rng, n: 1e8 + rng.random(n))
+    df = split_frame(pipeline)
+    connection = sqlite3.connect(":memory:")
+    df.to_sql('splits', connection)
+    data.write_columnar(df, tmp_path / "splits.feather")
+
+    from_sql = calculate_statistics_sql(connection, 'splits', 'label',
+                                        ['sex'], 'regression')
+    from_file = calculate_statistics_columnar(
+        tmp_path / "splits.feather", 'label', ['sex'], 'regression')
+
+    for stats in [from_sql, from_file]:
+        for split in ['train', 'test']:
+            outcomes = df[df['split'] == split]['label']
+            assert stats[split]['summary']['std'] == \
+                pytest.approx(outcomes.std(), rel=1e-6)
+            women = outcomes[df['sex'] == 'w']
+            assert stats[split]['groups']['sex']['w']['summary']['std'] == \
+                pytest.approx(women.std(), rel=1e-6)
+
+
+def _flatten(stats, path=()):
+    if not isinstance(stats, dict):
+        return {path: stats}
+    return {key: value for item, nested in stats.items()
+            for key, value in _flatten(nested, path + (item,)).items()}
+
+
+@pytest.mark.parametrize("pl_type", ['classification', 'regression'])
+def test_calculate_statistics_sql_and_columnar_keep_missing_values(tmp_path, pl_type):
+    labels = (lambda rng, n: rng.integers(2, size=n)) \
+        if pl_type == 'classification' else (lambda rng, n: rng.random(n))
+    df = split_frame(_pipeline_with_splits(labels))
+    df['sex'] = df['sex'].where(df.index % 4 != 0, None)
+    connection = sqlite3.connect(":memory:")
+    df.to_sql('splits', connection)
+    data.write_columnar(df, tmp_path / "splits.feather")
+
+    from_sql = calculate_statistics_sql(connection, 'splits', 'label',
+                                        ['sex'], pl_type)
+    from_file = calculate_statistics_columnar(
+        tmp_path / "splits.feather", 'label', ['sex'], pl_type)
+
+    assert _flatten(from_sql) == pytest.approx(_flatten(from_file))
+    for split, stats in from_sql.items():
+        groups = stats['groups']['sex']
+        missing = df[(df['split'] == split) & df['sex'].isna()]
+        assert groups[None]['total'] == len(missing) > 0
+        assert sum(group['total'] for group in groups.values()) == stats['total']
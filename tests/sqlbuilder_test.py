@@ -1,7 +1,14 @@
+import os
+import shutil
+import sqlite3
+
 import pytest
 from pandas import read_sql_query
+from pandas.testing import assert_frame_equal
 
+from rapp import data
 from rapp import sqlbuilder
+from rapp.pipeline import _slice_label
 from rapp.sqlbuilder import load_sql, list_available_features, list_available_labels
 
 from tests import resources as rc
@@ -9,6 +16,10 @@ from tests import testutil
 
 
 DIR=rc.get_path("sql/templatesous")
+# The shipped templates, which bind parameters unlike the test resources.
+PRODUCTION_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'sqltemplates')
 
 @pytest.fixture(autouse=True)
 def set_default_template_path():
@@ -545,6 +556,7 @@ def test_listing_available_features():
                 'cs_first_term_grades',
                 'cs_first_term_grades_and_ectp',
                 'cs_first_term_modules',
+                'cs_first_term_modules_aggregated',
                 'sw_first_term_ects',
                 'sw_first_term_grades',
                 'sw_first_term_grades_and_ectp',
@@ -569,3 +581,378 @@ def test_listing_available_labels():
     actual = list_available_labels()
 
     assert expected == actual
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    template_dir = tmp_path / "templates"
+    shutil.copytree(rc.get_path('sql/templates'), template_dir)
+    sqlbuilder.clear_template_cache()
+    yield str(template_dir)
+    sqlbuilder.clear_template_cache()
+
+
+def test_load_sql_with_key(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    params = sqlbuilder.load_parameters("cs_first_term_grades", "3_dropout")
+
+    with sqlite3.connect(db_file) as conn:
+        plain = data.query_sql(load_sql("cs_first_term_grades", "3_dropout"),
+                               conn, params)
+        keyed = data.query_sql(load_sql("cs_first_term_grades", "3_dropout",
+                                        key=True), conn, params)
+
+    assert keyed.columns[0] == "Pseudonym"
+    assert keyed["Pseudonym"].tolist() == list(range(1, 21))
+    assert_frame_equal(keyed.drop(columns="Pseudonym"), plain)
+
+
+def test_load_sql_is_cached(template_dir, monkeypatch):
+    expected = load_sql("cs_first_term_grades", "3_dropout", template_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("template files were read again")
+    monkeypatch.setattr(sqlbuilder, "open", fail, raising=False)
+
+    assert load_sql("cs_first_term_grades", "3_dropout",
+                    template_dir) == expected
+
+
+def test_load_sql_cache_invalidated_by_changed_template(template_dir):
+    load_sql("cs_first_term_grades", "3_dropout", template_dir)
+    where = os.path.join(template_dir, "labels", "3_dropout", "where.sql")
+    with open(where, "w") as f:
+        f.write("AND 1 = 1")
+    stat = os.stat(where)
+    os.utime(where, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert "AND 1 = 1" in load_sql("cs_first_term_grades", "3_dropout",
+                                   template_dir)
+
+
+def test_load_sql_cache_respects_database_override(template_dir):
+    default = load_sql("cs_first_term_grades", "3_dropout", template_dir)
+    override = os.path.join(template_dir, "otherdb", "labels", "3_dropout")
+    shutil.copytree(os.path.join(template_dir, "labels", "3_dropout"),
+                    override)
+    with open(os.path.join(override, "where.sql"), "w") as f:
+        f.write("AND 2 = 2")
+
+    sqlbuilder.set_database_name("otherdb")
+    try:
+        assert "AND 2 = 2" in load_sql("cs_first_term_grades", "3_dropout",
+                                       template_dir)
+    finally:
+        sqlbuilder.reset_database_name()
+    assert load_sql("cs_first_term_grades", "3_dropout",
+                    template_dir) == default
+
+
+def test_load_parameters_with_defaults(template_dir):
+    label_dir = os.path.join(template_dir, "labels", "3_dropout")
+    with open(os.path.join(label_dir, "parameters.json"), "w") as f:
+        f.write('{"cutoff": 20192}')
+
+    parameters = sqlbuilder.load_parameters(
+        "cs_first_term_grades", "3_dropout", template_dir)
+    assert parameters == {"cutoff": 20192}
+    assert sqlbuilder.load_parameters(
+        "cs_first_term_grades", "4term_ap", template_dir) == {}
+
+
+def test_load_parameters_rejects_conflicting_defaults(template_dir):
+    for label in ["3_dropout", "4term_ap"]:
+        path = os.path.join(template_dir, "labels", label, "parameters.json")
+        with open(path, "w") as f:
+            f.write(f'{{"cutoff": "{label}"}}')
+
+    with pytest.raises(ValueError):
+        sqlbuilder.load_parameters("cs_first_term_grades",
+                                   ["3_dropout", "4term_ap"], template_dir)
+
+
+def test_inline_parameters():
+    sql = "SELECT ':a', :a, a::int FROM t -- :a\nWHERE b < :b AND c = :c"
+    params = {"a": "it's", "b": 3}
+
+    assert sqlbuilder.inline_parameters(sql, params) == (
+        "SELECT ':a', 'it''s', a::int FROM t -- :a\nWHERE b < 3 AND c = :c")
+
+
+def test_template_catalog_metadata(template_dir):
+    catalog = sqlbuilder.TemplateCatalog(template_dir)
+
+    info = catalog.get('labels', '3_dropout')
+    assert info.components == ('select', 'join', 'where')
+    assert info.columns == ['Dropout']
+    assert info.source is None
+    assert catalog.get('labels', 'missing') is None
+
+
+def test_template_catalog_rescans_only_changed_directories(template_dir,
+                                                           monkeypatch):
+    catalog = sqlbuilder.TemplateCatalog(template_dir)
+    labels = catalog.list('labels')
+
+    def fail(*args, **kwargs):
+        raise AssertionError("directory was scanned again")
+    monkeypatch.setattr(sqlbuilder.os, "scandir", fail)
+    assert catalog.list('labels') == labels
+
+    monkeypatch.undo()
+    new_label = os.path.join(template_dir, "labels", "new_label")
+    os.mkdir(new_label)
+    with open(os.path.join(new_label, "select.sql"), "w") as f:
+        f.write("Foo.Bar as Baz")
+    dir_stat = os.stat(os.path.dirname(new_label))
+    os.utime(os.path.dirname(new_label),
+             ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns + 10**9))
+
+    assert catalog.list('labels') == sorted(labels + ['new_label'])
+    assert catalog.get('labels', 'new_label').columns == ['Baz']
+
+
+def test_template_catalog_notices_edited_files(template_dir):
+    catalog = sqlbuilder.TemplateCatalog(template_dir)
+    assert catalog.get('labels', '3_dropout').columns == ['Dropout']
+
+    # Editing a file in place changes neither directory's mtime.
+    label_dir = os.path.join(template_dir, "labels", "3_dropout")
+    dir_stats = [os.stat(d) for d in (label_dir, os.path.dirname(label_dir))]
+    select = os.path.join(label_dir, "select.sql")
+    file_stat = os.stat(select)
+    with open(select, "w") as f:
+        f.write("Dropout.Dropout as Abbruch")
+    os.utime(select, ns=(file_stat.st_atime_ns,
+                         file_stat.st_mtime_ns + 10**9))
+    for d, st in zip((label_dir, os.path.dirname(label_dir)), dir_stats):
+        os.utime(d, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert catalog.get('labels', '3_dropout').columns == ['Abbruch']
+
+
+def test_template_catalog_prefers_database_override(template_dir):
+    override = os.path.join(template_dir, "otherdb", "labels", "3_dropout")
+    shutil.copytree(os.path.join(template_dir, "labels", "3_dropout"),
+                    override)
+    catalog = sqlbuilder.TemplateCatalog(template_dir)
+
+    info = catalog.get('labels', '3_dropout', db_name="otherdb")
+    assert info.source == "otherdb" and info.path == override
+    assert catalog.list('labels', "otherdb") == catalog.list('labels')
+
+
+def test_select_columns():
+    select = """
+    -- protected attributes
+    S.Geschlecht,
+    strftime("%Y", E.Datum) - S.Geburtsjahr as Alter,
+    CASE WHEN X IS NULL
+         then 5 else X end AS "Note, gemittelt",
+    count(*)
+    """
+    assert sqlbuilder.select_columns(select) == [
+        'Geschlecht', 'Alter', 'Note, gemittelt', 'count(*)']
+
+
+def test_combined_labels_match_single_queries(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    conn = sqlite3.connect(db_file)
+    # Let some students graduate so that the label masks differ.
+    conn.execute("UPDATE Einschreibung SET Bestanden = 1 "
+                 "WHERE Pseudonym % 4 = 0")
+    conn.commit()
+    features_id = "cs_first_term_grades"
+    labels_ids = list_available_labels()
+
+    sql, labels = sqlbuilder.load_combined_sql(features_id, labels_ids)
+    params = sqlbuilder.load_parameters(features_id, labels_ids)
+    combined = read_sql_query(sql, conn, params=params)
+
+    assert labels['4term_ap'].mask is None
+    assert labels['4term_cp'].names == ['FourthTermCP']
+    assert labels['reg_study_duration'].names == ['StudyDuration']
+    assert labels['reg_study_duration'].columns != \
+        labels['study_duration'].columns
+    for labels_id in labels_ids:
+        if labels[labels_id].mask is not None:
+            assert combined[labels[labels_id].mask].notna().all()
+        expected = read_sql_query(
+            load_sql(features_id, labels_id), conn,
+            params=sqlbuilder.load_parameters(features_id, labels_id))
+        actual = _slice_label(combined, labels, labels_id)
+        assert len(expected) > 0
+        assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_combined_mask_flags_students_with_changed_feature_rows(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    conn = sqlite3.connect(db_file)
+    # Student 2 has a second enrolment before the period of the features.
+    # The dropout label joins both enrolments to each of their exam rows.
+    testutil.insert_into_Einschreibung(conn, 2, studienfach="Informatik")
+    conn.execute("UPDATE Einschreibung SET Immatrikulationsdatum = "
+                 "'2005-10-01' WHERE ID = (SELECT max(ID) FROM Einschreibung)")
+    conn.commit()
+    features_id = "cs_first_term_grades"
+
+    sql, labels = sqlbuilder.load_combined_sql(features_id, ["3_dropout"])
+    params = sqlbuilder.load_parameters(features_id, ["3_dropout"])
+    combined = read_sql_query(sql, conn, params=params)
+
+    mask = combined[labels["3_dropout"].mask]
+    assert mask.isna().tolist() == [n == 2 for n in range(1, 21)]
+
+
+def test_project_columns():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE t (a INTEGER, "b c" TEXT, d REAL)')
+    conn.execute("INSERT INTO t VALUES (1, 'x', 2.5)")
+    sql = sqlbuilder.project_columns("SELECT * FROM t -- all\n;",
+                                     ["d", "b c"])
+
+    cur = conn.execute(sql)
+    assert [c[0] for c in cur.description] == ["d", "b c"]
+    assert cur.fetchall() == [(2.5, 'x')]
+
+
+@pytest.mark.parametrize("features_id,labels_id", [
+    (features_id, labels_id)
+    for features_id in list_available_features(template_dir=PRODUCTION_DIR)
+    for labels_id in list_available_labels(template_dir=PRODUCTION_DIR)])
+def test_production_templates_run_with_their_parameters(tmp_path, features_id,
+                                                        labels_id):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    sql = load_sql(features_id, labels_id, template_dir=PRODUCTION_DIR)
+    params = sqlbuilder.load_parameters(features_id, labels_id,
+                                        template_dir=PRODUCTION_DIR)
+    columns = sqlbuilder.template_catalog(PRODUCTION_DIR).get(
+        'labels', labels_id).columns
+
+    with data.pooled_connection(db_file) as conn:
+        df = data.query_sql(sql, conn, params)
+
+    assert list(df.columns)[-len(columns):] == columns
+
+
+def test_analyse_query_plan_flags_scans_and_temp_btrees():
+    db = testutil.get_empty_memory_db_connection()
+    sql = load_sql("cs_first_term_modules", "3_dropout")
+
+    plan = sqlbuilder.explain_query_plan(sql, db)
+    analysis = sqlbuilder.analyse_query_plan(plan, sql)
+
+    assert "Student_schreibt_Pruefung" in analysis['full_scans']
+    assert len(analysis['temp_btrees']) > 0
+
+
+def test_index_candidates_follow_query_plan():
+    db = sqlite3.connect(":memory:")
+    db.executescript("""
+        CREATE TABLE Student (Pseudonym INTEGER PRIMARY KEY, Geschlecht TEXT);
+        CREATE TABLE Pruefung (Pseudonym INTEGER, Nummer INTEGER,
+                               Note REAL, Semester INTEGER, Kommentar TEXT);
+    """)
+    sql = """
+        SELECT P.Pseudonym, max(P.Note) AS Note
+        FROM Pruefung AS P
+        WHERE P.Nummer = 1 AND P.Semester <= 2
+        GROUP BY P.Pseudonym
+    """
+
+    candidates = sqlbuilder.index_candidates(sql, db)
+
+    # The scan is keyed by the equality filter, the grouping by its column;
+    # range filters and selected columns are only covered.
+    assert candidates == {'Pruefung': {
+        ('Nummer',): {'Pseudonym', 'Note', 'Semester'},
+        ('Pseudonym',): {'Nummer', 'Note', 'Semester'},
+    }}
+
+
+def test_index_candidates_take_automatic_index_columns():
+    db = sqlite3.connect(":memory:")
+    db.executescript("""
+        CREATE TABLE Student (Pseudonym INTEGER, Geschlecht TEXT);
+        CREATE TABLE Einschreibung (Pseudonym INTEGER, Studienfach TEXT,
+                                    Abschluss TEXT);
+    """)
+    sql = """
+        SELECT S.Geschlecht, E.Abschluss
+        FROM Student AS S JOIN Einschreibung AS E
+        ON E.Pseudonym = S.Pseudonym AND E.Studienfach = 'Informatik'
+    """
+    plan = sqlbuilder.explain_query_plan(sql, db)
+    assert any('AUTOMATIC' in detail for detail in plan)
+
+    candidates = sqlbuilder.index_candidates(sql, db, plan)
+
+    automatic = [key for key in candidates.get('Einschreibung', {})
+                 if 'Pseudonym' in key]
+    assert automatic
+
+
+def test_advise_indexes_works_on_copy(tmp_path):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+    copy_file = str(tmp_path / "indexed.db")
+
+    report = sqlbuilder.advise_indexes(db_file, copy_file, repeat=1)
+
+    def index_names(path):
+        conn = sqlite3.connect(path)
+        cur = conn.execute("SELECT name FROM sqlite_master "
+                           "WHERE type='index' AND sql IS NOT NULL")
+        names = {name for (name,) in cur.fetchall()}
+        conn.close()
+        return names
+
+    created = index_names(copy_file)
+    assert any(name.startswith("idx_Student_schreibt_Pruefung_")
+               for name in created)
+    assert not index_names(db_file)
+    assert len(report['indexes']) == len(created)
+    assert ("cs_first_term_modules", "3_dropout") in report['templates']
+    result = report['templates'][("cs_first_term_modules", "3_dropout")]
+    assert ("Student_schreibt_Pruefung"
+            not in result['after']['full_scans'])
+
+
+def test_advise_indexes_command_line(tmp_path, capsys):
+    db_file = testutil.create_sample_db_file(tmp_path / "rapp.db")
+
+    report = sqlbuilder.main([db_file, str(tmp_path / "indexed.db"),
+                              '--repeat', '1'])
+
+    out = capsys.readouterr().out
+    assert report['indexes']
+    assert all(f'{stmt};' in out for stmt in report['indexes'])
+    assert "cs_first_term_modules_3_dropout: " in out
+
+
+def test_aggregated_first_term_modules_match_original(tmp_path):
+    prog = "Programmierung\u00a0 "  # Spelling as used in the templates.
+    db = testutil.TestDb(empty=True)
+    db.add_modules(("Lineare Algebra", 1, 1),
+                   (prog, 1, 2),
+                   ("Analysis I", 1, 3))
+    for pseudonym in range(1, 7):
+        db.add_ifo_student(pseudonym)
+        db.add_exam(pseudonym, "Lineare Algebra", attempt=1, semester=1,
+                    passed=pseudonym % 2 == 0)
+        db.add_exam(pseudonym, prog, attempt=1, semester=1,
+                    grade=5.0)
+        db.add_exam(pseudonym, prog, attempt=2, semester=1,
+                    passed=pseudonym % 3 == 0, grade=1.0 + pseudonym / 10)
+        if pseudonym > 2:
+            db.add_exam(pseudonym, "Analysis I", attempt=1, semester=1,
+                        passed=True, grade=2.0)
+    db_file = testutil.save_db_file(db.db, str(tmp_path / "rapp.db"))
+
+    conn = sqlite3.connect(db_file)
+    expected = read_sql_query(load_sql("cs_first_term_modules", "4term_ap"),
+                              conn)
+    actual = data.query_sql(
+        load_sql("cs_first_term_modules_aggregated", "4term_ap"), conn)
+
+    assert len(expected) == 6
+    assert actual.equals(expected)
@@ -45,6 +45,18 @@ def get_db_connection():
     return mem_db
 
 
+def save_db_file(connection, path):
+    """
+    Write the contents of the given (memory) database connection
+    into a database file at `path` and return the path.
+    """
+    file_db = sqlite3.connect(path)
+    connection.commit()
+    connection.backup(file_db)
+    file_db.close()
+    return path
+
+
 def __execute_sql(connection, sql, *args):
     cur = connection.cursor()
     cur.execute(sql, args)
@@ -332,3 +344,23 @@ class TestDb():
 
     def read_sql_query(self, sql_query):
         return pd.read_sql_query(sql_query, self.db)
+
+
+def create_sample_db_file(path, n_students=20):
+    """
+    Create a small database file at `path` with `n_students` computer
+    science students who each wrote the "Analysis I" exam in their first term.
+    Every even pseudonym passed the exam and every third student is female.
+
+    Returns the path to the created file.
+    """
+    db = TestDb(empty=True)
+    db.add_module("Analysis I", 1, 100)
+    for pseudonym in range(1, n_students + 1):
+        db.add_ifo_student(pseudonym,
+                           geschlecht="weiblich" if pseudonym % 3 == 0 else "männlich")
+        db.add_exam(pseudonym, "Analysis I", attempt=1, semester=1,
+                    passed=pseudonym % 2 == 0, ects=5 * (pseudonym % 2 == 0),
+                    grade=1.0 + pseudonym / 10)
+    return save_db_file(db.db, str(path))
+